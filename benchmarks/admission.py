@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Latency of a steady agent while another agent takes a traffic spike, with
+and without per-agent admission control.
+
+Both stub agents call one simulated upstream that serves at most
+`--upstream` requests at a time (a provider's concurrency/rate limit).
+Without admission control the spike fills the upstream and the steady
+agent queues behind it; with it the spike is capped at its own limit and
+the overflow is answered with a 429 right away.
+
+    python -m benchmarks.admission --spike 200 --steady 20 --upstream 16 --limit 8
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import FunctionModel
+
+from benchmarks.stream_latency import percentile
+from pydantic_agents import server
+from pydantic_agents.admission import AdmissionController
+
+
+class UpstreamAgent:
+    """Agent wrapper whose model waits for a slot of a shared, limited upstream."""
+
+    def __init__(self, name: str, upstream: asyncio.Semaphore, latency: float):
+        async def respond(messages, info):
+            async with upstream:
+                await asyncio.sleep(latency)
+            return ModelResponse(parts=[TextPart(content="klaar")])
+
+        self.name = name
+        self.description = "Benchmark agent on a shared upstream"
+        self.agent = Agent(model=FunctionModel(respond))
+
+
+async def run(client: httpx.AsyncClient, agent: str) -> tuple:
+    start = time.perf_counter()
+    response = await client.post("/chat", json={"message": f"vraag {time.perf_counter()}", "agent": agent})
+    return response.status_code, time.perf_counter() - start
+
+
+async def scenario(args, admission_enabled: bool) -> None:
+    upstream = asyncio.Semaphore(args.upstream)
+    server.registry.register("spiky", UpstreamAgent("spiky", upstream, args.latency))
+    server.registry.register("steady", UpstreamAgent("steady", upstream, args.latency))
+    server.admission = AdmissionController(enabled=admission_enabled)
+    for name in ("spiky", "steady"):
+        server.admission.configure(name, max_concurrency=args.limit, max_queue=args.queue, queue_timeout=args.timeout)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        spike = [asyncio.create_task(run(client, "spiky")) for _ in range(args.spike)]
+        await asyncio.sleep(0.01)
+        steady = []
+        for _ in range(args.steady):
+            steady.append(asyncio.create_task(run(client, "steady")))
+            await asyncio.sleep(args.latency / 2)
+        spike_results = await asyncio.gather(*spike)
+        steady_results = await asyncio.gather(*steady)
+
+    steady_ok = [t for status, t in steady_results if status == 200]
+    spike_ok = sum(1 for status, _ in spike_results if status == 200)
+    rejected = [t for status, t in spike_results if status == 429]
+    label = "on " if admission_enabled else "off"
+    print(f"  admission {label}  steady p50 {percentile(steady_ok, 50) * 1000:6.0f} ms  "
+          f"p99 {percentile(steady_ok, 99) * 1000:6.0f} ms  ({len(steady_ok)}/{args.steady} ok)   "
+          f"spike served {spike_ok:3d}  rejected {len(rejected):3d}"
+          + (f" in {percentile(rejected, 50) * 1000:.1f} ms (p50)" if rejected else ""))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--spike", type=int, default=200, help="concurrent requests to the spiking agent")
+    parser.add_argument("--steady", type=int, default=20, help="requests to the steady agent during the spike")
+    parser.add_argument("--upstream", type=int, default=16, help="requests the upstream serves at once")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per model call")
+    parser.add_argument("--limit", type=int, default=8, help="per-agent concurrency limit")
+    parser.add_argument("--queue", type=int, default=16, help="per-agent queue size")
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-agent queue timeout")
+    args = parser.parse_args()
+
+    print(f"\nspike of {args.spike} on one agent, {args.steady} steady requests on another, "
+          f"upstream capacity {args.upstream}, {args.latency * 1000:.0f} ms per call")
+    for enabled in (False, True):
+        await scenario(args, enabled)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
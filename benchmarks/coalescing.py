@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Upstream calls and latency for bursts of identical requests, with and
+without single-flight coalescing.
+
+A burst is `--burst` concurrent requests spread over `--distinct` different
+inputs (e.g. 20 members' frontends asking for the same ritual's response).
+The Mistral model is replaced by a stub with a fixed latency that counts
+its calls; the pulse pool is disabled so every request would hit the model.
+
+    python -m benchmarks.coalescing --burst 20 --distinct 1 --latency 0.2
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.stream_latency import percentile
+from benchmarks.stubs import build_json_stub_model
+from pydantic_agents import server
+from pydantic_agents.clients.default.agents.community_member.agent import CommunityMemberAgent, community_member
+from pydantic_agents.clients.default.agents.reengagement import ReengagementAgent, reengagement_agent
+
+PAYLOADS = {
+    "pulse": {"text": "Ik merk dat ik rustiger word als ik even stilsta.", "tone": "peaceful"},
+    "nudge": {"subject": "We missen je", "message": "Hoi, we misten je deze week bij de pulse.",
+              "tone": "warm", "urgency_level": "low"},
+}
+
+
+def build_requests(endpoint: str, burst: int, distinct: int, coalesce: bool) -> list:
+    if endpoint == "pulse":
+        return [server.PulseResponseRequest(ritual_name="Zondagavond", ritual_question=f"Wat gaf je rust? ({i % distinct})",
+                                            member_name="Thomas", coalesce=coalesce) for i in range(burst)]
+    return [server.NudgeRequest(member_name=f"Lid {i % distinct}", days_inactive=7, coalesce=coalesce)
+            for i in range(burst)]
+
+
+async def run_burst(endpoint: str, requests: list) -> list:
+    handler = server.generate_pulse_response if endpoint == "pulse" else server.generate_nudge
+
+    async def timed(request):
+        start = time.perf_counter()
+        await handler(request)
+        return time.perf_counter() - start
+
+    return await asyncio.gather(*(timed(r) for r in requests))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--burst", type=int, default=20, help="concurrent requests per burst")
+    parser.add_argument("--distinct", type=int, default=1, help="different inputs within a burst")
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per model call")
+    args = parser.parse_args()
+
+    server.pulse_pool = None
+    server.registry.register("community-member", CommunityMemberAgent)
+    server.registry.register("reengagement", ReengagementAgent)
+    agents = {"pulse": community_member, "nudge": reengagement_agent}
+
+    print(f"\n{args.bursts} bursts of {args.burst} requests over {args.distinct} distinct inputs, "
+          f"{args.latency * 1000:.0f} ms per model call")
+    for endpoint in ("pulse", "nudge"):
+        for coalesce in (False, True):
+            counter = {"calls": 0}
+            latencies = []
+            with agents[endpoint].override(model=build_json_stub_model(PAYLOADS[endpoint], args.latency, counter=counter)):
+                for _ in range(args.bursts):
+                    latencies += await run_burst(endpoint, build_requests(endpoint, args.burst, args.distinct, coalesce))
+            total = args.bursts * args.burst
+            print(f"  {endpoint:5s} coalesce={'on ' if coalesce else 'off'}  model calls {counter['calls']:4d}/{total}  "
+                  f"p50 {percentile(latencies, 50) * 1000:6.0f} ms  p99 {percentile(latencies, 99) * 1000:6.0f} ms")
+    print(f"  {server.generations.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
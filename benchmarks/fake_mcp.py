@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Context7 MCP server, for benchmarks.
+
+Serves `resolve-library-id` and `get-library-docs` over streamable HTTP
+with deterministic answers. FAKE_MCP_RTT_MS delays every HTTP request to
+mimic the network round trip to a remote server; FAKE_MCP_TOOL_MS is the
+time a tool call takes on the server.
+
+    uvicorn benchmarks.fake_mcp:app --port 8765    # then MY_AGENT_MCP_URL=http://127.0.0.1:8765/mcp
+
+or in-process:
+
+    async with fake_mcp.serve(8765) as url:
+        ...
+"""
+import asyncio
+import contextlib
+import os
+
+import uvicorn
+from mcp.server.fastmcp import FastMCP
+
+RTT_MS = float(os.getenv("FAKE_MCP_RTT_MS", "0"))
+TOOL_MS = float(os.getenv("FAKE_MCP_TOOL_MS", "0"))
+
+mcp = FastMCP("fake-context7", log_level="WARNING")
+stats = {"http_requests": 0, "tool_calls": 0, "sessions": 0}
+
+
+@mcp.tool(name="resolve-library-id")
+async def resolve_library_id(libraryName: str) -> str:
+    """Resolve a package name to a Context7-compatible library ID."""
+    stats["tool_calls"] += 1
+    if TOOL_MS:
+        await asyncio.sleep(TOOL_MS / 1000)
+    return f"/{libraryName.lower()}/{libraryName.lower()}"
+
+
+@mcp.tool(name="get-library-docs")
+async def get_library_docs(context7CompatibleLibraryID: str, topic: str = "", tokens: int = 2000) -> str:
+    """Fetch documentation for a library."""
+    stats["tool_calls"] += 1
+    if TOOL_MS:
+        await asyncio.sleep(TOOL_MS / 1000)
+    line = f"Documentation for {context7CompatibleLibraryID} about {topic or 'everything'}.\n"
+    return line * max(1, tokens // 20)
+
+
+def _with_rtt(inner):
+    async def app(scope, receive, send):
+        if scope["type"] == "http":
+            stats["http_requests"] += 1
+            if scope["method"] == "POST" and not any(k == b"mcp-session-id" for k, _ in scope["headers"]):
+                stats["sessions"] += 1
+            if RTT_MS:
+                await asyncio.sleep(RTT_MS / 1000)
+        await inner(scope, receive, send)
+    return app
+
+
+app = _with_rtt(mcp.streamable_http_app())
+
+
+def reset():
+    for key in stats:
+        stats[key] = 0
+
+
+@contextlib.asynccontextmanager
+async def serve(port: int = 8765, host: str = "127.0.0.1"):
+    """Run the fake server in the current event loop; yields its MCP URL."""
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://{host}:{port}/mcp"
+    finally:
+        server.should_exit = True
+        await task
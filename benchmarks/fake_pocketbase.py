@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+In-memory stand-in for the parts of the PocketBase REST API the server uses.
+
+Run it as a local server and point POCKETBASE_URL at it:
+
+    uvicorn benchmarks.fake_pocketbase:app --port 8090
+
+or use it in-process through httpx:
+
+    AsyncPocketBase("http://pb", transport=httpx.ASGITransport(app=fake_pocketbase.app))
+
+Supports superuser password auth and token refresh, record list (simple
+`field = "value"` filters joined with &&, multi-field sort including
+@rowid), view, create, update, delete and the /api/batch endpoint
+(FAKE_PB_BATCH=0 disables it, like the PocketBase setting, and batches over
+FAKE_PB_BATCH_MAX_REQUESTS operations are rejected like batch.maxRequests).
+FAKE_PB_LATENCY_MS adds a fixed delay to every request. Timestamps have
+PocketBase's millisecond precision.
+"""
+import asyncio
+import base64
+import json
+import os
+import re
+import secrets
+import time
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Header, HTTPException, Request
+
+ADMIN_EMAIL = os.getenv("FAKE_PB_EMAIL", "admin@example.com")
+ADMIN_PASSWORD = os.getenv("FAKE_PB_PASSWORD", "password")
+TOKEN_TTL_SECONDS = int(os.getenv("FAKE_PB_TOKEN_TTL", "3600"))
+LATENCY_MS = float(os.getenv("FAKE_PB_LATENCY_MS", "0"))
+BATCH_ENABLED = os.getenv("FAKE_PB_BATCH", "1") == "1"
+BATCH_MAX_REQUESTS = int(os.getenv("FAKE_PB_BATCH_MAX_REQUESTS", "50"))
+
+app = FastAPI(title="Fake PocketBase")
+
+collections: dict = {}
+tokens: set = set()
+stats = {"requests": 0, "logins": 0, "refreshes": 0, "batches": 0}
+
+_FILTER_TERM = re.compile(r'^\s*(\w+)\s*=\s*"((?:[^"\\]|\\.)*)"\s*$')
+
+
+def reset():
+    collections.clear()
+    tokens.clear()
+    for key in stats:
+        stats[key] = 0
+
+
+def _issue_token() -> str:
+    def encode(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+    token = ".".join([
+        encode({"alg": "HS256", "typ": "JWT"}),
+        encode({"exp": int(time.time()) + TOKEN_TTL_SECONDS, "nonce": secrets.token_hex(4)}),
+        secrets.token_hex(16),
+    ])
+    tokens.add(token)
+    return token
+
+
+def _now() -> str:
+    # Millisecond precision, as PocketBase stores it, so records created together tie
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] + "Z"
+
+
+async def _handle(authorization: str | None, require_auth: bool = True):
+    stats["requests"] += 1
+    if LATENCY_MS:
+        await asyncio.sleep(LATENCY_MS / 1000)
+    if require_auth and authorization not in tokens:
+        raise HTTPException(status_code=401, detail="The request requires valid authorization token.")
+
+
+def _matches(record: dict, filter_expr: str | None) -> bool:
+    if not filter_expr:
+        return True
+    for term in filter_expr.split("&&"):
+        match = _FILTER_TERM.match(term)
+        if not match:
+            raise HTTPException(status_code=400, detail=f"Unsupported filter: {term.strip()}")
+        field, value = match.group(1), match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+        if str(record.get(field, "")) != value:
+            return False
+    return True
+
+
+def _sort_value(record: dict, field: str):
+    return record["_seq"] if field == "@rowid" else str(record.get(field, ""))
+
+
+def _sorted(records: list, sort: str | None) -> list:
+    # Ties keep insertion order, whatever the direction, unless @rowid breaks them
+    for key in reversed([k.strip() for k in (sort or "").split(",") if k.strip()]):
+        reverse = key.startswith("-")
+        field = key.lstrip("+-")
+        records = sorted(records, key=lambda r: _sort_value(r, field), reverse=reverse)
+    return records
+
+
+def _public(record: dict) -> dict:
+    return {k: v for k, v in record.items() if k != "_seq"}
+
+
+@app.exception_handler(HTTPException)
+async def _pocketbase_error(request: Request, exc: HTTPException):
+    from fastapi.responses import JSONResponse
+    return JSONResponse(status_code=exc.status_code,
+                        content={"status": exc.status_code, "message": exc.detail, "data": {}})
+
+
+@app.post("/api/collections/{collection}/auth-with-password")
+async def auth_with_password(collection: str, body: dict):
+    await _handle(None, require_auth=False)
+    if body.get("identity") != ADMIN_EMAIL or body.get("password") != ADMIN_PASSWORD:
+        raise HTTPException(status_code=400, detail="Failed to authenticate.")
+    stats["logins"] += 1
+    return {"token": _issue_token(), "record": {"id": "superuser0000001", "email": ADMIN_EMAIL}}
+
+
+@app.post("/api/collections/{collection}/auth-refresh")
+async def auth_refresh(collection: str, authorization: str | None = Header(default=None)):
+    await _handle(authorization)
+    stats["refreshes"] += 1
+    tokens.discard(authorization)
+    return {"token": _issue_token(), "record": {"id": "superuser0000001", "email": ADMIN_EMAIL}}
+
+
+@app.get("/api/collections/{collection}/records")
+async def list_records(collection: str, page: int = 1, perPage: int = 30, filter: str | None = None,
+                       sort: str | None = None, skipTotal: int = 0,
+                       authorization: str | None = Header(default=None)):
+    await _handle(authorization)
+    records = [r for r in collections.get(collection, {}).values() if _matches(r, filter)]
+    records = _sorted(records, sort)
+    start = (page - 1) * perPage
+    result = {"page": page, "perPage": perPage, "items": [_public(r) for r in records[start:start + perPage]]}
+    result["totalItems"] = -1 if skipTotal else len(records)
+    result["totalPages"] = -1 if skipTotal else (len(records) + perPage - 1) // perPage
+    return result
+
+
+@app.get("/api/collections/{collection}/records/{record_id}")
+async def view_record(collection: str, record_id: str, authorization: str | None = Header(default=None)):
+    await _handle(authorization)
+    record = collections.get(collection, {}).get(record_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="The requested resource wasn't found.")
+    return _public(record)
+
+
+def _create(collection: str, data: dict) -> dict:
+    store = collections.setdefault(collection, {})
+    record_id = data.get("id") or secrets.token_hex(8)[:15]
+    record = {**data, "id": record_id, "created": _now(), "updated": _now(), "_seq": len(store)}
+    store[record_id] = record
+    return _public(record)
+
+
+def _update(collection: str, record_id: str, data: dict) -> dict:
+    record = collections.get(collection, {}).get(record_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="The requested resource wasn't found.")
+    record.update({k: v for k, v in data.items() if k != "id"}, updated=_now())
+    return _public(record)
+
+
+@app.post("/api/collections/{collection}/records")
+async def create_record(collection: str, body: dict, authorization: str | None = Header(default=None)):
+    await _handle(authorization)
+    return _create(collection, body)
+
+
+@app.patch("/api/collections/{collection}/records/{record_id}")
+async def update_record(collection: str, record_id: str, body: dict,
+                        authorization: str | None = Header(default=None)):
+    await _handle(authorization)
+    return _update(collection, record_id, body)
+
+
+@app.delete("/api/collections/{collection}/records/{record_id}", status_code=204)
+async def delete_record(collection: str, record_id: str, authorization: str | None = Header(default=None)):
+    await _handle(authorization)
+    if collections.get(collection, {}).pop(record_id, None) is None:
+        raise HTTPException(status_code=404, detail="The requested resource wasn't found.")
+
+
+_RECORD_URL = re.compile(r"^/api/collections/(\w+)/records(?:/(\w+))?$")
+
+
+@app.post("/api/batch")
+async def batch(body: dict, authorization: str | None = Header(default=None)):
+    await _handle(authorization)
+    if not BATCH_ENABLED:
+        raise HTTPException(status_code=403, detail="Batch requests are not allowed.")
+    stats["batches"] += 1
+    if len(body.get("requests", [])) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400,
+                            detail=f"The allowed max number of batch requests is {BATCH_MAX_REQUESTS}.")
+    # Validate everything first so the batch is all-or-nothing
+    operations = []
+    for request in body.get("requests", []):
+        match = _RECORD_URL.match(request.get("url", ""))
+        method = request.get("method", "").upper()
+        if not match or method not in ("POST", "PATCH", "DELETE"):
+            raise HTTPException(status_code=400, detail="Batch transaction failed.")
+        collection, record_id = match.groups()
+        if method != "POST" and record_id not in collections.get(collection, {}):
+            raise HTTPException(status_code=400, detail="Batch transaction failed.")
+        operations.append((method, collection, record_id, request.get("body") or {}))
+
+    results = []
+    for method, collection, record_id, data in operations:
+        if method == "POST":
+            results.append({"status": 200, "body": _create(collection, data)})
+        elif method == "PATCH":
+            results.append({"status": 200, "body": _update(collection, record_id, data)})
+        else:
+            collections[collection].pop(record_id)
+            results.append({"status": 204, "body": None})
+    return results
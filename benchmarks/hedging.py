@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tail latency of a non-streaming endpoint with and without hedged model calls.
+
+The primary stub model usually answers in `--latency` but takes `--slow`
+for a `--slow-rate` fraction of calls (a heavy tail). The fallback stub
+answers in `--fallback-latency`. With hedging, a call still running at
+the p95 of recent latencies is also sent to the fallback, within a budget
+of `--budget` of the endpoint's requests. The "outage" rows make the
+primary always slow, to show the budget capping the extra calls.
+
+    python -m benchmarks.hedging --requests 400 --concurrency 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import FunctionModel
+
+from benchmarks.stream_latency import percentile
+from pydantic_agents import hedging
+from pydantic_agents.hedging import HedgedModel, Hedger, hedge_endpoint
+
+
+def stub(latency, counter: dict, name: str) -> FunctionModel:
+    async def respond(messages, info):
+        counter[name] += 1
+        await asyncio.sleep(latency())
+        return ModelResponse(parts=[TextPart(content=name)])
+    return FunctionModel(respond, model_name=name)
+
+
+async def scenario(args, hedge: bool, slow_rate: float) -> None:
+    counter = {"primary": 0, "fallback": 0}
+    primary = stub(lambda: args.slow if random.random() < slow_rate else args.latency, counter, "primary")
+    fallback = stub(lambda: args.fallback_latency, counter, "fallback")
+    hedger = Hedger(budgets={"bench": args.budget if hedge else 0})
+    agent = Agent(HedgedModel(primary, fallback, hedger))
+    hedge_endpoint.set("bench")
+
+    async def one():
+        start = time.perf_counter()
+        await agent.run("Schrijf een korte reflectie")
+        return time.perf_counter() - start
+
+    latencies = []
+    for offset in range(0, args.requests, args.concurrency):
+        latencies += await asyncio.gather(*(one() for _ in range(min(args.concurrency, args.requests - offset))))
+
+    counts = hedger.endpoint_stats["bench"]
+    extra = counter["fallback"] / args.requests
+    print(f"  {'outage ' if slow_rate >= 1 else 'tail   '} hedging {'on ' if hedge else 'off'}  "
+          f"p50 {percentile(latencies, 50) * 1000:6.0f} ms  p95 {percentile(latencies, 95) * 1000:6.0f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:6.0f} ms  extra calls {extra:5.1%}  "
+          f"fallback wins {counts['fallback_wins']:3d}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="usual primary latency (s)")
+    parser.add_argument("--slow", type=float, default=2.0, help="primary latency in the tail (s)")
+    parser.add_argument("--slow-rate", type=float, default=0.04)
+    parser.add_argument("--fallback-latency", type=float, default=0.3)
+    parser.add_argument("--budget", type=float, default=0.1, help="fraction of requests that may be hedged")
+    args = parser.parse_args()
+
+    hedging.HEDGE_MIN_SAMPLES = 20
+    hedging.HEDGE_DEFAULT_DELAY_SECONDS = args.slow
+    hedging.HEDGE_MIN_DELAY_SECONDS = 0.05
+
+    print(f"\n{args.requests} requests, {args.concurrency} at a time; primary {args.latency * 1000:.0f} ms, "
+          f"{args.slow_rate:.0%} at {args.slow * 1000:.0f} ms; fallback {args.fallback_latency * 1000:.0f} ms; "
+          f"budget {args.budget:.0%}")
+    for slow_rate in (args.slow_rate, 1.0):
+        for hedge in (False, True):
+            await scenario(args, hedge, slow_rate)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Agent runs with a tool call against a per-agent MCP server and the shared pool.
+
+Runs a stub model that calls one MCP tool per run against the local fake
+Context7 server (benchmarks/fake_mcp.py), with a simulated network round
+trip, and reports run latency and MCP traffic per run.
+
+    python -m benchmarks.mcp_pool --runs 30 --rtt-ms 40 --agents 3
+"""
+import argparse
+import asyncio
+import time
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.mcp import MCPServerStreamableHTTP
+from pydantic_ai.models.function import FunctionModel
+
+from benchmarks import fake_mcp
+from benchmarks.stream_latency import percentile
+from pydantic_agents.mcp_pool import MCPSessionPool
+
+
+async def tool_calling_model(messages, info):
+    if any(isinstance(part, ToolReturnPart) for part in messages[-1].parts):
+        return ModelResponse(parts=[TextPart(content="klaar")])
+    return ModelResponse(parts=[ToolCallPart(tool_name="resolve-library-id", args={"libraryName": "fastapi"})])
+
+
+async def run_agents(agents: list, runs: int) -> list:
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        await agents[i % len(agents)].run("Zoek de docs op")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(label: str, latencies: list, runs: int):
+    stats = dict(fake_mcp.stats)
+    print(f"  {label:<18} p50={percentile(latencies, 50) * 1000:7.1f} ms  p95={percentile(latencies, 95) * 1000:7.1f} ms  "
+          f"sessions={stats['sessions']:3d}  http requests/run={stats['http_requests'] / runs:5.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--rtt-ms", type=float, default=40, help="simulated round trip per HTTP request")
+    parser.add_argument("--agents", type=int, default=3, help="agents sharing the MCP URL")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    fake_mcp.RTT_MS = args.rtt_ms
+    async with fake_mcp.serve(args.port) as url:
+        model = FunctionModel(tool_calling_model)
+
+        fake_mcp.reset()
+        agents = [Agent(model, toolsets=[MCPServerStreamableHTTP(url)]) for _ in range(args.agents)]
+        before = await run_agents(agents, args.runs)
+        print(f"\n{args.runs} runs over {args.agents} agents, {args.rtt_ms:.0f} ms round trip to the MCP server")
+        report("per-agent server", before, args.runs)
+
+        pool = MCPSessionPool()
+        agents = [Agent(model, toolsets=[pool.server(url)]) for _ in range(args.agents)]
+        await pool.warm()
+        fake_mcp.reset()
+        after = await run_agents(agents, args.runs)
+        report("shared pool", after, args.runs)
+        stats = pool.stats()[0]
+        print(f"  pool: tool call avg {stats['tool_call_avg_ms']:.1f} ms, "
+              f"{stats['tools_cache_hits']} cached tool listings")
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Cost of the /metrics instrumentation in the request path and per scrape.
+
+Runs `--streams` /chat/stream turns against a stub agent, prints the
+resulting agent_* series, then times the metric updates one stream makes
+(request counter and histogram, TTFT, tokens/s, active streams) and a
+full /metrics render.
+
+    python -m benchmarks.metrics --streams 50 --tokens 100
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.stream_latency import measure, push_stream
+from benchmarks.stubs import StubAgent
+from pydantic_agents import server
+from pydantic_agents.metrics import (
+    active_streams,
+    metrics,
+    record_request,
+    record_stream_rate,
+    stream_ttft_seconds,
+)
+
+
+def per_stream_updates(agent: str) -> None:
+    """The metric updates /chat/stream makes for one turn."""
+    active_streams.inc(agent=agent)
+    stream_ttft_seconds.observe(0.42, agent=agent)
+    record_stream_rate(agent, 120, 3.1)
+    active_streams.dec(agent=agent)
+    record_request(agent, "chat-stream", 3.5)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.002, help="seconds between model tokens")
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    stub = StubAgent(tokens=args.tokens, interval=args.interval, first_token_delay=0.05)
+    server.registry.register(stub.name, stub)
+    server.admission.configure(stub.name, max_concurrency=args.streams)
+    await asyncio.gather(*(measure(push_stream(stub.name, "hallo")) for _ in range(args.streams)))
+
+    print(f"\n{args.streams} streamed turns of {args.tokens} tokens:")
+    for line in metrics.render().splitlines():
+        if stub.name in line and ("_count" in line or "_total" in line or "active" in line):
+            print(f"  {line}")
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        per_stream_updates("bench-hot-path")
+    per_stream = (time.perf_counter() - start) / args.iterations
+
+    start = time.perf_counter()
+    scrapes = 200
+    for _ in range(scrapes):
+        body = metrics.render()
+    per_scrape = (time.perf_counter() - start) / scrapes
+
+    print(f"\n  metric updates per stream   {per_stream * 1e6:6.2f} us")
+    print(f"  /metrics render             {per_scrape * 1e3:6.2f} ms  ({len(body.splitlines())} lines)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
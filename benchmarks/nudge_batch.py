@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Throughput of /reengagement/generate-nudges against one call per member.
+
+The Mistral model is replaced by a stub with a fixed latency, so the numbers
+show how the batch endpoint scales with its concurrency cap.
+
+    python -m benchmarks.nudge_batch --members 40 --latency 0.2 --concurrency 1 4 8 16
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.stubs import build_json_stub_model
+from pydantic_agents import batching, server
+from pydantic_agents.clients.default.agents.reengagement import ReengagementAgent, reengagement_agent
+
+NUDGE = {
+    "subject": "We missen je",
+    "message": "Hoi, we misten je deze week bij de pulse. Alles oké?",
+    "tone": "warm",
+    "urgency_level": "low",
+}
+
+
+def members(count: int) -> list:
+    return [server.NudgeRequest(member_name=f"Lid {i}", days_inactive=4 + i % 12) for i in range(count)]
+
+
+async def one_by_one(requests: list) -> float:
+    start = time.perf_counter()
+    for item in requests:
+        await server.generate_nudge(item)
+    return time.perf_counter() - start
+
+
+async def batched(requests: list, concurrency: int) -> tuple:
+    start = time.perf_counter()
+    response = await server.generate_nudges(server.NudgeBatchRequest(requests=requests, max_concurrency=concurrency))
+    first = None
+    lines = []
+    async for chunk in response.body_iterator:
+        if first is None:
+            first = time.perf_counter() - start
+        lines.append(json.loads(chunk))
+    return time.perf_counter() - start, first, lines[-1]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--members", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per model call")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    server.registry.register("reengagement", ReengagementAgent)
+    batching.NUDGE_BATCH_MAX_CONCURRENCY = server.NUDGE_BATCH_MAX_CONCURRENCY = max(args.concurrency)
+    requests = members(args.members)
+
+    with reengagement_agent.override(model=build_json_stub_model(NUDGE, args.latency)):
+        elapsed = await one_by_one(requests)
+        print(f"\n{args.members} members, {args.latency * 1000:.0f} ms per model call")
+        print(f"  one call per member     {elapsed:7.2f} s  {args.members / elapsed:7.1f} nudges/s")
+        for concurrency in args.concurrency:
+            elapsed, first, summary = await batched(requests, concurrency)
+            print(f"  batch, concurrency {concurrency:3d} {elapsed:7.2f} s  {args.members / elapsed:7.1f} nudges/s  "
+                  f"first result {first * 1000:6.0f} ms  failed={summary['failed']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Latency of /community/pulse-response with and without the pulse pool.
+
+The Mistral model is replaced by a stub with a fixed latency that answers
+with a different reflection on every call.
+
+    python -m benchmarks.pulse_pool --requests 50 --latency 0.5
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+from benchmarks.stream_latency import percentile
+from benchmarks.stubs import build_json_stub_model
+from pydantic_agents import server
+from pydantic_agents.clients.default.agents.community_member import CommunityMemberAgent
+from pydantic_agents.clients.default.agents.community_member.agent import community_member
+from pydantic_agents.pulse_pool import PulseResponsePool
+
+REQUEST = server.PulseResponseRequest(ritual_name="R van Radicale Aanvaarding",
+                                      ritual_question="Wat mag er zijn vandaag?", member_name="Thomas")
+
+
+def build_model(latency: float):
+    counter = itertools.count()
+    return build_json_stub_model(
+        lambda: {"text": f"Een rustige ochtend nummer {next(counter)}.", "tone": "peaceful"}, latency
+    )
+
+
+async def run(requests: int, pause: float) -> list:
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await server.generate_pulse_response(REQUEST)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(pause)
+    return latencies
+
+
+def report(label: str, latencies: list):
+    print(f"  {label:<14} p50={percentile(latencies, 50) * 1000:8.2f} ms  "
+          f"p95={percentile(latencies, 95) * 1000:8.2f} ms  max={max(latencies) * 1000:8.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per model call")
+    parser.add_argument("--pause", type=float, default=0.1, help="seconds between requests")
+    args = parser.parse_args()
+
+    server.registry.register("community-member", CommunityMemberAgent)
+    with community_member.override(model=build_model(args.latency)):
+        server.pulse_pool = None
+        live = await run(args.requests, args.pause)
+
+        server.pulse_pool = PulseResponsePool(CommunityMemberAgent.generate_pulse_response, refill_concurrency=4)
+        await server.pulse_pool.warm([(REQUEST.ritual_name, REQUEST.ritual_question, REQUEST.member_name)])
+        pooled = await run(args.requests, args.pause)
+        stats = server.pulse_pool.stats()
+        await server.pulse_pool.close()
+
+    print(f"\n{args.requests} requests, {args.latency * 1000:.0f} ms per model call, "
+          f"one every {args.pause * 1000:.0f} ms")
+    report("live", live)
+    report("pooled", pooled)
+    print(f"  pool hit rate {stats['hit_rate']:.0%}, {stats['generated']} generated in the background")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
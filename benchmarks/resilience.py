@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Upstream load and time-to-fail during a model API outage, old retry
+behaviour against the retry budget + circuit breaker.
+
+A simulated DeepInfra endpoint answers every chat completion with a 503
+after `--latency`. `--requests` agent runs are started in waves of
+`--concurrency`. The old setup is the OpenAI SDK's own retries (2 per
+request, backoff from 0.5 s); the new one is ResilientTransport with the
+shared retry budget and a breaker.
+
+    python -m benchmarks.resilience --requests 100 --concurrency 10 --latency 0.05
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from openai import AsyncOpenAI
+from pydantic_ai import Agent
+from pydantic_ai.models.openai import OpenAIChatModel
+from pydantic_ai.providers.openai import OpenAIProvider
+
+from benchmarks.stream_latency import percentile
+from pydantic_agents.resilience import CircuitBreaker, ResilientTransport, RetryBudget
+
+
+def outage(latency: float, counter: dict):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        counter["calls"] += 1
+        await asyncio.sleep(latency)
+        return httpx.Response(503, json={"error": {"message": "upstream unavailable"}})
+    return httpx.MockTransport(handler)
+
+
+def build_agent(transport: httpx.AsyncBaseTransport, sdk_retries: int) -> Agent:
+    client = AsyncOpenAI(base_url="http://deepinfra.test/v1/openai", api_key="bench",
+                         http_client=httpx.AsyncClient(transport=transport), max_retries=sdk_retries)
+    return Agent(OpenAIChatModel("zai-org/GLM-4.5", provider=OpenAIProvider(openai_client=client)))
+
+
+async def run_waves(agent: Agent, requests: int, concurrency: int) -> list:
+    async def one():
+        start = time.perf_counter()
+        try:
+            await agent.run("Plan een teamuitje")
+        except Exception:
+            pass
+        return time.perf_counter() - start
+
+    durations = []
+    for offset in range(0, requests, concurrency):
+        durations += await asyncio.gather(*(one() for _ in range(min(concurrency, requests - offset))))
+    return durations
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds until the upstream answers 503")
+    args = parser.parse_args()
+
+    print(f"\n{args.requests} agent runs against an upstream returning 503, {args.concurrency} at a time")
+    counter = {"calls": 0}
+    start = time.perf_counter()
+    durations = await run_waves(build_agent(outage(args.latency, counter), sdk_retries=2),
+                                args.requests, args.concurrency)
+    print(f"  SDK retries (2)             upstream calls {counter['calls']:4d}  "
+          f"time to fail p50 {percentile(durations, 50) * 1000:6.0f} ms  total {time.perf_counter() - start:5.1f} s")
+
+    counter = {"calls": 0}
+    breaker = CircuitBreaker("deepinfra")
+    budget = RetryBudget()
+    transport = ResilientTransport(outage(args.latency, counter), breaker, budget)
+    start = time.perf_counter()
+    durations = await run_waves(build_agent(transport, sdk_retries=0), args.requests, args.concurrency)
+    print(f"  retry budget + breaker      upstream calls {counter['calls']:4d}  "
+          f"time to fail p50 {percentile(durations, 50) * 1000:6.0f} ms  total {time.perf_counter() - start:5.1f} s  "
+          f"(retries {budget.retries}, fast-failed {breaker.rejected})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Throughput of the agent server at rising concurrency, fully offline.
+
+Starts the real FastAPI app under uvicorn in a child process, with the
+models replaced by deterministic stubs (a token-streaming chat model that
+makes one MCP tool call per turn, and JSON stubs for the pulse and
+re-engagement agents), PocketBase replaced by benchmarks/fake_pocketbase.py
+(seeded conversations, write-behind persistence) and MCP by
+benchmarks/fake_mcp.py. The driver then runs closed-loop clients against
+/chat, /chat/stream, /community/pulse-response, /reengagement/generate-nudge,
+/reengagement/generate-nudges and /reengagement/buddy-nudge for `--duration`
+seconds per concurrency level, and reports:
+
+  req/s        completed requests per second (batches per second for nudges)
+  p50/p95      request latency, to the last byte
+  ttft         time to the first token frame (/chat/stream)
+  cpu/req      server CPU per request (the stubs run in the server, too)
+  cpu/token    server CPU per streamed model token (/chat, /chat/stream)
+  mem/stream   Python heap per open stream, from a second pass of /chat/stream
+               with tracemalloc on in the server
+
+Compare runs of the same arguments against each other; the absolute numbers
+depend on the machine.
+
+    python -m benchmarks.server_load --concurrency 1 8 32 64 --duration 3
+
+With `--replay DIR` the real agents answer instead of the stubs, their model
+and MCP traffic replayed from the cassettes in DIR (recorded with
+CASSETTE_MODE=record, see pydantic_agents/cassettes.py), with the recorded
+timing sped up by `--replay-speed`. /chat turns go to `--agent`.
+
+    python -m benchmarks.server_load --replay cassettes --agent event-planner --endpoints chat-stream pulse
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.stream_latency import percentile
+
+ENDPOINTS = ["chat", "chat-stream", "pulse", "nudge", "nudges", "buddy-nudge"]
+# Instructions of the stub chat agent; every turn, also those with history, must carry them
+CHAT_INSTRUCTIONS = "Je bent een behulpzame assistent."
+
+
+# Server side (runs in the child process)
+
+def build_chat_model(args, counter: dict):
+    """
+    Streams `--tokens` tokens at `--token-rate` after one MCP tool call per turn.
+
+    Fails the turn when the request lacks the agent's instructions, so turns
+    that lose them show up as errors.
+    """
+    from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+    from pydantic_ai.models.function import DeltaToolCall, FunctionModel
+
+    interval = 1 / args.token_rate
+    first_token = args.first_token_ms / 1000
+
+    def wants_tool(messages) -> bool:
+        return args.tool_calls and not any(isinstance(part, ToolReturnPart) for part in messages[-1].parts)
+
+    def check_instructions(messages) -> None:
+        if messages[-1].instructions != CHAT_INSTRUCTIONS:
+            raise RuntimeError(f"turn sent without the agent instructions ({len(messages)} messages)")
+
+    async def stream(messages, info):
+        check_instructions(messages)
+        if wants_tool(messages):
+            yield {0: DeltaToolCall(name="resolve-library-id", json_args='{"libraryName": "fastapi"}')}
+            return
+        await asyncio.sleep(first_token)
+        for _ in range(args.tokens):
+            counter["tokens"] += 1
+            yield "woord "
+            await asyncio.sleep(interval)
+
+    async def respond(messages, info):
+        check_instructions(messages)
+        if wants_tool(messages):
+            return ModelResponse(parts=[ToolCallPart("resolve-library-id", {"libraryName": "fastapi"})])
+        await asyncio.sleep(first_token + interval * args.tokens)
+        counter["tokens"] += args.tokens
+        return ModelResponse(parts=[TextPart(content="woord " * args.tokens)])
+
+    return FunctionModel(respond, stream_function=stream)
+
+
+async def seed_conversations(args) -> None:
+    from benchmarks import fake_pocketbase
+    for c in range(args.conversations):
+        for m in range(args.history):
+            fake_pocketbase._create("messages", {
+                "conversationId": f"bench-conv-{c}", "userId": "bench-user",
+                "role": "user" if m % 2 == 0 else "assistant", "content": f"Bericht {m} " * 20,
+            })
+
+
+async def serve(args) -> None:
+    if args.tracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+
+    import uvicorn
+    from pydantic_ai import Agent
+
+    from benchmarks import fake_mcp, fake_pocketbase
+    from benchmarks.stubs import StubAgent, build_json_stub_model
+    from pydantic_agents import server
+    from pydantic_agents.clients.default.agents.community_member.agent import CommunityMemberAgent, community_member
+    from pydantic_agents.clients.default.agents.reengagement.agent import ReengagementAgent, reengagement_agent
+    from pydantic_agents.mcp_pool import mcp_pool
+    from pydantic_agents.persistence import TurnPersister
+    from pydantic_agents.pocketbase_client import AsyncPocketBase
+
+    counter = {"tokens": 0}
+    latency = args.json_latency_ms / 1000
+    pulse = {"text": "Een rustige ochtend met koffie en stilte.", "tone": "peaceful"}
+    nudge = {"subject": "We missen je", "message": "Hoi, we misten je deze week bij de pulse.",
+             "tone": "warm", "urgency_level": "low"}
+
+    await seed_conversations(args)
+    server.pb_client = AsyncPocketBase("http://pocketbase.bench", email=fake_pocketbase.ADMIN_EMAIL,
+                                       password=fake_pocketbase.ADMIN_PASSWORD,
+                                       transport=httpx.ASGITransport(app=fake_pocketbase.app))
+    server.persister = TurnPersister(server.pb_client)
+    server.persister.start()
+
+    @server.app.get("/__bench__/stats")
+    async def bench_stats():
+        traced = None
+        if args.tracemalloc:
+            import tracemalloc
+            traced = tracemalloc.get_traced_memory()[0]
+        return {"cpu": time.process_time(), "tokens": counter["tokens"], "traced": traced}
+
+    @server.app.post("/__bench__/stop")
+    async def bench_stop():
+        # Shut down in order (server, then MCP sessions, then the fake MCP server),
+        # once this response is out
+        asyncio.get_running_loop().call_later(0.1, setattr, uvicorn_server, "should_exit", True)
+
+    # Replayed agents reach their MCP servers through the cassettes
+    async with contextlib.nullcontext() if args.replay else fake_mcp.serve(args.mcp_port) as url:
+        if args.replay:
+            server.registry.discover()
+        else:
+            chat = StubAgent(name=args.agent)
+            chat.agent = Agent(build_chat_model(args, counter), toolsets=[mcp_pool.server(url)],
+                               instructions=CHAT_INSTRUCTIONS)
+            server.registry.register(chat.name, chat)
+            server.registry.register("community-member", CommunityMemberAgent)
+            server.registry.register("reengagement", ReengagementAgent)
+        for name in (args.agent, "community-member", "reengagement"):
+            # Measure the serving path, not the admission queue
+            server.admission.configure(name, max_concurrency=args.max_concurrency, max_queue=args.max_concurrency)
+        await mcp_pool.warm()
+
+        config = uvicorn.Config(server.app, host="127.0.0.1", port=args.port, lifespan="off",
+                                log_level="warning", access_log=False)
+        uvicorn_server = uvicorn.Server(config)
+        with contextlib.ExitStack() as stubs:
+            if not args.replay:
+                stubs.enter_context(community_member.override(model=build_json_stub_model(pulse, latency)))
+                stubs.enter_context(reengagement_agent.override(model=build_json_stub_model(nudge, latency)))
+            await uvicorn_server.serve()
+        await server.persister.close()
+        # The fake MCP server logs "ASGI callable returned without completing
+        # response" here: the MCP SDK ends a closed session's GET stream unfinished
+        await mcp_pool.close()
+
+
+# Driver
+
+def request_for(endpoint: str, i: int, args) -> tuple:
+    conversation = {"conversation_id": f"bench-conv-{i % args.conversations}", "user_id": "bench-user"}
+    if endpoint == "chat":
+        return "/chat", {"message": f"Vraag {i}", "agent": args.agent, **conversation}
+    if endpoint == "chat-stream":
+        return "/chat/stream", {"message": f"Vraag {i}", "agent": args.agent, **conversation}
+    if endpoint == "pulse":
+        return "/community/pulse-response", {"ritual_name": "Zondagavond",
+                                             "ritual_question": f"Wat gaf je rust? ({i})", "member_name": "Thomas"}
+    if endpoint == "nudge":
+        return "/reengagement/generate-nudge", {"member_name": f"Lid {i}", "days_inactive": 7}
+    if endpoint == "nudges":
+        return "/reengagement/generate-nudges", {
+            "requests": [{"member_name": f"Lid {i}-{m}", "days_inactive": 7 + m} for m in range(args.batch)]
+        }
+    return "/reengagement/buddy-nudge", {"member_name": f"Lid {i}", "buddy_name": "Thomas"}
+
+
+async def one(client: httpx.AsyncClient, endpoint: str, i: int, args) -> tuple:
+    path, body = request_for(endpoint, i, args)
+    start = time.perf_counter()
+    ttft = None
+    ok = True
+    async with client.stream("POST", path, json=body) as response:
+        async for line in response.aiter_lines():
+            if ttft is None and ('"part_delta"' in line or '"part_start"' in line):
+                ttft = time.perf_counter() - start
+            # SSE error frames and failed batch items
+            if '"error"' in line:
+                ok = False
+        ok = ok and response.status_code == 200
+    return time.perf_counter() - start, ttft, ok
+
+
+async def run_level(client: httpx.AsyncClient, endpoint: str, concurrency: int, args, sample_memory: bool = False):
+    async def stats():
+        return (await client.get("/__bench__/stats")).json()
+
+    before = await stats()
+    deadline = time.perf_counter() + args.duration
+    results = []
+    counter = iter(range(10 ** 9))
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            results.append(await one(client, endpoint, next(counter), args))
+
+    peak = before["traced"] or 0
+
+    async def sampler():
+        nonlocal peak
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+            peak = max(peak, (await stats())["traced"])
+
+    start = time.perf_counter()
+    workers = [worker() for _ in range(concurrency)]
+    await asyncio.gather(*workers, *([sampler()] if sample_memory else []))
+    elapsed = time.perf_counter() - start
+    after = await stats()
+
+    latencies = [r[0] for r in results]
+    ttfts = [r[1] for r in results if r[1] is not None]
+    errors = sum(1 for r in results if not r[2])
+    tokens = after["tokens"] - before["tokens"]
+    cpu = after["cpu"] - before["cpu"]
+    return {
+        "rps": len(results) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "ttft50": percentile(ttfts, 50) if ttfts else None,
+        "ttft95": percentile(ttfts, 95) if ttfts else None,
+        "cpu_per_request": cpu / len(results) if results else 0.0,
+        "cpu_per_token": cpu / tokens if tokens else None,
+        "mem_per_stream": (peak - before["traced"]) / concurrency if sample_memory else None,
+        "requests": len(results),
+        "errors": errors,
+    }
+
+
+def start_server(args, port: int, tracemalloc: bool) -> subprocess.Popen:
+    command = [sys.executable, "-m", "benchmarks.server_load", "--serve", "--port", str(port),
+               "--mcp-port", str(args.mcp_port + (1 if tracemalloc else 0)),
+               "--tokens", str(args.tokens), "--token-rate", str(args.token_rate),
+               "--first-token-ms", str(args.first_token_ms), "--json-latency-ms", str(args.json_latency_ms),
+               "--tool-calls", str(args.tool_calls), "--conversations", str(args.conversations),
+               "--history", str(args.history), "--max-concurrency", str(max(args.concurrency) * args.batch)]
+    if tracemalloc:
+        command.append("--tracemalloc")
+    env = {**os.environ, "MISTRAL_API_KEY": os.getenv("MISTRAL_API_KEY", "bench"),
+           "DEEPINFRA_API_KEY": os.getenv("DEEPINFRA_API_KEY", "bench")}
+    if args.replay:
+        command += ["--replay", args.replay, "--agent", args.agent]
+        env.update(CASSETTE_MODE="replay", CASSETTE_DIR=args.replay, CASSETTE_SPEED=str(args.replay_speed))
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+
+
+async def wait_ready(client: httpx.AsyncClient, process: subprocess.Popen) -> None:
+    for _ in range(600):
+        if process.poll() is not None:
+            raise RuntimeError("benchmark server exited during startup")
+        try:
+            await client.get("/__bench__/stats")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError("benchmark server did not start")
+
+
+async def stop_server(process: subprocess.Popen, port: int) -> None:
+    try:
+        async with httpx.AsyncClient() as client:
+            await client.post(f"http://127.0.0.1:{port}/__bench__/stop")
+        await asyncio.to_thread(process.wait, 30)
+    except (httpx.TransportError, subprocess.TimeoutExpired):
+        process.terminate()
+        process.wait()
+
+
+def fmt(seconds, scale: float = 1000, unit: str = "ms") -> str:
+    return "      -" if seconds is None else f"{seconds * scale:6.1f}{unit}"
+
+
+async def drive(args) -> None:
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 8, max_keepalive_connections=max(args.concurrency) + 8)
+    endpoints = args.endpoints
+    if args.replay:
+        print(f"\n{args.agent} replayed from {args.replay}/ at {args.replay_speed:g}x; {args.duration:g} s per level")
+    else:
+        print(f"\nstub chat model: {args.tokens} tokens at {args.token_rate:.0f}/s after {args.first_token_ms:.0f} ms, "
+              f"{args.tool_calls} MCP tool call(s) per turn; JSON stubs {args.json_latency_ms:.0f} ms; "
+              f"{args.duration:g} s per level")
+    print(f"{'endpoint':<12} {'conc':>4} {'req/s':>8} {'p50':>8} {'p95':>8} {'ttft p50':>8} {'ttft p95':>8} "
+          f"{'cpu/req':>8} {'cpu/token':>10} {'errors':>6}")
+
+    process = start_server(args, args.port, tracemalloc=False)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=120, limits=limits) as client:
+            await wait_ready(client, process)
+            if args.replay:
+                # The real agents load on their first request
+                await asyncio.gather(*(one(client, endpoint, 0, args) for endpoint in endpoints))
+            for endpoint in endpoints:
+                for concurrency in args.concurrency:
+                    r = await run_level(client, endpoint, concurrency, args)
+                    print(f"{endpoint:<12} {concurrency:>4} {r['rps']:>8.1f} {fmt(r['p50'])} {fmt(r['p95'])} "
+                          f"{fmt(r['ttft50'])} {fmt(r['ttft95'])} {fmt(r['cpu_per_request'])} "
+                          f"{fmt(r['cpu_per_token'], 1e6, 'us'):>10} {r['errors']:>6}")
+    finally:
+        await stop_server(process, args.port)
+
+    if "chat-stream" not in endpoints or args.skip_memory:
+        return
+    print(f"\n{'chat-stream':<12} {'conc':>4} {'mem/stream':>11}   (tracemalloc on in the server)")
+    process = start_server(args, args.port + 1, tracemalloc=True)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port + 1}", timeout=120,
+                                     limits=limits) as client:
+            await wait_ready(client, process)
+            if args.replay:
+                await one(client, "chat-stream", 0, args)
+            for concurrency in args.concurrency:
+                r = await run_level(client, "chat-stream", concurrency, args, sample_memory=True)
+                print(f"{'':<12} {concurrency:>4} {r['mem_per_stream'] / 1024:>9.1f}KB")
+    finally:
+        await stop_server(process, args.port + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per endpoint and level")
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS, choices=ENDPOINTS)
+    parser.add_argument("--tokens", type=int, default=100, help="tokens per chat answer")
+    parser.add_argument("--token-rate", type=float, default=500, help="stub model tokens per second")
+    parser.add_argument("--first-token-ms", type=float, default=50)
+    parser.add_argument("--json-latency-ms", type=float, default=100, help="pulse / nudge stub latency")
+    parser.add_argument("--tool-calls", type=int, default=1, choices=[0, 1], help="MCP tool calls per chat turn")
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--history", type=int, default=20, help="seeded messages per conversation")
+    parser.add_argument("--batch", type=int, default=10, help="members per /generate-nudges request")
+    parser.add_argument("--skip-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--replay", metavar="DIR", help="replay the real agents from the cassettes in DIR")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="replay this many times faster than recorded")
+    parser.add_argument("--agent", default="bench-chat", help="agent for /chat and /chat/stream")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--mcp-port", type=int, default=8766)
+    # Child process
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--tracemalloc", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--max-concurrency", type=int, default=64, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    asyncio.run(serve(args) if args.serve else drive(args))
+
+
+if __name__ == "__main__":
+    main()
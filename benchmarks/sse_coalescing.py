@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Frames and writes per stream with and without delta coalescing.
+
+Streams a dense stub generation (many tiny deltas) through /chat/stream at
+several coalescing windows and reports the number of frames written, the
+text delivered per frame and the largest gap a reader would see.
+
+    python -m benchmarks.sse_coalescing --tokens 2000 --interval 0.001 --windows 0 15 30
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.stream_latency import push_stream
+from benchmarks.stubs import StubAgent
+from pydantic_agents import server, streaming
+
+
+async def run(agent_name: str, window_ms: float) -> dict:
+    streaming.SSE_COALESCE_WINDOW_MS = window_ms
+    start = time.perf_counter()
+    frames = 0
+    delta_times = []
+    async for chunk in push_stream(agent_name, "hallo", protocol="2"):
+        frames += 1
+        if '"part_delta"' in chunk:
+            delta_times.append(time.perf_counter())
+    gaps = [b - a for a, b in zip(delta_times, delta_times[1:])]
+    return {
+        "elapsed": time.perf_counter() - start,
+        "frames": frames,
+        "delta_frames": len(delta_times),
+        "max_gap": max(gaps) if gaps else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--interval", type=float, default=0.001)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 15, 30])
+    args = parser.parse_args()
+
+    stub = StubAgent(tokens=args.tokens, interval=args.interval, first_token_delay=0)
+    server.registry.register(stub.name, stub)
+
+    print(f"{'window':>8} {'frames':>8} {'deltas/frame':>13} {'max gap':>10} {'elapsed':>10}")
+    for window in args.windows:
+        result = await run(stub.name, window)
+        print(f"{window:>6.0f}ms {result['frames']:>8} {args.tokens / result['delta_frames']:>13.1f} "
+              f"{result['max_gap'] * 1000:>8.1f}ms {result['elapsed'] * 1000:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
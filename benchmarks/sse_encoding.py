@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+CPU and wire cost per SSE frame for /chat/stream protocol v1 and v2.
+
+    python -m benchmarks.sse_encoding --frames 200000
+"""
+import argparse
+import time
+
+from pydantic_agents.streaming import get_encoder
+
+DELTAS = ["Het ", "draaiboek ", "voor ", "zaterdag: ", "koffie ", "om ", "10:00 ", "bij ", "café ", "De Ruimte.\n"]
+
+
+def delta_events(frames: int):
+    return [
+        {
+            "event_kind": "part_delta",
+            "delta": {"part_delta_kind": "text", "content_delta": DELTAS[i % len(DELTAS)]},
+            "index": 1,
+        }
+        for i in range(frames)
+    ]
+
+
+def run(protocol: str, events: list) -> tuple[float, int]:
+    encoder = get_encoder(protocol, "k3j4h5g6f7d8s9a", "event-planner")
+    start = time.perf_counter()
+    frames = [encoder.event(event) for event in events]
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(len(frame.encode("utf-8")) for frame in frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--frames", type=int, default=200000)
+    args = parser.parse_args()
+
+    events = delta_events(args.frames)
+    print(f"{'protocol':>8} {'us/frame':>10} {'bytes/frame':>12}")
+    for protocol in ("1", "2"):
+        elapsed, size = run(protocol, events)
+        print(f"{protocol:>8} {elapsed / args.frames * 1e6:>10.2f} {size / args.frames:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
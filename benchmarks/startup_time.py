@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Cold-start cost of the agent server per AGENT_LOADING mode.
+
+Each run is a fresh interpreter. It reports the time to import the server
+module, the time until startup_event returns (the server accepts requests
+and /health is green), and the time until every agent is loaded. The
+"legacy" row replays the previous startup: import every agent module, then
+initialize them one at a time.
+
+    python -m benchmarks.startup_time --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import asyncio, json, time
+start = time.perf_counter()
+from pydantic_agents import server
+imported = time.perf_counter()
+
+async def main():
+    await server.startup_event()
+    ready = time.perf_counter()
+    if server.warmup_task:
+        await server.warmup_task
+    if server.registry.get(server.DEFAULT_AGENT) is not None:
+        await server.registry.load(server.registry.list())
+    loaded = time.perf_counter()
+    return ready, loaded
+
+ready, loaded = asyncio.run(main())
+print("RESULT " + json.dumps({"import": imported - start, "ready": ready - start, "all": loaded - start}))
+"""
+
+LEGACY_PROBE = r"""
+import asyncio, json, time
+start = time.perf_counter()
+from pydantic_agents import server
+imported = time.perf_counter()
+
+async def main():
+    from pydantic_agents.clients.default.agents.contract_clearance.agent import contract_clearance_agent
+    from pydantic_agents.clients.default.agents.event_planner.agent import event_planner_agent
+    from pydantic_agents.clients.default.agents.event_contract_assistant.agent import event_contract_assistant_agent
+    from pydantic_agents.clients.default.agents.marketing_communicatie.agent import marketing_communicatie_agent
+    from pydantic_agents.clients.default.agents.community_member import CommunityMemberAgent
+    from pydantic_agents.clients.default.agents.reengagement import ReengagementAgent
+    for agent in (contract_clearance_agent, event_planner_agent, event_contract_assistant_agent,
+                  marketing_communicatie_agent):
+        await agent.initialize()
+    return time.perf_counter()
+
+ready = asyncio.run(main())
+print("RESULT " + json.dumps({"import": imported - start, "ready": ready - start, "all": ready - start}))
+"""
+
+
+def run_probe(probe: str, mode: str) -> dict:
+    env = dict(os.environ, AGENT_LOADING=mode, PULSE_POOL_ENABLED="0")
+    env.setdefault("DEEPINFRA_API_KEY", "bench")
+    env.setdefault("MISTRAL_API_KEY", "bench")
+    env.pop("POCKETBASE_URL", None)
+    output = subprocess.run([sys.executable, "-c", probe], env=env, capture_output=True, text=True, check=True).stdout
+    line = next(line for line in output.splitlines() if line.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["legacy", "eager", "background", "lazy"])
+    args = parser.parse_args()
+
+    print(f"\nmedian of {args.runs} cold starts (seconds)")
+    print(f"  {'mode':<12} {'import':>8} {'ready':>8} {'all agents':>11}")
+    for mode in args.modes:
+        probe = LEGACY_PROBE if mode == "legacy" else PROBE
+        results = [run_probe(probe, mode) for _ in range(args.runs)]
+        med = {key: statistics.median(r[key] for r in results) for key in ("import", "ready", "all")}
+        print(f"  {mode:<12} {med['import']:8.3f} {med['ready']:8.3f} {med['all']:11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Time-to-first-token and inter-token jitter for /chat/stream.
+
+Compares the push-based channel used by the server against the previous
+100ms polling loop, using a stub model with a fixed token interval.
+
+    python -m benchmarks.stream_latency --runs 20 --tokens 100 --interval 0.01
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from pydantic_ai.messages import PartDeltaEvent, TextPartDelta
+from starlette.requests import Request
+
+from benchmarks.stubs import StubAgent
+from pydantic_agents import server
+
+
+async def legacy_polling_stream(agent_wrapper, message: str):
+    """The /chat/stream loop as it was before the push channel (for comparison)."""
+    event_queue = []
+    full_response = ""
+
+    async def event_stream_handler(ctx, events):
+        nonlocal full_response
+        async for event in events:
+            if isinstance(event, PartDeltaEvent) and isinstance(event.delta, TextPartDelta):
+                full_response += event.delta.content_delta
+                event_queue.append({
+                    "event_kind": "part_delta",
+                    "delta": {"part_delta_kind": "text", "content_delta": event.delta.content_delta},
+                })
+
+    yield f"data: {json.dumps({'type': 'ping'})}\n\n"
+    agent_task = asyncio.create_task(
+        agent_wrapper.agent.run(message, event_stream_handler=event_stream_handler)
+    )
+    streamed_count = 0
+    while not agent_task.done() or streamed_count < len(event_queue):
+        while streamed_count < len(event_queue):
+            yield f"data: {json.dumps(event_queue[streamed_count])}\n\n"
+            streamed_count += 1
+        if not agent_task.done():
+            await asyncio.sleep(0.1)
+    await agent_task
+    yield f"data: {json.dumps({'type': 'done', 'response': full_response})}\n\n"
+
+
+async def connected_client() -> dict:
+    """ASGI `receive` of a client that stays connected until the stream ends."""
+    await asyncio.Event().wait()
+
+
+async def push_stream(agent_name: str, message: str, protocol: str | None = None):
+    """The current /chat/stream generator."""
+    response = await server.chat_stream(
+        server.MessageRequest(message=message, agent=agent_name),
+        Request({"type": "http"}, connected_client),
+        x_sse_protocol=protocol,
+        x_request_id=None
+    )
+    async for chunk in response.body_iterator:
+        yield chunk
+
+
+async def measure(stream) -> dict:
+    """Consume one stream and record first-token time and gaps between token frames."""
+    start = time.perf_counter()
+    first_byte = None
+    delta_times = []
+    async for chunk in stream:
+        now = time.perf_counter()
+        if first_byte is None:
+            first_byte = now - start
+        if '"part_delta"' in chunk or '"part_start"' in chunk:
+            delta_times.append(now)
+    gaps = [b - a for a, b in zip(delta_times, delta_times[1:])]
+    return {
+        "ttfb": first_byte,
+        "ttft": delta_times[0] - start if delta_times else None,
+        "gaps": gaps,
+    }
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def report(label: str, results: list, interval: float):
+    ttft = [r["ttft"] for r in results if r["ttft"] is not None]
+    gaps = [g for r in results for g in r["gaps"]]
+    print(f"\n[{label}]")
+    print(f"  TTFB          p50={percentile([r['ttfb'] for r in results], 50) * 1000:7.2f} ms")
+    print(f"  TTFT          p50={percentile(ttft, 50) * 1000:7.2f} ms  p95={percentile(ttft, 95) * 1000:7.2f} ms")
+    print(f"  token gap     mean={statistics.fmean(gaps) * 1000:7.2f} ms  "
+          f"(model emits every {interval * 1000:.2f} ms)")
+    print(f"  jitter        stdev={statistics.pstdev(gaps) * 1000:7.2f} ms  "
+          f"p99={percentile(gaps, 99) * 1000:7.2f} ms  max={max(gaps) * 1000:7.2f} ms")
+
+
+async def idle_cpu(make_stream, streams: int, idle_seconds: float) -> float:
+    """CPU seconds per second while `streams` requests wait for a slow first token."""
+    tasks = [asyncio.create_task(measure(make_stream())) for _ in range(streams)]
+    # Skip request setup and run start; sample only the idle middle of the wait
+    settle = idle_seconds / 4
+    await asyncio.sleep(settle)
+    cpu_start = time.process_time()
+    await asyncio.sleep(idle_seconds - 2 * settle)
+    cpu_used = time.process_time() - cpu_start
+    await asyncio.gather(*tasks)
+    return cpu_used / (idle_seconds - 2 * settle)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between model tokens")
+    parser.add_argument("--first-token-delay", type=float, default=0.05)
+    parser.add_argument("--idle-streams", type=int, default=200)
+    parser.add_argument("--idle-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    stub = StubAgent(tokens=args.tokens, interval=args.interval, first_token_delay=args.first_token_delay)
+    server.registry.register(stub.name, stub)
+
+    before = [await measure(legacy_polling_stream(stub, "hallo")) for _ in range(args.runs)]
+    after = [await measure(push_stream(stub.name, "hallo")) for _ in range(args.runs)]
+    report("before: 100ms polling", before, args.interval)
+    report("after: push channel", after, args.interval)
+
+    idle = StubAgent(name="bench-idle", tokens=1, interval=0, first_token_delay=args.idle_seconds)
+    server.registry.register(idle.name, idle)
+    server.admission.configure(idle.name, max_concurrency=args.idle_streams)
+    cpu_before = await idle_cpu(lambda: legacy_polling_stream(idle, "hallo"), args.idle_streams, args.idle_seconds)
+    cpu_after = await idle_cpu(lambda: push_stream(idle.name, "hallo"), args.idle_streams, args.idle_seconds)
+    print(f"\n[idle] {args.idle_streams} streams waiting {args.idle_seconds}s for the first token")
+    print(f"  CPU before: {cpu_before * 1000:8.1f} ms per second")
+    print(f"  CPU after:  {cpu_after * 1000:8.1f} ms per second")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
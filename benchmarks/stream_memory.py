@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Peak Python allocation per /chat/stream run as the output grows.
+
+Streams a stub generation of up to 50k deltas through the previous
+list-and-concatenate loop and through the current push channel, and
+reports tracemalloc peaks. The final text has to be held (pydantic-ai
+keeps it in the response part and it is sent in the `done` frame), so the
+figure to watch is the peak relative to the text size: it should stay a
+small constant instead of growing with the number of deltas.
+
+    python -m benchmarks.stream_memory --deltas 5000 20000 50000
+"""
+import argparse
+import asyncio
+import functools
+import tracemalloc
+
+from benchmarks.stream_latency import legacy_polling_stream, push_stream
+from benchmarks.stubs import StubAgent
+from pydantic_agents import server
+
+TOKEN = "woord "
+
+
+async def drain(stream) -> int:
+    frames = 0
+    async for _ in stream:
+        frames += 1
+    return frames
+
+
+async def peak_allocation(make_stream) -> int:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    await drain(make_stream())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - baseline
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--deltas", type=int, nargs="+", default=[5000, 20000, 50000])
+    args = parser.parse_args()
+
+    print(f"{'deltas':>8} {'text':>10} {'before peak':>14} {'after peak':>14} {'before/text':>12} {'after/text':>12}")
+    for deltas in args.deltas:
+        stub = StubAgent(name=f"bench-mem-{deltas}", tokens=deltas, interval=0, first_token_delay=0,
+                         token=TOKEN)
+        server.registry.register(stub.name, stub)
+        text_size = len(TOKEN) * deltas
+
+        before = await peak_allocation(functools.partial(legacy_polling_stream, stub, "hallo"))
+        after = await peak_allocation(functools.partial(push_stream, stub.name, "hallo"))
+        print(f"{deltas:>8} {text_size / 1024:>8.0f}KB {before / 1024:>12.0f}KB "
+              f"{after / 1024:>12.0f}KB {before / text_size:>11.1f}x {after / text_size:>11.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Latency of pulse responses when the model sometimes writes an overlong
+reflection, validating the finished output against validating it while it
+streams.
+
+A stub model streams its output tool call in `--chunk` character pieces,
+`--interval` apart, after `--latency`. A `--bad-rate` fraction of calls write
+a `--bad-chars` long text instead of a short one (PulseResponse.text allows
+200). "after the output" is pydantic-ai's own validation of the finished
+output, which asks the model again; "while streaming" is `run_structured`,
+which abandons the output as soon as the text passes the limit and retries.
+
+    python -m benchmarks.structured_output --requests 100 --bad-rate 0.2
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from pydantic_ai import Agent
+
+from benchmarks.stream_latency import percentile
+from benchmarks.stubs import build_json_stub_model
+from pydantic_agents.clients.default.agents.community_member.agent import PulseResponse
+from pydantic_agents.structured import run_structured
+
+
+def build_model(args, counter: dict):
+    def payload():
+        if random.random() < args.bad_rate:
+            return {"text": "Ik " + "merk heel veel " * (args.bad_chars // 15), "tone": "warm"}
+        return {"text": "Een rustige ochtend met koffie.", "tone": "peaceful"}
+    return build_json_stub_model(payload, args.latency, chunk_chars=args.chunk, interval=args.interval,
+                                 counter=counter)
+
+
+async def scenario(args, label: str, incremental: bool) -> None:
+    counter = {"calls": 0}
+    agent = Agent(build_model(args, counter), retries=3)
+
+    async def one():
+        start = time.perf_counter()
+        if incremental:
+            await run_structured(agent, "Deel je ervaring", PulseResponse, attempts=4)
+        else:
+            await agent.run("Deel je ervaring", output_type=PulseResponse)
+        return time.perf_counter() - start
+
+    latencies = []
+    for offset in range(0, args.requests, args.concurrency):
+        latencies += await asyncio.gather(*(one() for _ in range(min(args.concurrency, args.requests - offset))))
+    print(f"  {label:<16}  p50 {percentile(latencies, 50) * 1000:6.0f} ms  "
+          f"p95 {percentile(latencies, 95) * 1000:6.0f} ms  p99 {percentile(latencies, 99) * 1000:6.0f} ms  "
+          f"model calls {counter['calls']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds until the first chunk")
+    parser.add_argument("--chunk", type=int, default=8, help="characters per streamed chunk")
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between chunks")
+    parser.add_argument("--bad-rate", type=float, default=0.2)
+    parser.add_argument("--bad-chars", type=int, default=600)
+    args = parser.parse_args()
+
+    print(f"\n{args.requests} pulse responses, {args.bad_rate:.0%} of model outputs {args.bad_chars} chars long")
+    random.seed(1)
+    await scenario(args, "after the output", incremental=False)
+    random.seed(1)
+    await scenario(args, "while streaming", incremental=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
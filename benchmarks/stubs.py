@@ -0,0 +1,79 @@
+"""
+Deterministic stand-ins for the real agents, used by the benchmarks.
+"""
+import asyncio
+
+from pydantic_ai import Agent
+from pydantic_ai.models.function import FunctionModel
+
+
+def build_stub_model(tokens: int = 200, interval: float = 0.005, first_token_delay: float = 0.05,
+                     token: str = "woord "):
+    """Build a streaming model that emits `tokens` deltas at a fixed interval."""
+
+    async def stream(messages, info):
+        await asyncio.sleep(first_token_delay)
+        for _ in range(tokens):
+            yield token
+            if interval:
+                await asyncio.sleep(interval)
+
+    async def respond(messages, info):
+        from pydantic_ai.messages import ModelResponse, TextPart
+        await asyncio.sleep(first_token_delay + interval * tokens)
+        return ModelResponse(parts=[TextPart(content=token * tokens)])
+
+    return FunctionModel(respond, stream_function=stream)
+
+
+class StubAgent:
+    """Agent wrapper with the same shape as the GLM agent wrappers."""
+    def __init__(self, name: str = "bench-stub", **model_kwargs):
+        self.name = name
+        self.description = "Deterministic benchmark agent"
+        self.agent = Agent(model=build_stub_model(**model_kwargs))
+
+    async def initialize(self):
+        pass
+
+
+def build_json_stub_model(payload, latency: float = 0.2, chunk_chars: int = 16, interval: float = 0.0,
+                          counter: dict = None):
+    """
+    Build a model that answers every prompt with `payload` (a dict, or a
+    function returning one) as JSON after `latency`.
+
+    When the agent asks for structured output the JSON is the arguments of the
+    output tool call. Streamed runs get it in `chunk_chars` pieces, `interval`
+    apart; other runs get it all at once, as late as the last piece would
+    arrive. `counter["calls"]` counts the calls, if given.
+    """
+    import json
+    from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart
+    from pydantic_ai.models.function import DeltaToolCall
+
+    def output_json(info) -> str:
+        if counter is not None:
+            counter["calls"] += 1
+        return json.dumps(payload() if callable(payload) else payload, ensure_ascii=False)
+
+    async def respond(messages, info):
+        content = output_json(info)
+        await asyncio.sleep(latency + interval * -(-len(content) // chunk_chars))
+        if info.output_tools:
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, content)])
+        return ModelResponse(parts=[TextPart(content=content)])
+
+    async def stream(messages, info):
+        content = output_json(info)
+        await asyncio.sleep(latency)
+        for offset in range(0, len(content), chunk_chars):
+            chunk = content[offset:offset + chunk_chars]
+            if info.output_tools:
+                yield {0: DeltaToolCall(name=info.output_tools[0].name if offset == 0 else None, json_args=chunk)}
+            else:
+                yield chunk
+            if interval:
+                await asyncio.sleep(interval)
+
+    return FunctionModel(respond, stream_function=stream)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Agent runs with repeated MCP documentation lookups, with and without the
+tool result cache.
+
+Each run of the stub model resolves a library and fetches its docs (two
+tool calls), with libraries drawn from a small, skewed set the way real
+traffic asks for the same docs again and again. Runs go to the local fake
+Context7 server with a simulated network round trip.
+
+    python -m benchmarks.tool_cache --runs 60 --rtt-ms 40 --libraries 8
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import FunctionModel
+
+from benchmarks import fake_mcp
+from benchmarks.stream_latency import percentile
+from pydantic_agents.mcp_pool import MCPSessionPool
+from pydantic_agents.tool_cache import CachingToolset, ToolResultCache
+
+
+def docs_lookup_model(library: str) -> FunctionModel:
+    async def respond(messages, info):
+        returns = sum(isinstance(part, ToolReturnPart) for message in messages for part in message.parts)
+        if returns == 0:
+            return ModelResponse(parts=[ToolCallPart("resolve-library-id", {"libraryName": library})])
+        if returns == 1:
+            return ModelResponse(parts=[ToolCallPart(
+                "get-library-docs", {"context7CompatibleLibraryID": f"/{library}/{library}", "topic": "routing"})])
+        return ModelResponse(parts=[TextPart(content="klaar")])
+    return FunctionModel(respond)
+
+
+async def run(agent: Agent, libraries: list, runs: int, seed: int) -> list:
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(libraries))]
+    latencies = []
+    for _ in range(runs):
+        library = rng.choices(libraries, weights)[0]
+        start = time.perf_counter()
+        with agent.override(model=docs_lookup_model(library)):
+            await agent.run("Zoek de docs op")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--runs", type=int, default=60)
+    parser.add_argument("--rtt-ms", type=float, default=40)
+    parser.add_argument("--libraries", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    fake_mcp.RTT_MS = args.rtt_ms
+    libraries = [f"lib{i}" for i in range(args.libraries)]
+    async with fake_mcp.serve(args.port) as url:
+        pool = MCPSessionPool()
+        server = pool.server(url)
+        await pool.warm()
+
+        fake_mcp.reset()
+        before = await run(Agent("test", toolsets=[server]), libraries, args.runs, seed=1)
+        calls_before = fake_mcp.stats["tool_calls"]
+
+        cache = ToolResultCache(path=None)
+        fake_mcp.reset()
+        after = await run(Agent("test", toolsets=[CachingToolset(server, cache=cache)]), libraries, args.runs, seed=1)
+        calls_after = fake_mcp.stats["tool_calls"]
+        await pool.close()
+
+    print(f"\n{args.runs} runs, 2 tool calls each, {args.libraries} libraries, {args.rtt_ms:.0f} ms round trip")
+    for label, latencies, calls in (("no cache", before, calls_before), ("tool cache", after, calls_after)):
+        print(f"  {label:<11} p50={percentile(latencies, 50) * 1000:7.1f} ms  "
+              f"p95={percentile(latencies, 95) * 1000:7.1f} ms  tool calls sent={calls:4d}")
+    stats = cache.stats()
+    print(f"  cache hit rate {stats['hit_rate']:.0%} ({stats['hits']} hits, {stats['misses']} misses)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
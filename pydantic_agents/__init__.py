@@ -1 +1,5 @@
 # Pydantic Agents Package
+from dotenv import load_dotenv
+
+# Load environment variables before any module reads its settings at import time
+load_dotenv()
@@ -0,0 +1,186 @@
+"""
+Per-agent admission control.
+
+Every agent gets a limit on concurrent model runs and a bounded FIFO queue
+in front of it. A request that finds the queue full, or that waits past its
+deadline, is rejected with `Overloaded` (served as a 429 with Retry-After),
+so one traffic spike on one agent can't use up the upstream rate limits of
+all the others.
+
+Limits default to AGENT_MAX_CONCURRENCY / AGENT_MAX_QUEUE /
+AGENT_QUEUE_TIMEOUT_SECONDS and can be set per agent name, e.g.
+EVENT_PLANNER_MAX_CONCURRENCY=4 for "event-planner".
+"""
+import asyncio
+import contextlib
+import math
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+# Model runs in flight per agent
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "8"))
+# Requests waiting per agent; beyond this they are rejected right away
+AGENT_MAX_QUEUE = int(os.getenv("AGENT_MAX_QUEUE", "32"))
+# How long a request may wait for a slot
+AGENT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("AGENT_QUEUE_TIMEOUT_SECONDS", "10"))
+
+
+def _agent_setting(agent: str, setting: str, default: str) -> str:
+    return os.getenv(f"{agent.upper().replace('-', '_')}_{setting}", default)
+
+
+class Overloaded(Exception):
+    """The agent has no free slot and no room (or time) left in its queue."""
+
+    def __init__(self, agent: str, reason: str, retry_after: int):
+        super().__init__(f"Agent '{agent}' is overloaded ({reason}), retry after {retry_after}s")
+        self.agent = agent
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Slot:
+    """A held run slot; release() is idempotent."""
+
+    def __init__(self, limiter: "AgentLimiter"):
+        self._limiter = limiter
+        self._start = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._limiter._release(time.monotonic() - self._start)
+
+
+class AgentLimiter:
+    """Concurrency limit plus a bounded, deadline-aware wait queue for one agent."""
+
+    def __init__(self, name: str, max_concurrency: int = AGENT_MAX_CONCURRENCY,
+                 max_queue: int = AGENT_MAX_QUEUE, queue_timeout: float = AGENT_QUEUE_TIMEOUT_SECONDS):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        # Moving average of how long a run holds its slot, for Retry-After
+        self.avg_run_seconds = 1.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new request has likely drained."""
+        rounds = (self.queued + 1) / self.max_concurrency
+        return max(1, math.ceil(rounds * self.avg_run_seconds))
+
+    async def acquire(self) -> Slot:
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return Slot(self)
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.name, "queue full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self._release(None)
+            else:
+                waiter.cancel()
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.timed_out += 1
+            self.rejected += 1
+            raise Overloaded(self.name, f"waited {self.queue_timeout:g}s", self.retry_after()) from None
+        waited = time.monotonic() - start
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.admitted += 1
+        return Slot(self)
+
+    def _release(self, held_seconds: Optional[float]) -> None:
+        if held_seconds is not None:
+            self.avg_run_seconds += 0.2 * (held_seconds - self.avg_run_seconds)
+        # Hand the slot straight to the oldest waiter, so it can't be overtaken
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_avg_ms": self.wait_seconds_total / self.admitted * 1000 if self.admitted else 0.0,
+            "wait_max_ms": self.wait_seconds_max * 1000,
+            "run_avg_ms": self.avg_run_seconds * 1000,
+        }
+
+
+class AdmissionController:
+    """One AgentLimiter per agent name, created on first use."""
+
+    def __init__(self, enabled: bool = ADMISSION_ENABLED):
+        self.enabled = enabled
+        self._limiters: Dict[str, AgentLimiter] = {}
+
+    def configure(self, agent: str, **limits: Any) -> AgentLimiter:
+        """Set the limits of `agent` explicitly (instead of from the environment)."""
+        self._limiters[agent] = AgentLimiter(agent, **limits)
+        return self._limiters[agent]
+
+    def limiter(self, agent: str) -> AgentLimiter:
+        limiter = self._limiters.get(agent)
+        if limiter is None:
+            limiter = AgentLimiter(
+                agent,
+                max_concurrency=int(_agent_setting(agent, "MAX_CONCURRENCY", str(AGENT_MAX_CONCURRENCY))),
+                max_queue=int(_agent_setting(agent, "MAX_QUEUE", str(AGENT_MAX_QUEUE))),
+                queue_timeout=float(_agent_setting(agent, "QUEUE_TIMEOUT_SECONDS", str(AGENT_QUEUE_TIMEOUT_SECONDS))),
+            )
+            self._limiters[agent] = limiter
+        return limiter
+
+    async def acquire(self, agent: str) -> Optional[Slot]:
+        """Wait for a run slot of `agent`; raises Overloaded. None when admission is disabled."""
+        if not self.enabled:
+            return None
+        return await self.limiter(agent).acquire()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, agent: str) -> AsyncIterator[None]:
+        slot = await self.acquire(agent)
+        try:
+            yield
+        finally:
+            if slot:
+                slot.release()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
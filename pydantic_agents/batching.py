@@ -0,0 +1,47 @@
+"""
+Bounded-concurrency helpers for the batch endpoints.
+"""
+import asyncio
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Sequence, Tuple
+
+# Default and maximum number of nudges generated at the same time per batch
+NUDGE_BATCH_MAX_CONCURRENCY = int(os.getenv("NUDGE_BATCH_MAX_CONCURRENCY", "8"))
+# Largest batch accepted in one request
+NUDGE_BATCH_MAX_ITEMS = int(os.getenv("NUDGE_BATCH_MAX_ITEMS", "500"))
+
+
+async def map_concurrent(
+    func: Callable[[Any], Awaitable[Any]],
+    items: Sequence[Any],
+    max_concurrency: int,
+) -> AsyncIterator[Tuple[int, Any, Optional[BaseException]]]:
+    """
+    Run `func(item)` for every item with at most `max_concurrency` in flight.
+
+    Yields `(index, result, error)` in completion order; a failing item yields
+    its exception as `error` instead of stopping the others. Closing the
+    generator early cancels the calls that are still running.
+    """
+    if not items:
+        return
+    results: asyncio.Queue = asyncio.Queue()
+    next_index = iter(range(len(items)))
+
+    async def worker():
+        for index in next_index:
+            try:
+                results.put_nowait((index, await func(items[index]), None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                results.put_nowait((index, None, e))
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(max_concurrency, len(items))))]
+    try:
+        for _ in range(len(items)):
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
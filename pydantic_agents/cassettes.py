@@ -0,0 +1,309 @@
+"""
+Record and replay the model and MCP HTTP traffic, for offline load tests.
+
+With CASSETTE_MODE=record every request to a model upstream or an MCP
+server is sent as usual, and its response is appended to a cassette
+(CASSETTE_DIR/<upstream>.jsonl) chunk by chunk, with the time each chunk
+arrived. With CASSETTE_MODE=replay nothing goes over the network: responses
+come from the cassettes, streamed with the recorded timing divided by
+CASSETTE_SPEED (0 replays without delays). Streaming deltas, GLM thinking
+parts and tool calls are replayed as recorded, since the bytes are.
+
+A request replays the recording of the same request if there is one.
+Otherwise it replays a recording of the same kind of request, taken in turn:
+- for a model call, the same model at the same step of a turn (messages
+  after the last user message), streamed or not
+- for an MCP request, the same method and tool
+
+So a load test can send prompts that were never recorded. JSON-RPC ids in
+replayed MCP responses are rewritten to the request's.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+# "record" or "replay" (off when empty)
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "").lower()
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", "cassettes")
+# Replay this many times faster than recorded (0: no delays)
+CASSETTE_SPEED = float(os.getenv("CASSETTE_SPEED", "1"))
+
+
+class CassetteMiss(Exception):
+    """Replay found no recording for a request."""
+
+
+def _request_keys(request: httpx.Request) -> Tuple[str, str, Optional[Any]]:
+    """Exact key, fallback key and JSON-RPC id of a request."""
+    # Not the host: a cassette holds one upstream, wherever it was recorded
+    prefix = f"{request.method} {request.url.path}"
+    try:
+        body = json.loads(request.content) if request.content else None
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        return f"{prefix} {hashlib.sha1(request.content).hexdigest()}", prefix, None
+
+    rpc_id = body.pop("id", None) if "jsonrpc" in body else None
+    exact = f"{prefix} {hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()}"
+    if "jsonrpc" in body:
+        tool = (body.get("params") or {}).get("name", "")
+        return exact, f"{prefix} {body.get('method')} {tool}".rstrip(), rpc_id
+    messages = body.get("messages") or []
+    last_user = max((i for i, m in enumerate(messages) if isinstance(m, dict) and m.get("role") == "user"),
+                    default=-1)
+    stream = " stream" if body.get("stream") else ""
+    return exact, f"{prefix} {body.get('model')} step={len(messages) - last_user - 1}{stream}", None
+
+
+def _rewrite_rpc_id(data: bytes, recorded: Any, current: Any) -> bytes:
+    """Give the JSON-RPC responses in `data` (JSON or SSE lines) the current request id."""
+    lines = data.split(b"\n")
+    for i, line in enumerate(lines):
+        head, payload = (b"data: ", line[6:]) if line.startswith(b"data: ") else (b"", line)
+        if b'"id"' not in payload:
+            continue
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            continue
+        if isinstance(message, dict) and message.get("id") == recorded:
+            message["id"] = current
+            lines[i] = head + json.dumps(message, separators=(",", ":")).encode()
+    return b"\n".join(lines)
+
+
+def _encode(data: bytes) -> List[str]:
+    try:
+        return [data.decode("utf-8")]
+    except UnicodeDecodeError:
+        return [base64.b64encode(data).decode("ascii"), "b64"]
+
+
+def _decode(chunk: List) -> Tuple[float, bytes]:
+    offset, data = chunk[0], chunk[1]
+    return offset, base64.b64decode(data) if chunk[2:] == ["b64"] else data.encode("utf-8")
+
+
+class Cassette:
+    """The recorded exchanges of one upstream, in one JSONL file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._exact: Optional[Dict[str, List[dict]]] = None
+        self._similar: Dict[str, List[dict]] = {}
+        self._turns: Dict[str, int] = {}
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+    def append(self, entry: dict) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.recorded += 1
+        except OSError as e:
+            print(f"[CASSETTE] Could not write {self.path}: {e}")
+
+    def _load(self) -> None:
+        self._exact = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            print(f"[CASSETTE] No cassette at {self.path}")
+            entries = []
+        for entry in entries:
+            self._exact.setdefault(entry["key"], []).append(entry)
+            self._similar.setdefault(entry["similar"], []).append(entry)
+        print(f"[CASSETTE] Loaded {len(entries)} exchanges from {self.path}")
+
+    def find(self, key: str, similar: str) -> Optional[dict]:
+        """The next recording of this request, or else of a similar one."""
+        if self._exact is None:
+            self._load()
+        for index, lookup in (("=" + key, self._exact.get(key)), ("~" + similar, self._similar.get(similar))):
+            if lookup:
+                turn = self._turns.get(index, 0)
+                self._turns[index] = turn + 1
+                return lookup[turn % len(lookup)]
+        return None
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """Passes a response body through, noting when each chunk arrived."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, start: float, on_complete):
+        self._stream = stream
+        self._start = start
+        self._on_complete = on_complete
+        self._chunks: List[List] = []
+        self._reading = False
+        self._done = False
+
+    async def __aiter__(self):
+        self._reading = True
+        async for chunk in self._stream:
+            self._chunks.append([round(time.perf_counter() - self._start, 4), *_encode(chunk)])
+            yield chunk
+        self._reading = False
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+        if not self._done:
+            self._done = True
+            # Still reading: the client stopped before the end of the body
+            self._on_complete(self._chunks, cut_off=self._reading)
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """Yields recorded chunks at their recorded offsets from the request start."""
+
+    def __init__(self, chunks: List[Tuple[float, bytes]], start: float, speed: float):
+        self._chunks = chunks
+        self._start = start
+        self._speed = speed
+
+    async def __aiter__(self):
+        for offset, data in self._chunks:
+            if self._speed > 0:
+                delay = self._start + offset / self._speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield data
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that records the exchanges of `transport` to a cassette,
+    or replays them from it without using `transport`.
+
+    Only POSTs are recorded; in replay other requests (the MCP session's GET
+    stream and DELETE, connection pre-warming) are answered with a 405.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, cassette: Cassette, mode: str,
+                 speed: float = CASSETTE_SPEED):
+        self._transport = transport
+        self.cassette = cassette
+        self.mode = mode
+        self.speed = speed
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        await request.aread()
+        if self.mode == "replay":
+            return await self._replay(request, start)
+        # Uncompressed, so cassettes can be read and replayed ids rewritten
+        request.headers["Accept-Encoding"] = "identity"
+        response = await self._transport.handle_async_request(request)
+        if request.method != "POST":
+            return response
+        key, similar, rpc_id = _request_keys(request)
+        headers_at = round(time.perf_counter() - start, 4)
+
+        def complete(chunks, cut_off: bool):
+            # The MCP client stops reading once it has its JSON-RPC response;
+            # a model stream cut off (e.g. by a client disconnect) is not recorded
+            if cut_off and rpc_id is None:
+                return
+            self.cassette.append({
+                "key": key, "similar": similar, "rpc_id": rpc_id, "url": str(request.url),
+                "status": response.status_code, "headers": response.headers.multi_items(),
+                "headers_at": headers_at, "chunks": chunks,
+            })
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_RecordingStream(response.stream, start, complete),
+                              extensions=response.extensions)
+
+    async def _replay(self, request: httpx.Request, start: float) -> httpx.Response:
+        if request.method != "POST":
+            return httpx.Response(405, request=request)
+        key, similar, rpc_id = _request_keys(request)
+        entry = self.cassette.find(key, similar)
+        if entry is None:
+            self.cassette.misses += 1
+            # Logged here too: the model SDKs report it as a connection error
+            print(f"[CASSETTE] No recording in {self.cassette.path} for {similar}")
+            raise CassetteMiss(f"No recording in {self.cassette.path} for {similar}")
+        self.cassette.replayed += 1
+        chunks = [_decode(chunk) for chunk in entry["chunks"]]
+        if rpc_id is not None and entry["rpc_id"] is not None and rpc_id != entry["rpc_id"]:
+            chunks = [(offset, _rewrite_rpc_id(data, entry["rpc_id"], rpc_id)) for offset, data in chunks]
+        if self.speed > 0:
+            await asyncio.sleep(max(0.0, entry["headers_at"] / self.speed - (time.perf_counter() - start)))
+        # The body is no longer the recorded length once ids are rewritten
+        headers = [(k, v) for k, v in entry["headers"] if k.lower() != "content-length"]
+        return httpx.Response(entry["status"], headers=headers, stream=_ReplayStream(chunks, start, self.speed),
+                              request=request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class CassetteLibrary:
+    """The cassettes of every upstream, and the transports that use them."""
+
+    def __init__(self, mode: str = CASSETTE_MODE, directory: str = CASSETTE_DIR, speed: float = CASSETTE_SPEED):
+        if mode not in ("", "off", "record", "replay"):
+            print(f"[CASSETTE] Unknown CASSETTE_MODE={mode!r}, cassettes are off")
+            mode = ""
+        self.mode = "" if mode == "off" else mode
+        self.directory = directory
+        self.speed = speed
+        self._cassettes: Dict[str, Cassette] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.mode)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def cassette(self, name: str) -> Cassette:
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "-", name).strip("-")
+        if name not in self._cassettes:
+            self._cassettes[name] = Cassette(os.path.join(self.directory, f"{name}.jsonl"))
+        return self._cassettes[name]
+
+    def wrap(self, transport: httpx.AsyncBaseTransport, name: str) -> httpx.AsyncBaseTransport:
+        """`transport`, recorded to or replayed from cassette `name` when cassettes are on."""
+        if not self.enabled:
+            return transport
+        return CassetteTransport(transport, self.cassette(name), self.mode, self.speed)
+
+    def mcp_client_factory(self, url: str):
+        """An httpx client factory for the MCP client of `url` (None when cassettes are off)."""
+        if not self.enabled:
+            return None
+        parsed = httpx.URL(url)
+        name = f"mcp-{parsed.host}-{parsed.port or ''}{parsed.path}"
+
+        def factory(headers=None, timeout=None, auth=None) -> httpx.AsyncClient:
+            # A new client per session: the MCP client closes it with the session
+            return httpx.AsyncClient(headers=headers, timeout=timeout or httpx.Timeout(30.0), auth=auth,
+                                     follow_redirects=True,
+                                     transport=self.wrap(httpx.AsyncHTTPTransport(), name))
+        return factory
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode or "off",
+            "cassettes": {
+                name: {"recorded": c.recorded, "replayed": c.replayed, "misses": c.misses}
+                for name, c in self._cassettes.items()
+            },
+        }
+
+
+# Shared by the model providers and the MCP pool
+cassettes = CassetteLibrary()
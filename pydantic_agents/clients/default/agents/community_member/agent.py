@@ -8,10 +8,13 @@ and buddy match conversations following VREDE methodology.
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent
 
+from pydantic_agents.providers import providers
+from pydantic_agents.structured import run_structured
+
 
 class PulseResponse(BaseModel):
     """A Pulse B reflection response"""
-    text: str = Field(..., description="Short, authentic reflection (max 150 chars)")
+    text: str = Field(..., min_length=1, max_length=200, description="Short, authentic reflection (max 150 chars)")
     tone: str = Field(..., description="Emotional tone: warm, vulnerable, hopeful, peaceful")
 
 
@@ -51,12 +54,12 @@ Je bent NIET een therapeut. Je deelt gewone, menselijke ervaringen.
 
 # Create the agent (using Mistral for cost-effective generation)
 community_member = Agent(
-    "mistral:mistral-medium-2508",  # Mistral medium model
+    providers.model("mistral:mistral-medium-2508"),  # Mistral medium model
     system_prompt=SYSTEM_PROMPT,
 )
 
 buddy_matcher = Agent(
-    "mistral:mistral-medium-2508",
+    providers.model("mistral:mistral-medium-2508"),
     system_prompt=SYSTEM_PROMPT,
 )
 
@@ -88,53 +91,12 @@ Vraag: "{ritual_question}"
 
 Deel je ervaring van deze week in 1 korte zin (max 150 karakters).
 Wees eerlijk en concreet. Focus op iets kleins en menselijks.
-
-Antwoord in JSON format:
-{{
-  "text": "je reflectie in 1 zin",
-  "tone": "warm/vulnerable/hopeful/peaceful"
-}}
+Kies als toon: warm, vulnerable, hopeful of peaceful.
 """
 
-        result = await community_member.run(prompt)
-
-        # Try to parse JSON from the response
-        import json
-        import re
-        response_text = str(result.output) if hasattr(result, 'output') else str(result)
-
-        # Try to extract JSON from markdown code blocks
-        if "```json" in response_text:
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```', response_text)
-            if json_match:
-                response_text = json_match.group(1).strip()
-
-        try:
-            # Ensure proper UTF-8 encoding
-            if isinstance(response_text, bytes):
-                response_text = response_text.decode('utf-8', errors='replace')
-
-            parsed = json.loads(response_text)
-            # Extract just the text and tone values from the parsed JSON
-            text = parsed.get("text", response_text)
-            tone = parsed.get("tone", "warm")
-
-            # Clean up any remaining encoding issues
-            if isinstance(text, str):
-                text = text.encode('latin1', errors='ignore').decode('utf-8', errors='replace')
-
-            return {"text": text, "tone": tone}
-        except Exception as e:
-            print(f"[AGENT] Failed to parse JSON: {e}")
-            print(f"[AGENT] Raw response: {response_text}")
-            # Fallback: return simple structure, clean encoding
-            clean_text = response_text
-            if isinstance(clean_text, str):
-                try:
-                    clean_text = clean_text.encode('latin1', errors='ignore').decode('utf-8', errors='replace')
-                except:
-                    pass
-            return {"text": clean_text, "tone": "warm"}
+        # Validated while it streams; a bad output is retried instead of returned
+        response = await run_structured(community_member, prompt, PulseResponse)
+        return {"text": response.text.strip(), "tone": response.tone.strip().lower()}
 
     @staticmethod
     async def generate_buddy_message(
@@ -1,10 +1,13 @@
 from pydantic_ai import Agent
-from pydantic_ai.mcp import MCPServerStreamableHTTP
+from pydantic_agents.mcp_pool import mcp_pool
+from pydantic_agents.providers import providers
+from pydantic_agents.resilience import AGENT_RETRIES
+from pydantic_agents.tool_cache import cached
 from pathlib import Path
 import os
 
 DEFAULT_MCP_URL = os.getenv("EVENT_CONTRACT_ASSISTANT_MCP_URL", "https://mcp.context7.com/mcp")
-MODEL_NAME = "openai:zai-org/GLM-4.5"
+MODEL_NAME = "deepinfra:zai-org/GLM-4.5"
 
 def _load_system_prompt() -> str:
     """Load system prompt from markdown file."""
@@ -17,17 +20,15 @@ def build_event_contract_assistant_agent():
     if not api_key:
         raise RuntimeError("DEEPINFRA_API_KEY must be set to initialize the event contract assistant agent")
 
-    os.environ["OPENAI_API_KEY"] = api_key
-    os.environ["OPENAI_BASE_URL"] = "https://api.deepinfra.com/v1/openai"
-
     system_prompt = _load_system_prompt()
-    mcp_server = MCPServerStreamableHTTP(DEFAULT_MCP_URL)
+    mcp_server = mcp_pool.server(DEFAULT_MCP_URL)
 
     return Agent(
-        model=MODEL_NAME,
-        toolsets=[mcp_server],
-        system_prompt=system_prompt,
-        retries=20
+        model=providers.model(MODEL_NAME),
+        toolsets=[cached(mcp_server)],
+        # Instructions are sent on every run, also when there is message history
+        instructions=system_prompt,
+        retries=AGENT_RETRIES
     )
 
 class EventContractAssistantAgent:
@@ -36,6 +37,7 @@ class EventContractAssistantAgent:
         self.name = "event-contract-assistant"
         self.description = "Event contract specialist"
         self.agent = None
+        self.history_token_budget = int(os.getenv("EVENT_CONTRACT_ASSISTANT_HISTORY_TOKENS", "12000"))
 
     async def initialize(self):
         self.agent = build_event_contract_assistant_agent()
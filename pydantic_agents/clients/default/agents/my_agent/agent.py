@@ -1,5 +1,8 @@
 from pydantic_ai import Agent
-from pydantic_ai.mcp import MCPServerStreamableHTTP
+from pydantic_agents.mcp_pool import mcp_pool
+from pydantic_agents.providers import providers
+from pydantic_agents.resilience import AGENT_RETRIES
+from pydantic_agents.tool_cache import cached
 from pathlib import Path
 import os
 
@@ -7,7 +10,7 @@ import os
 DEFAULT_MCP_URL = os.getenv("MY_AGENT_MCP_URL", "https://mcp.context7.com/mcp")
 
 # Model configuratie - GLM-4.5 via DeepInfra
-MODEL_NAME = "openai:zai-org/GLM-4.5"
+MODEL_NAME = "deepinfra:zai-org/GLM-4.5"
 
 def _load_system_prompt() -> str:
     """Load system prompt from markdown file."""
@@ -21,20 +24,18 @@ def build_my_agent():
     if not api_key:
         raise RuntimeError("DEEPINFRA_API_KEY must be set to initialize the agent")
 
-    os.environ["OPENAI_API_KEY"] = api_key
-    os.environ["OPENAI_BASE_URL"] = "https://api.deepinfra.com/v1/openai"
-
     system_prompt = _load_system_prompt()
 
-    # Configureer MCP server (Context7)
-    mcp_server = MCPServerStreamableHTTP(DEFAULT_MCP_URL)
+    # Gedeelde MCP server (Context7) uit de sessiepool
+    mcp_server = mcp_pool.server(DEFAULT_MCP_URL)
 
     # Creëer agent met DeepInfra GLM-4.5
     return Agent(
-        model=MODEL_NAME,
-        toolsets=[mcp_server],  # MCP tools enabled with Context7
-        system_prompt=system_prompt,
-        retries=20
+        model=providers.model(MODEL_NAME),
+        toolsets=[cached(mcp_server)],  # MCP tools enabled with Context7
+        # Instructions are sent on every run, also when there is message history
+        instructions=system_prompt,
+        retries=AGENT_RETRIES
     )
 
 class MyAgent:
@@ -42,6 +43,7 @@ class MyAgent:
     def __init__(self):
         self.name = "MyAgent"
         self.agent = None
+        self.history_token_budget = int(os.getenv("MY_AGENT_HISTORY_TOKENS", "8000"))
 
     async def initialize(self):
         self.agent = build_my_agent()
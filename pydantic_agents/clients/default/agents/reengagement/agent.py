@@ -8,11 +8,14 @@ inactive members back into the community without guilt or pressure.
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent
 
+from pydantic_agents.providers import providers
+from pydantic_agents.structured import run_structured
+
 
 class ReengagementMessage(BaseModel):
     """A warm re-engagement message"""
-    subject: str = Field(..., description="Email/SMS subject line")
-    message: str = Field(..., description="Body of the message (max 200 chars for SMS)")
+    subject: str = Field(..., min_length=1, max_length=150, description="Email/SMS subject line")
+    message: str = Field(..., min_length=1, max_length=300, description="Body of the message (max 200 chars for SMS)")
     tone: str = Field(..., description="Emotional tone: warm, inviting, curious, gentle")
     urgency_level: str = Field(..., description="low, medium, high based on inactivity days")
 
@@ -63,7 +66,7 @@ Je bent NIET een commerciële app. Je bent een menselijke stem die iemand mist.
 
 # Create the re-engagement agent (using Mistral for cost-effective generation)
 reengagement_agent = Agent(
-    "mistral:mistral-medium-2508",
+    providers.model("mistral:mistral-medium-2508"),
     system_prompt=SYSTEM_PROMPT,
 )
 
@@ -118,67 +121,19 @@ Maak een {tier} boodschap die:
 3. Een concrete, lichte uitnodiging geeft
 4. VREDE-principes volgt
 
-Geef je antwoord in JSON format:
-{{
-  "subject": "onderwerpregel (voor email/WhatsApp)",
-  "message": "bericht max 150-200 karakters",
-  "tone": "warm/inviting/curious/gentle",
-  "urgency_level": "{urgency}"
-}}
+Gebruik als toon: warm, inviting, curious of gentle, en als urgency_level: {urgency}.
 """
 
-        result = await reengagement_agent.run(prompt)
-
-        # Try to parse JSON from the response
-        import json
-        import re
-        response_text = str(result.output) if hasattr(result, 'output') else str(result)
-
-        # Try to extract JSON from markdown code blocks
-        if "```json" in response_text:
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```', response_text)
-            if json_match:
-                response_text = json_match.group(1).strip()
-
-        try:
-            # Ensure proper UTF-8 encoding
-            if isinstance(response_text, bytes):
-                response_text = response_text.decode('utf-8', errors='replace')
-
-            parsed = json.loads(response_text)
-
-            # Extract fields
-            subject = parsed.get("subject", "We missen je in de cirkel")
-            message = parsed.get("message", response_text)
-            tone = parsed.get("tone", "warm")
-            urgency_level = parsed.get("urgency_level", urgency)
-
-            # Clean up encoding issues
-            if isinstance(message, str):
-                message = message.encode('latin1', errors='ignore').decode('utf-8', errors='replace')
-            if isinstance(subject, str):
-                subject = subject.encode('latin1', errors='ignore').decode('utf-8', errors='replace')
-
-            return {
-                "subject": subject,
-                "message": message,
-                "tone": tone,
-                "urgency_level": urgency_level,
-                "days_inactive": days_inactive,
-                "tier": tier,
-            }
-        except Exception as e:
-            print(f"[REENGAGEMENT] Failed to parse JSON: {e}")
-            print(f"[REENGAGEMENT] Raw response: {response_text}")
-            # Fallback: return simple structure
-            return {
-                "subject": "We missen je in de cirkel",
-                "message": response_text[:200] if len(response_text) > 200 else response_text,
-                "tone": "warm",
-                "urgency_level": urgency,
-                "days_inactive": days_inactive,
-                "tier": tier,
-            }
+        # Validated while it streams; a bad output is retried instead of returned
+        nudge = await run_structured(reengagement_agent, prompt, ReengagementMessage)
+        return {
+            "subject": nudge.subject.strip(),
+            "message": nudge.message.strip(),
+            "tone": nudge.tone.strip().lower(),
+            "urgency_level": nudge.urgency_level.strip().lower() or urgency,
+            "days_inactive": days_inactive,
+            "tier": tier,
+        }
 
     @staticmethod
     async def generate_buddy_nudge(
@@ -214,11 +169,7 @@ Geef alleen de boodschap terug (geen JSON), alsof je een WhatsApp stuurt.
 """
 
         result = await reengagement_agent.run(prompt)
-        response_text = str(result.output) if hasattr(result, 'output') else str(result)
-
-        # Clean up encoding
-        if isinstance(response_text, str):
-            response_text = response_text.encode('latin1', errors='ignore').decode('utf-8', errors='replace')
+        response_text = str(result.output)
 
         return {
             "buddy_name": buddy_name,
@@ -0,0 +1,85 @@
+"""
+Single-flight coalescing of identical in-flight generations.
+
+Bursty frontends can send the same request several times at once (a double
+submit, or one route firing for every member of a ritual). Requests with the
+same key share one upstream call: the first starts it, the others wait for
+it, and all of them get its result or its error.
+"""
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1") == "1"
+
+
+def coalesce_key(agent: str, **inputs: Any) -> str:
+    """Key for a generation: the agent plus its inputs, independent of order and outer whitespace."""
+    canonical = {name: value.strip() if isinstance(value, str) else value for name, value in inputs.items()}
+    return json.dumps([agent, canonical], sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Shares one call among concurrent callers with the same key.
+
+    The call runs in its own task, so a caller that disconnects does not
+    cancel it for the others; it is cancelled only when every caller waiting
+    on it has gone. Results are not kept once the call finishes.
+    """
+
+    def __init__(self, enabled: bool = COALESCE_ENABLED):
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]], coalesce: bool = True) -> Any:
+        """Return the result of `func()`, shared with identical calls already in flight."""
+        if not self.enabled or not coalesce:
+            return await func()
+
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Last one waiting: nobody needs the result any more
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # Mark a failure as retrieved even if every waiter has gone
+            flight.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.calls + self.coalesced
+        return {
+            "in_flight": len(self._flights),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / total if total else 0.0,
+        }
@@ -0,0 +1,230 @@
+"""
+Latency-hedged model requests.
+
+When hedging is on, models built by `providers.model()` that have a fallback
+configured are wrapped in a `HedgedModel`. A request first goes to the
+primary model; if it hasn't answered by the configured latency percentile of
+that endpoint, the same request goes to the fallback model as well. The first
+successful answer wins and the other request is cancelled. Streamed requests
+are hedged the same way on the time until the stream opens (its first chunk).
+
+Only requests made while an endpoint is set in `hedge_endpoint` are hedged
+(the non-streaming endpoints set it, /chat/stream doesn't), and each endpoint may hedge at most a
+fraction of its requests, so an outage can't double the cost.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from pydantic_ai.models.wrapper import WrapperModel
+
+from pydantic_agents.resilience import RetryBudget
+from pydantic_agents.tool_cache import parse_ttls
+
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "0") == "1"
+# Fallback model per primary model, as "primary=fallback,..."
+HEDGE_FALLBACKS = os.getenv(
+    "HEDGE_FALLBACKS",
+    "deepinfra:zai-org/GLM-4.5=mistral:mistral-medium-2508,mistral:mistral-medium-2508=mistral:mistral-small-2506",
+)
+# Hedge once the primary is slower than this percentile of its recent latencies
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+# Latencies kept per endpoint and model, and how many are needed before the percentile is used
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Hedge delay until there are enough samples, and the lower bound afterwards
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "10"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.5"))
+# Fraction of each endpoint's requests that may be hedged, as "endpoint=ratio,..."
+HEDGE_BUDGETS = os.getenv("HEDGE_BUDGETS", "chat=0.05,pulse=0.1,nudge=0.1,buddy-nudge=0.1")
+HEDGE_BUDGET_WINDOW_SECONDS = float(os.getenv("HEDGE_BUDGET_WINDOW_SECONDS", "60"))
+
+# Endpoint of the current request; model requests without one are never hedged
+hedge_endpoint: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("hedge_endpoint", default=None)
+
+
+def parse_fallbacks(spec: str) -> Dict[str, str]:
+    fallbacks = {}
+    for item in spec.split(","):
+        if "=" in item:
+            primary, fallback = item.split("=", 1)
+            fallbacks[primary.strip()] = fallback.strip()
+    return fallbacks
+
+
+class LatencyTracker:
+    """Recent primary latencies of one endpoint and model."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def delay(self, percentile: float = HEDGE_PERCENTILE) -> float:
+        if len(self._samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_SECONDS
+        values = sorted(self._samples)
+        index = min(len(values) - 1, int(round(percentile / 100 * (len(values) - 1))))
+        return max(HEDGE_MIN_DELAY_SECONDS, values[index])
+
+
+class Hedger:
+    """Runs a primary call and, past the hedge delay and within budget, a fallback call."""
+
+    def __init__(self, budgets: Optional[Dict[str, float]] = None, percentile: float = HEDGE_PERCENTILE):
+        self.budgets = parse_ttls(HEDGE_BUDGETS) if budgets is None else budgets
+        self.percentile = percentile
+        self._trackers: Dict[str, LatencyTracker] = {}
+        # A hedge is spent from the endpoint's budget like a retry
+        self._budgets: Dict[str, RetryBudget] = {}
+        self.endpoint_stats: Dict[str, Dict[str, int]] = {}
+
+    def _budget(self, endpoint: str) -> Optional[RetryBudget]:
+        ratio = self.budgets.get(endpoint, 0)
+        if ratio <= 0:
+            return None
+        if endpoint not in self._budgets:
+            self._budgets[endpoint] = RetryBudget(ratio=ratio, min_per_second=0, window=HEDGE_BUDGET_WINDOW_SECONDS)
+        return self._budgets[endpoint]
+
+    def tracker(self, endpoint: str, model_name: str) -> LatencyTracker:
+        key = f"{endpoint}:{model_name}"
+        if key not in self._trackers:
+            self._trackers[key] = LatencyTracker()
+        return self._trackers[key]
+
+    async def run(self, endpoint: str, model_name: str,
+                  primary: Callable[[], Awaitable[Any]], fallback: Callable[[], Awaitable[Any]]) -> Any:
+        counts = self.endpoint_stats.setdefault(
+            endpoint, {"requests": 0, "hedged": 0, "fallback_wins": 0, "budget_exhausted": 0}
+        )
+        counts["requests"] += 1
+        budget = self._budget(endpoint)
+        tracker = self.tracker(endpoint, model_name)
+        if budget is None:
+            return await primary()
+        budget.record_request()
+
+        start = time.monotonic()
+        primary_task = asyncio.ensure_future(primary())
+        primary_task.add_done_callback(lambda _: tracker.record(time.monotonic() - start))
+        fallback_task = None
+        try:
+            done, _ = await asyncio.wait([primary_task], timeout=tracker.delay(self.percentile))
+            if done:
+                return primary_task.result()
+            if not budget.try_retry():
+                counts["budget_exhausted"] += 1
+                return await primary_task
+
+            counts["hedged"] += 1
+            fallback_task = asyncio.ensure_future(fallback())
+            pending = {primary_task, fallback_task}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is fallback_task:
+                            counts["fallback_wins"] += 1
+                        return task.result()
+            # Both failed: report the primary's error
+            return primary_task.result()
+        finally:
+            # The loser (or both, if we were cancelled) stops here
+            for task in (primary_task, fallback_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "endpoints": {name: dict(counts) for name, counts in self.endpoint_stats.items()},
+            "delays_ms": {key: tracker.delay(self.percentile) * 1000 for key, tracker in self._trackers.items()},
+        }
+
+
+async def _open_stream(stream_context, release: asyncio.Event, holders: List[asyncio.Task]):
+    """
+    Enter `stream_context` in a holder task that keeps it open until `release`
+    is set, and return `(stream, holder)` once the stream has opened.
+    """
+    opened = asyncio.get_running_loop().create_future()
+
+    async def hold():
+        try:
+            async with stream_context as stream:
+                if not opened.done():
+                    opened.set_result(stream)
+                await release.wait()
+        except BaseException as e:
+            if not opened.done():
+                opened.set_exception(e)
+            raise
+
+    holder = asyncio.ensure_future(hold())
+    holders.append(holder)
+    try:
+        return await opened, holder
+    except asyncio.CancelledError:
+        holder.cancel()
+        raise
+
+
+class HedgedModel(WrapperModel):
+    """Model that hedges slow requests with a fallback model."""
+
+    def __init__(self, primary, fallback, hedger: Hedger):
+        super().__init__(primary)
+        self.fallback = fallback
+        self.hedger = hedger
+
+    async def request(self, messages, model_settings, model_request_parameters):
+        endpoint = hedge_endpoint.get()
+        if endpoint is None:
+            return await self.wrapped.request(messages, model_settings, model_request_parameters)
+        return await self.hedger.run(
+            endpoint, self.wrapped.model_name,
+            lambda: self.wrapped.request(messages, model_settings, model_request_parameters),
+            lambda: self.fallback.request(messages, model_settings, model_request_parameters),
+        )
+
+    @asynccontextmanager
+    async def request_stream(self, messages, model_settings, model_request_parameters, run_context=None):
+        endpoint = hedge_endpoint.get()
+        if endpoint is None:
+            async with self.wrapped.request_stream(
+                messages, model_settings, model_request_parameters, run_context
+            ) as stream:
+                yield stream
+            return
+
+        release = asyncio.Event()
+        holders: List[asyncio.Task] = []
+
+        def opener(model):
+            return lambda: _open_stream(
+                model.request_stream(messages, model_settings, model_request_parameters, run_context),
+                release, holders,
+            )
+
+        winner = None
+        try:
+            stream, winner = await self.hedger.run(
+                endpoint, f"{self.wrapped.model_name} (stream)", opener(self.wrapped), opener(self.fallback)
+            )
+            yield stream
+        finally:
+            # The winner's stream closes normally, the loser's is cancelled
+            release.set()
+            for holder in holders:
+                if holder is not winner:
+                    holder.cancel()
+            await asyncio.gather(*holders, return_exceptions=True)
+
+
+# Shared by all hedged models
+hedger = Hedger()
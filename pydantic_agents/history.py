@@ -0,0 +1,299 @@
+"""
+Conversation history helpers for the chat endpoints.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pydantic_ai.messages import ModelMessage, ModelRequest, SystemPromptPart
+
+from pydantic_agents.tracing import tracer
+
+# Number of messages kept per conversation (matches the PocketBase page size)
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "500"))
+
+HISTORY_CACHE_MAX_CONVERSATIONS = int(os.getenv("HISTORY_CACHE_MAX_CONVERSATIONS", "1000"))
+# Upper bound on the total message text held by the cache, in characters
+HISTORY_CACHE_MAX_CHARS = int(os.getenv("HISTORY_CACHE_MAX_CHARS", "20000000"))
+# Entries are reloaded from PocketBase after this long, to pick up writes made elsewhere
+HISTORY_CACHE_TTL_SECONDS = float(os.getenv("HISTORY_CACHE_TTL_SECONDS", "900"))
+
+# Default history budget for agents that don't set `history_token_budget`
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+# When the window has to move, keep this fraction of the budget so the next
+# few turns fit without moving it (and re-summarizing) again
+HISTORY_WINDOW_KEEP_RATIO = float(os.getenv("HISTORY_WINDOW_KEEP_RATIO", "0.6"))
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "mistral:mistral-medium-2508")
+
+# Rough characters-per-token ratio, good enough for budgeting
+CHARS_PER_TOKEN = 4
+SUMMARY_PREFIX = "Samenvatting van het eerdere gesprek:\n"
+
+SUMMARY_SYSTEM_PROMPT = """Je vat gesprekken tussen een gebruiker en een assistent samen.
+Houd namen, data, locaties, afspraken, beslissingen en open vragen vast.
+Schrijf beknopt in het Nederlands, maximaal 250 woorden, zonder inleiding."""
+
+
+def message_chars(message: ModelMessage) -> int:
+    """Approximate size of a message as the length of its text content."""
+    size = 0
+    for part in message.parts:
+        content = getattr(part, "content", "")
+        size += len(content) if isinstance(content, str) else len(str(content))
+    return size
+
+
+def estimate_tokens(message: ModelMessage) -> int:
+    return message_chars(message) // CHARS_PER_TOKEN + 4
+
+
+class _Entry:
+    __slots__ = ("messages", "chars", "loaded_at")
+
+    def __init__(self, messages: List[ModelMessage]):
+        self.messages = messages
+        self.chars = sum(message_chars(m) for m in messages)
+        self.loaded_at = time.monotonic()
+
+
+class ConversationHistoryCache:
+    """
+    In-process LRU cache of converted conversation histories.
+
+    Holds the `ModelMessage` list per conversation_id so a turn does not have
+    to refetch and reconvert the whole conversation. New turns are appended in
+    place. Entries expire after a TTL and the least recently used ones are
+    evicted when the conversation count or total text size exceeds its bound.
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = HISTORY_CACHE_MAX_CONVERSATIONS,
+        max_chars: int = HISTORY_CACHE_MAX_CHARS,
+        ttl_seconds: float = HISTORY_CACHE_TTL_SECONDS,
+        max_messages: int = HISTORY_MAX_MESSAGES,
+    ):
+        self.max_conversations = max_conversations
+        self.max_chars = max_chars
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._chars = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, conversation_id: str) -> Optional[List[ModelMessage]]:
+        """Return a copy of the cached history, or None on a miss."""
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        if time.monotonic() - entry.loaded_at > self.ttl_seconds:
+            self._remove(conversation_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(conversation_id)
+        self.hits += 1
+        return list(entry.messages)
+
+    def put(self, conversation_id: str, messages: List[ModelMessage]) -> None:
+        """Store a freshly loaded history."""
+        self._remove(conversation_id)
+        entry = _Entry(list(messages[-self.max_messages:]))
+        self._entries[conversation_id] = entry
+        self._chars += entry.chars
+        self._evict()
+
+    def append(self, conversation_id: str, messages: List[ModelMessage]) -> bool:
+        """
+        Append new turns to a cached history.
+
+        Conversations that are not cached are left alone; the next load
+        fetches them in full. Returns whether the entry was updated.
+        """
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return False
+        entry.messages.extend(messages)
+        added = sum(message_chars(m) for m in messages)
+        entry.chars += added
+        self._chars += added
+        overflow = len(entry.messages) - self.max_messages
+        if overflow > 0:
+            removed = sum(message_chars(m) for m in entry.messages[:overflow])
+            del entry.messages[:overflow]
+            entry.chars -= removed
+            self._chars -= removed
+        self._entries.move_to_end(conversation_id)
+        self._evict()
+        return True
+
+    def invalidate(self, conversation_id: str) -> None:
+        self._remove(conversation_id)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "conversations": len(self._entries),
+            "chars": self._chars,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _remove(self, conversation_id: str) -> None:
+        entry = self._entries.pop(conversation_id, None)
+        if entry is not None:
+            self._chars -= entry.chars
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_conversations or self._chars > self.max_chars
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._chars -= entry.chars
+            self.evictions += 1
+
+
+def _same_message(a: ModelMessage, b: ModelMessage) -> bool:
+    """Compare by kind and content (timestamps differ after a reload)."""
+    return type(a) is type(b) and [getattr(p, "content", None) for p in a.parts] == [
+        getattr(p, "content", None) for p in b.parts
+    ]
+
+
+def _render(messages: List[ModelMessage]) -> str:
+    lines = []
+    for message in messages:
+        role = "Gebruiker" if isinstance(message, ModelRequest) else "Assistent"
+        for part in message.parts:
+            content = getattr(part, "content", None)
+            if isinstance(content, str) and content:
+                lines.append(f"{role}: {content}")
+    return "\n".join(lines)
+
+
+_summary_agent = None
+
+
+async def summarize_with_model(previous_summary: str, messages: List[ModelMessage]) -> str:
+    """Fold `messages` into `previous_summary` with the summary model."""
+    global _summary_agent
+    if _summary_agent is None:
+        from pydantic_ai import Agent
+        from pydantic_agents.providers import providers
+        _summary_agent = Agent(providers.model(HISTORY_SUMMARY_MODEL), system_prompt=SUMMARY_SYSTEM_PROMPT)
+
+    prompt = ""
+    if previous_summary:
+        prompt += f"Bestaande samenvatting:\n{previous_summary}\n\n"
+    prompt += f"Nieuwe berichten om toe te voegen:\n{_render(messages)}\n\nGeef de bijgewerkte samenvatting."
+    result = await _summary_agent.run(prompt)
+    return str(result.output).strip()
+
+
+class _Summary:
+    __slots__ = ("text", "last_message", "index")
+
+    def __init__(self, text: str, last_message: ModelMessage, index: int):
+        self.text = text
+        self.last_message = last_message  # newest message folded into the summary
+        self.index = index  # its position when the summary was made
+
+
+class HistoryCompactor:
+    """
+    Fits a conversation history into a token budget.
+
+    The newest turns are kept verbatim; older turns are folded into a rolling
+    summary that is cached per conversation and only extended, with just the
+    newly dropped turns, when the window has to move.
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[str, List[ModelMessage]], Awaitable[str]] = summarize_with_model,
+        keep_ratio: float = HISTORY_WINDOW_KEEP_RATIO,
+        max_conversations: int = HISTORY_CACHE_MAX_CONVERSATIONS,
+    ):
+        self.summarize = summarize
+        self.keep_ratio = keep_ratio
+        self.max_conversations = max_conversations
+        self._summaries: "OrderedDict[str, _Summary]" = OrderedDict()
+        self.summaries_made = 0
+
+    def _summarized_up_to(self, summary: Optional[_Summary], messages: List[ModelMessage]) -> int:
+        """Number of leading messages already covered by `summary` (0 if it no longer lines up)."""
+        if summary is None:
+            return 0
+        # The cached list keeps message identity; after a reload fall back to content
+        for match in (lambda m: m is summary.last_message, lambda m: _same_message(m, summary.last_message)):
+            if summary.index < len(messages) and match(messages[summary.index]):
+                return summary.index + 1
+            for index in range(min(summary.index, len(messages)) - 1, -1, -1):
+                if match(messages[index]):
+                    return index + 1
+        return 0
+
+    def _cut_for(self, messages: List[ModelMessage], start: int, target: int) -> int:
+        """Oldest index such that messages[index:] fits `target`, starting on a user turn."""
+        used = 0
+        cut = len(messages)
+        for index in range(len(messages) - 1, start - 1, -1):
+            used += estimate_tokens(messages[index])
+            if used > target:
+                break
+            cut = index
+        # Never start the window on an assistant reply
+        while cut < len(messages) and not isinstance(messages[cut], ModelRequest):
+            cut += 1
+        return cut
+
+    async def compact(
+        self,
+        conversation_id: Optional[str],
+        messages: List[ModelMessage],
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+    ) -> List[ModelMessage]:
+        """Return the history to send: optional summary message plus the newest turns."""
+        if not messages:
+            return messages
+
+        summary = self._summaries.get(conversation_id) if conversation_id else None
+        start = self._summarized_up_to(summary, messages)
+        if start == 0:
+            summary = None
+        window = messages[start:]
+        if sum(estimate_tokens(m) for m in window) <= token_budget:
+            if summary is None:
+                return list(messages)
+            self._summaries.move_to_end(conversation_id)
+            return [self._summary_message(summary.text)] + window
+
+        # The window has to move: fold the turns that drop out into the summary
+        cut = self._cut_for(messages, start, int(token_budget * self.keep_ratio))
+        dropped = messages[start:cut]
+        if not dropped:
+            # Only the newest turns are left and they alone exceed the budget
+            return ([self._summary_message(summary.text)] if summary else []) + window
+        try:
+            with tracer.span("summarize_history", messages=len(dropped)):
+                text = await self.summarize(summary.text if summary else "", dropped)
+        except Exception as e:
+            print(f"[HISTORY] Summary failed, truncating history instead: {e}")
+            return messages[cut:]
+
+        self.summaries_made += 1
+        if conversation_id:
+            self._summaries[conversation_id] = _Summary(text, messages[cut - 1], cut - 1)
+            self._summaries.move_to_end(conversation_id)
+            while len(self._summaries) > self.max_conversations:
+                self._summaries.popitem(last=False)
+        return [self._summary_message(text)] + messages[cut:]
+
+    @staticmethod
+    def _summary_message(text: str) -> ModelMessage:
+        return ModelRequest(parts=[SystemPromptPart(content=SUMMARY_PREFIX + text)])
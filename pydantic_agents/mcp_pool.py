@@ -0,0 +1,419 @@
+"""
+Process-wide pool of MCP sessions, shared by every agent.
+
+Agent builders ask the pool for the MCP server of a URL instead of creating
+their own `MCPServerStreamableHTTP`. All agents pointing at the same URL get
+the same server object, whose session is opened once and kept open by a
+background task, so an agent run no longer pays for the MCP handshake and a
+tools/list round trip on every request. With CASSETTE_MODE set, the MCP
+traffic is recorded or replayed (see cassettes.py).
+
+A tool call cancelled with its agent run (see `start_run` and `cancel_run`)
+is also cancelled on the MCP server, with a `notifications/cancelled`.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Coroutine, Dict, List, Optional, Set
+
+import anyio
+from mcp import types as mcp_types
+from mcp.shared.message import SessionMessage
+from pydantic_ai.exceptions import ModelRetry
+from pydantic_ai.mcp import MCPServerStreamableHTTP
+
+from pydantic_agents.cassettes import cassettes
+from pydantic_agents.resilience import breakers
+
+MCP_POOL_ENABLED = os.getenv("MCP_POOL_ENABLED", "1") == "1"
+# Open sessions across all URLs; idle ones are closed to make room
+MCP_POOL_MAX_SESSIONS = int(os.getenv("MCP_POOL_MAX_SESSIONS", "4"))
+# Tool calls in flight per session
+MCP_MAX_CONCURRENT_CALLS = int(os.getenv("MCP_MAX_CONCURRENT_CALLS", "16"))
+# How long a tools/list result is reused
+MCP_TOOLS_TTL_SECONDS = float(os.getenv("MCP_TOOLS_TTL_SECONDS", "300"))
+# Seconds between pings on an open session (0 disables health checks)
+MCP_HEALTH_INTERVAL = float(os.getenv("MCP_HEALTH_INTERVAL", "30"))
+# Sessions unused for this long are closed
+MCP_SESSION_IDLE_SECONDS = float(os.getenv("MCP_SESSION_IDLE_SECONDS", "600"))
+# How long an agent run waits for a session slot when the pool is full
+MCP_POOL_ACQUIRE_TIMEOUT = float(os.getenv("MCP_POOL_ACQUIRE_TIMEOUT", "30"))
+
+# Tasks running an MCP tool call for the agent run of this context (see start_run)
+_run_tool_calls: contextvars.ContextVar[Optional[Set[asyncio.Task]]] = contextvars.ContextVar(
+    "mcp_run_tool_calls", default=None
+)
+# The tool-call tasks of each unfinished run started with start_run
+_runs: Dict[asyncio.Task, Set[asyncio.Task]] = {}
+# JSON-RPC id of the last tools/call request sent from this task
+_sent_call_id: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar("mcp_sent_call_id", default=None)
+
+
+def start_run(coro: Coroutine) -> asyncio.Task:
+    """
+    Run an agent run in a task whose MCP tool calls are cancelled with it.
+
+    pydantic-ai runs parallel tool calls in tasks of their own, which
+    cancelling the run alone would leave running.
+    """
+    calls: Set[asyncio.Task] = set()
+    token = _run_tool_calls.set(calls)
+    try:
+        task = asyncio.create_task(coro)
+    finally:
+        _run_tool_calls.reset(token)
+    _runs[task] = calls
+    # A run that ends (e.g. on an error) while parallel calls are in flight
+    task.add_done_callback(cancel_run)
+    return task
+
+
+def cancel_run(task: asyncio.Task) -> None:
+    """
+    Cancel a run started with `start_run` and its MCP tool calls. The calls
+    are cancelled first, so they can tell the server before the run closes
+    its session.
+    """
+    # Once: a second cancel would interrupt the calls telling the server
+    for call in _runs.pop(task, ()):
+        call.cancel()
+    task.cancel()
+
+
+class _CallIdStream:
+    """Write stream of an MCP session that notes the id of each tools/call request it sends."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    async def send(self, message: SessionMessage) -> None:
+        request = message.message.root
+        if isinstance(request, mcp_types.JSONRPCRequest) and request.method == "tools/call":
+            # Set in the calling task's context, where direct_call_tool reads it
+            _sent_call_id.set(request.id)
+        await self._stream.send(message)
+
+    async def __aenter__(self):
+        await self._stream.__aenter__()
+        return self
+
+    async def __aexit__(self, *args: Any):
+        return await self._stream.__aexit__(*args)
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+
+class MCPServer(MCPServerStreamableHTTP):
+    """
+    Streamable HTTP MCP server whose traffic goes through the cassettes when
+    they are on, and whose cancelled tool calls are cancelled on the server.
+    """
+
+    @asynccontextmanager
+    async def client_streams(self):
+        factory = cassettes.mcp_client_factory(self.url)
+        if factory is None:
+            async with super().client_streams() as (read_stream, write_stream):
+                yield read_stream, _CallIdStream(write_stream)
+            return
+        async with self._transport_client(url=self.url, headers=self.headers, timeout=self.timeout,
+                                          sse_read_timeout=self.read_timeout,
+                                          httpx_client_factory=factory) as (read_stream, write_stream, *_):
+            yield read_stream, _CallIdStream(write_stream)
+
+    async def direct_call_tool(self, name: str, args: Dict[str, Any], metadata: Optional[Dict[str, Any]] = None):
+        calls = _run_tool_calls.get()
+        task = asyncio.current_task()
+        if calls is not None:
+            calls.add(task)
+        _sent_call_id.set(None)
+        try:
+            # Keeps the session open until the server is told about a cancelled call
+            async with self:
+                try:
+                    return await super().direct_call_tool(name, args, metadata)
+                except asyncio.CancelledError:
+                    await self._cancel_on_server(_sent_call_id.get())
+                    raise
+        finally:
+            if calls is not None:
+                calls.discard(task)
+
+    async def _cancel_on_server(self, request_id: Optional[Any]) -> None:
+        """Tell the server to stop a tool call nobody waits for any more (best effort)."""
+        if request_id is None or self._client is None:
+            return
+        try:
+            await self._client.send_notification(mcp_types.ClientNotification(mcp_types.CancelledNotification(
+                method="notifications/cancelled",
+                params=mcp_types.CancelledNotificationParams(requestId=request_id, reason="Run cancelled"),
+            )))
+        except Exception:
+            pass
+
+
+class PooledMCPServer(MCPServer):
+    """
+    MCP server whose session is owned by the pool.
+
+    The session is opened and closed by a dedicated task (the streamable HTTP
+    client must be closed from the task that opened it); agent runs only
+    take a reference on the open session. Tool listings are cached and tool
+    calls are bounded per session.
+    """
+
+    def __init__(self, url: str, pool: "MCPSessionPool", max_concurrent_calls: int = MCP_MAX_CONCURRENT_CALLS,
+                 tools_ttl: float = MCP_TOOLS_TTL_SECONDS, **kwargs):
+        super().__init__(url, **kwargs)
+        self._pool = pool
+        self._tools_ttl = tools_ttl
+        self._tools: Optional[list] = None
+        self._tools_loaded_at = 0.0
+        self._tools_lock = asyncio.Lock()
+        self._call_slots = asyncio.Semaphore(max_concurrent_calls)
+        self._owner: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._reset = asyncio.Event()
+        self._connect_error: Optional[BaseException] = None
+        self._closing = False
+        self.last_used = time.monotonic()
+        self.sessions_opened = 0
+        self.tool_calls = 0
+        self.tool_call_seconds = 0.0
+        self.tool_calls_cancelled = 0
+        self.tools_cache_hits = 0
+        self.health_failures = 0
+
+    # Session lifecycle
+
+    async def __aenter__(self):
+        self.last_used = time.monotonic()
+        await self._pool.acquire(self)
+        return await super().__aenter__()
+
+    async def __aexit__(self, *args: Any):
+        self.last_used = time.monotonic()
+        result = await super().__aexit__(*args)
+        if self._running_count <= 1:
+            self._pool.released(self)
+        return result
+
+    @property
+    def active_runs(self) -> int:
+        """Agent runs currently using the session (the owner's reference excluded)."""
+        owned = self._owner is not None and not self._owner.done() and self._ready is not None and self._ready.is_set()
+        return max(0, self._running_count - (1 if owned else 0))
+
+    @property
+    def is_open(self) -> bool:
+        return (self._owner is not None and not self._owner.done() and not self._closing
+                and self._ready is not None and self._ready.is_set())
+
+    async def ensure_open(self) -> None:
+        """Open the session in the owner task if it isn't open yet."""
+        while True:
+            owner = self._owner
+            if owner is None or owner.done():
+                self._ready = asyncio.Event()
+                self._stop = asyncio.Event()
+                self._reset.clear()
+                self._connect_error = None
+                self._owner = asyncio.create_task(self._own_session())
+                continue
+            if self._closing:
+                # Wait for the old session to close before opening a new one
+                await asyncio.wait([owner])
+                continue
+            await self._ready.wait()
+            if owner.done() and self._connect_error is not None:
+                raise self._connect_error
+            return
+
+    def mark_unhealthy(self) -> None:
+        """Reconnect once the runs using the current session have finished."""
+        self._reset.set()
+
+    async def close_session(self) -> None:
+        owner = self._owner
+        if owner is None:
+            return
+        self._stop.set()
+        await asyncio.wait([owner])
+
+    async def _own_session(self) -> None:
+        try:
+            await MCPServerStreamableHTTP.__aenter__(self)
+        except Exception as e:
+            self._connect_error = e
+            self._ready.set()
+            return
+        self.sessions_opened += 1
+        self._ready.set()
+        try:
+            while not self._stop.is_set() and not self._reset.is_set():
+                await self._wait_for_signal(MCP_HEALTH_INTERVAL or None)
+                if self._stop.is_set() or self._reset.is_set():
+                    break
+                if MCP_HEALTH_INTERVAL and not await self._ping():
+                    self.health_failures += 1
+                    print(f"[MCP POOL] Health check failed for {self.url}, reconnecting")
+                    break
+                if self.active_runs == 0 and time.monotonic() - self.last_used > MCP_SESSION_IDLE_SECONDS:
+                    break
+        finally:
+            self._closing = True
+            # Runs still using this session finish first; the session must be
+            # closed here, in the task that opened it
+            while self._running_count > 1:
+                await asyncio.sleep(0.05)
+            try:
+                await MCPServerStreamableHTTP.__aexit__(self, None, None, None)
+            except Exception as e:
+                print(f"[MCP POOL] Error closing session for {self.url}: {e}")
+            finally:
+                self._closing = False
+                self._pool.released(self)
+
+    async def _wait_for_signal(self, timeout: Optional[float]) -> None:
+        waiters = [asyncio.ensure_future(self._stop.wait()), asyncio.ensure_future(self._reset.wait())]
+        try:
+            await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    async def _ping(self) -> bool:
+        try:
+            with anyio.fail_after(self.timeout):
+                await self._client.send_ping()
+            return True
+        except Exception:
+            return False
+
+    # Cached listings and bounded calls
+
+    async def list_tools(self):
+        if self._tools is not None and time.monotonic() - self._tools_loaded_at < self._tools_ttl:
+            self.tools_cache_hits += 1
+            return self._tools
+        async with self._tools_lock:
+            if self._tools is None or time.monotonic() - self._tools_loaded_at >= self._tools_ttl:
+                self._tools = await super().list_tools()
+                self._tools_loaded_at = time.monotonic()
+            else:
+                self.tools_cache_hits += 1
+        return self._tools
+
+    async def direct_call_tool(self, name: str, args: Dict[str, Any], metadata: Optional[Dict[str, Any]] = None):
+        breaker = breakers.get(self.url)
+        async with self._call_slots:
+            # Fail fast while the server is known to be down
+            breaker.check()
+            start = time.perf_counter()
+            try:
+                result = await super().direct_call_tool(name, args, metadata)
+            except ModelRetry:
+                # The server answered (with a tool error)
+                breaker.record_success()
+                raise
+            except Exception:
+                # Transport failures leave the session unusable
+                breaker.record_failure()
+                self.mark_unhealthy()
+                raise
+            except BaseException as e:
+                breaker.release_probe()
+                if isinstance(e, asyncio.CancelledError):
+                    self.tool_calls_cancelled += 1
+                raise
+            finally:
+                self.tool_calls += 1
+                self.tool_call_seconds += time.perf_counter() - start
+            breaker.record_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "open": self.is_open,
+            "active_runs": self.active_runs,
+            "sessions_opened": self.sessions_opened,
+            "tool_calls": self.tool_calls,
+            "tool_call_avg_ms": self.tool_call_seconds / self.tool_calls * 1000 if self.tool_calls else 0.0,
+            "tool_calls_cancelled": self.tool_calls_cancelled,
+            "tools_cache_hits": self.tools_cache_hits,
+            "health_failures": self.health_failures,
+        }
+
+
+class MCPSessionPool:
+    """One shared, kept-open MCP server per URL, with a cap on open sessions."""
+
+    def __init__(self, max_sessions: int = MCP_POOL_MAX_SESSIONS, acquire_timeout: float = MCP_POOL_ACQUIRE_TIMEOUT):
+        self.max_sessions = max_sessions
+        self.acquire_timeout = acquire_timeout
+        self._servers: Dict[str, PooledMCPServer] = {}
+        self._slot_freed: Optional[asyncio.Condition] = None
+
+    def server(self, url: str, **kwargs) -> MCPServerStreamableHTTP:
+        """The shared MCP server for `url` (a plain, per-agent server when pooling is disabled)."""
+        if not MCP_POOL_ENABLED:
+            return MCPServer(url, **kwargs)
+        if url not in self._servers:
+            self._servers[url] = PooledMCPServer(url, self, **kwargs)
+        return self._servers[url]
+
+    def servers(self) -> List[PooledMCPServer]:
+        return list(self._servers.values())
+
+    async def acquire(self, server: PooledMCPServer) -> None:
+        """Make sure `server` has an open session, closing idle ones beyond the cap."""
+        if server.is_open:
+            return
+        if self._slot_freed is None:
+            self._slot_freed = asyncio.Condition()
+        async with self._slot_freed:
+            await asyncio.wait_for(
+                self._slot_freed.wait_for(lambda: self._make_room(server)), self.acquire_timeout
+            )
+        await server.ensure_open()
+
+    def _make_room(self, server: PooledMCPServer) -> bool:
+        open_servers = [s for s in self._servers.values() if s.is_open and s is not server]
+        if len(open_servers) < self.max_sessions:
+            return True
+        idle = sorted((s for s in open_servers if s.active_runs == 0), key=lambda s: s.last_used)
+        if not idle:
+            return False
+        asyncio.create_task(idle[0].close_session())
+        return True
+
+    def released(self, server: PooledMCPServer) -> None:
+        if self._slot_freed is None:
+            return
+
+        async def notify():
+            async with self._slot_freed:
+                self._slot_freed.notify_all()
+        asyncio.create_task(notify())
+
+    async def warm(self) -> None:
+        """Open the sessions of every known server."""
+        results = await asyncio.gather(*(self.acquire(s) for s in self.servers()), return_exceptions=True)
+        for server, result in zip(self.servers(), results):
+            if isinstance(result, Exception):
+                print(f"[MCP POOL] Could not open session for {server.url}: {result}")
+
+    async def close(self) -> None:
+        await asyncio.gather(*(s.close_session() for s in self.servers()), return_exceptions=True)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [s.stats() for s in self.servers()]
+
+
+# Shared by all agent builders
+mcp_pool = MCPSessionPool()
@@ -0,0 +1,294 @@
+"""
+Prometheus metrics for the agent server, served as text on /metrics.
+
+Requests, latencies and streams are counted in plain dicts as they happen
+(a dict update and, for histograms, a bisect per observation), so this is
+cheap enough to leave on. Everything the server's components already count
+(admission queues, breakers, caches, coalescing, hedging) is read from their
+`stats()` when /metrics is scraped rather than counted twice.
+"""
+import asyncio
+import functools
+import os
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.requests import ClientDisconnect
+
+from pydantic_agents.admission import Overloaded
+
+# Serve /metrics (the counting itself is always on)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+TOKENS_PER_SECOND_BUCKETS = (5, 10, 20, 40, 80, 160, 320)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.values: Dict[Tuple, float] = {}
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self.values.items():
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (the last one is +Inf)], sum
+        self._series: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def samples(self) -> Iterable[str]:
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total[0])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class MetricsRegistry:
+    """The metrics updated in the hot path, plus collectors read at scrape time."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Metric]]] = []
+
+    def _add(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collector(self, collect: Callable[[], Iterable[Metric]]) -> None:
+        """Register `collect`, called on every scrape for freshly built metrics."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        metrics = list(self._metrics)
+        for collect in self._collectors:
+            try:
+                metrics.extend(collect())
+            except Exception as e:
+                print(f"[METRICS] Collector {getattr(collect, '__name__', collect)} failed: {e}")
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+metrics = MetricsRegistry()
+
+requests_total = metrics.counter(
+    "agent_requests_total", "Requests per agent, endpoint and outcome.", ("agent", "endpoint", "status")
+)
+request_seconds = metrics.histogram(
+    "agent_request_duration_seconds", "Time to handle a request (to the last byte for streams).", ("agent", "endpoint")
+)
+stream_ttft_seconds = metrics.histogram(
+    "agent_stream_ttft_seconds", "Time from a /chat/stream request to the first model token.", ("agent",),
+    buckets=TTFT_BUCKETS,
+)
+stream_tokens_per_second = metrics.histogram(
+    "agent_stream_tokens_per_second", "Output tokens per second of a /chat/stream turn, after the first token.",
+    ("agent",), buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+active_streams = metrics.gauge("agent_active_streams", "Open /chat/stream responses.", ("agent",))
+stream_cancellations = metrics.counter(
+    "agent_stream_cancellations_total",
+    "/chat/stream turns whose run was cancelled because the client disconnected, by what the run was doing.",
+    ("agent", "stage"),
+)
+
+
+def request_status(error: Optional[BaseException]) -> str:
+    if error is None:
+        return "ok"
+    if isinstance(error, Overloaded):
+        return "429"
+    if isinstance(error, (asyncio.CancelledError, GeneratorExit, ClientDisconnect)):
+        return "cancelled"
+    status_code = getattr(error, "status_code", None)
+    return str(status_code) if status_code is not None else "error"
+
+
+def record_request(agent: str, endpoint: str, seconds: float, error: Optional[BaseException] = None) -> None:
+    requests_total.inc(agent=agent, endpoint=endpoint, status=request_status(error))
+    request_seconds.observe(seconds, agent=agent, endpoint=endpoint)
+
+
+@asynccontextmanager
+async def track_request(agent: str, endpoint: str):
+    """Count and time the request handled inside the block."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        record_request(agent, endpoint, time.perf_counter() - start, e)
+        raise
+    record_request(agent, endpoint, time.perf_counter() - start)
+
+
+def tracked(endpoint: str, agent):
+    """
+    Decorate an endpoint to count and time its requests. `agent` is the agent
+    name, or a function of the endpoint's request model that returns it.
+    """
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(request, *args, **kwargs):
+            async with track_request(agent(request) if callable(agent) else agent, endpoint):
+                return await handler(request, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_stream_rate(agent: str, output_tokens: int, seconds: float) -> None:
+    """Tokens per second of a finished stream, from its first token to the last."""
+    if output_tokens and seconds > 0:
+        stream_tokens_per_second.observe(output_tokens / seconds, agent=agent)
+
+
+def stats_metrics(admission=None, generations=None, pulse_pool=None, history_cache=None) -> List[Metric]:
+    """Metrics built from the components' own counters, for a scrape."""
+    from pydantic_agents.hedging import hedger
+    from pydantic_agents.mcp_pool import mcp_pool
+    from pydantic_agents.resilience import breakers, retry_budget
+    from pydantic_agents.tool_cache import tool_result_cache
+
+    collected: List[Metric] = []
+
+    if admission is not None:
+        queued = Gauge("agent_queue_depth", "Requests waiting for an agent slot.", ("agent",))
+        running = Gauge("agent_active_runs", "Agent runs holding a slot.", ("agent",))
+        rejected = Counter("agent_admission_rejected_total", "Requests turned away with a 429.", ("agent",))
+        wait = Gauge("agent_queue_wait_avg_seconds", "Average wait for an agent slot.", ("agent",))
+        for agent, stats in admission.stats().items():
+            queued.set(stats["queued"], agent=agent)
+            running.set(stats["active"], agent=agent)
+            rejected.inc(stats["rejected"] + stats["timed_out"], agent=agent)
+            wait.set(stats["wait_avg_ms"] / 1000, agent=agent)
+        collected += [queued, running, rejected, wait]
+
+    upstream_calls = Counter("upstream_calls_total", "Upstream calls by outcome.", ("upstream", "outcome"))
+    breaker_open = Gauge("upstream_breaker_open", "1 while the upstream's circuit breaker is not closed.", ("upstream",))
+    for upstream, stats in breakers.stats().items():
+        upstream_calls.inc(stats["successes"], upstream=upstream, outcome="success")
+        upstream_calls.inc(stats["failures"], upstream=upstream, outcome="failure")
+        upstream_calls.inc(stats["rejected"], upstream=upstream, outcome="fast_failed")
+        breaker_open.set(int(stats["state"] != "closed"), upstream=upstream)
+    retries = Counter("upstream_retries_total", "Retries taken from the retry budget.")
+    retries.inc(retry_budget.stats()["retries"])
+    collected += [upstream_calls, breaker_open, retries]
+
+    tool_calls = Counter("mcp_tool_calls_total", "Tool calls per MCP server.", ("server",))
+    tool_calls_cancelled = Counter(
+        "mcp_tool_calls_cancelled_total", "Tool calls cancelled with their agent run, per MCP server.", ("server",)
+    )
+    for stats in mcp_pool.stats():
+        tool_calls.inc(stats["tool_calls"], server=stats["url"])
+        tool_calls_cancelled.inc(stats["tool_calls_cancelled"], server=stats["url"])
+    collected += [tool_calls, tool_calls_cancelled]
+
+    cache_lookups = Counter("cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"))
+    caches = [("tool_result", tool_result_cache.stats())]
+    if history_cache is not None:
+        caches.append(("history", history_cache.stats()))
+    if pulse_pool is not None:
+        caches.append(("pulse_pool", pulse_pool.stats()))
+    for cache, stats in caches:
+        cache_lookups.inc(stats["hits"], cache=cache, result="hit")
+        cache_lookups.inc(stats["misses"], cache=cache, result="miss")
+    collected.append(cache_lookups)
+
+    if generations is not None:
+        stats = generations.stats()
+        coalesced = Counter("generations_total", "Generations by whether they shared an in-flight call.", ("result",))
+        coalesced.inc(stats["calls"], result="called")
+        coalesced.inc(stats["coalesced"], result="coalesced")
+        collected.append(coalesced)
+
+    hedges = Counter("hedged_requests_total", "Hedged model requests per endpoint.", ("endpoint", "result"))
+    for endpoint, counts in hedger.stats()["endpoints"].items():
+        hedges.inc(counts["requests"], endpoint=endpoint, result="requests")
+        hedges.inc(counts["hedged"], endpoint=endpoint, result="hedged")
+        hedges.inc(counts["fallback_wins"], endpoint=endpoint, result="fallback_wins")
+    collected.append(hedges)
+
+    return collected
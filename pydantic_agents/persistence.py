@@ -0,0 +1,224 @@
+"""
+Write-behind persistence of chat turns to PocketBase.
+
+Turns are queued on the request path and written by a background worker in
+batches, so a finished stream never waits on PocketBase.
+"""
+import asyncio
+import os
+import random
+from typing import Dict, List, Optional
+
+from pydantic_agents.pocketbase_client import AsyncPocketBase, PocketBaseError
+
+# Turns per write; each turn is two message records, plus one update per conversation
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "50"))
+# Operations per /api/batch call (PocketBase's batch.maxRequests, 50 by default)
+PERSIST_BATCH_MAX_REQUESTS = int(os.getenv("PERSIST_BATCH_MAX_REQUESTS", "50"))
+# Seconds the worker waits to fill a batch before flushing what it has
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "0.5"))
+# Queued turns beyond this make enqueue_turn wait (backpressure)
+PERSIST_MAX_PENDING = int(os.getenv("PERSIST_MAX_PENDING", "5000"))
+PERSIST_MAX_RETRIES = int(os.getenv("PERSIST_MAX_RETRIES", "5"))
+PERSIST_RETRY_BASE_DELAY = float(os.getenv("PERSIST_RETRY_BASE_DELAY", "0.5"))
+
+LAST_MESSAGE_PREVIEW_CHARS = 200
+
+
+def _retryable(error: PocketBaseError) -> bool:
+    return error.status == 0 or error.status == 429 or error.status >= 500
+
+
+class TurnPersister:
+    """
+    Queues user/assistant messages and the `conversations.lastMessage`
+    update, and flushes them to PocketBase in batches with retry.
+    """
+
+    def __init__(
+        self,
+        client: AsyncPocketBase,
+        batch_size: int = PERSIST_BATCH_SIZE,
+        flush_interval: float = PERSIST_FLUSH_INTERVAL,
+        max_pending: int = PERSIST_MAX_PENDING,
+        max_retries: int = PERSIST_MAX_RETRIES,
+        batch_max_requests: int = PERSIST_BATCH_MAX_REQUESTS,
+    ):
+        self.client = client
+        self.batch_size = batch_size
+        self.batch_max_requests = max(1, batch_max_requests)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self._worker: Optional[asyncio.Task] = None
+        # conversation_id -> owner userId, for requests that don't send it
+        self._owners: Dict[str, str] = {}
+        self._batch_api = True
+        # Turns written, and turns or records given up on
+        self.written = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def enqueue_turn(
+        self,
+        conversation_id: str,
+        user_message: str,
+        assistant_message: str,
+        user_id: Optional[str] = None,
+    ) -> None:
+        """Queue one finished turn. Waits only when the queue is full."""
+        await self._queue.put({
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "user_message": user_message,
+            "assistant_message": assistant_message,
+        })
+
+    def enqueue_turn_nowait(
+        self,
+        conversation_id: str,
+        user_message: str,
+        assistant_message: str,
+        user_id: Optional[str] = None,
+    ) -> None:
+        """Queue one turn without waiting, e.g. from a stream being torn down. Dropped when the queue is full."""
+        try:
+            self._queue.put_nowait({
+                "conversation_id": conversation_id,
+                "user_id": user_id,
+                "user_message": user_message,
+                "assistant_message": assistant_message,
+            })
+        except asyncio.QueueFull:
+            self.failed += 1
+            print(f"[PERSIST] Queue full, dropped a turn for conversation {conversation_id}")
+
+    async def flush(self) -> None:
+        """Wait until every queued turn has been written (or given up on)."""
+        await self._queue.join()
+
+    async def close(self) -> None:
+        """Flush outstanding turns and stop the worker."""
+        if self._worker is None:
+            return
+        await self.flush()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            turns = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(turns) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    turns.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(turns)
+            except Exception as e:
+                self.failed += len(turns)
+                print(f"[PERSIST] Dropped {len(turns)} turns after error: {e}")
+            finally:
+                for _ in turns:
+                    self._queue.task_done()
+
+    async def _owner(self, turn: dict) -> str:
+        if turn["user_id"]:
+            return turn["user_id"]
+        conversation_id = turn["conversation_id"]
+        if conversation_id not in self._owners:
+            record = await self._with_retry(self.client.get_one, "conversations", conversation_id)
+            self._owners[conversation_id] = record["userId"]
+        return self._owners[conversation_id]
+
+    async def _requests_for(self, turns: List[dict]) -> tuple:
+        """Build the record operations for `turns`; returns (requests, turns included)."""
+        requests = []
+        included = 0
+        last_messages: Dict[str, str] = {}
+        for turn in turns:
+            try:
+                owner = await self._owner(turn)
+            except PocketBaseError as e:
+                self.failed += 1
+                print(f"[PERSIST] Skipping turn for conversation {turn['conversation_id']}: {e}")
+                continue
+            for role, content in (("user", turn["user_message"]), ("assistant", turn["assistant_message"])):
+                requests.append({
+                    "method": "POST",
+                    "url": "/api/collections/messages/records",
+                    "body": {
+                        "conversationId": turn["conversation_id"],
+                        "userId": owner,
+                        "role": role,
+                        "content": content,
+                    },
+                })
+            last_messages[turn["conversation_id"]] = turn["assistant_message"]
+            included += 1
+        # One lastMessage update per conversation, with its newest reply
+        for conversation_id, message in last_messages.items():
+            requests.append({
+                "method": "PATCH",
+                "url": f"/api/collections/conversations/records/{conversation_id}",
+                "body": {"lastMessage": message[:LAST_MESSAGE_PREVIEW_CHARS]},
+            })
+        return requests, included
+
+    async def _write(self, turns: List[dict]) -> None:
+        requests, included = await self._requests_for(turns)
+        if not requests:
+            return
+        # In order, so a turn's messages are never written before the ones preceding it
+        for start in range(0, len(requests), self.batch_max_requests):
+            await self._write_requests(requests[start:start + self.batch_max_requests])
+        self.written += included
+
+    async def _write_requests(self, requests: List[dict]) -> None:
+        if self._batch_api:
+            try:
+                await self._with_retry(self.client.batch, requests)
+                return
+            except PocketBaseError as e:
+                if e.status == 403:
+                    print("[PERSIST] PocketBase batch API disabled, writing records one by one")
+                    self._batch_api = False
+                elif e.status != 400:
+                    raise
+                # 400: one bad record fails the whole transaction; isolate it below
+
+        for request in requests:
+            try:
+                await self._with_retry(self._send_one, request)
+            except PocketBaseError as e:
+                self.failed += 1
+                print(f"[PERSIST] Failed {request['method']} {request['url']}: {e}")
+
+    async def _send_one(self, request: dict):
+        return await self.client.request(request["method"], request["url"], json=request["body"])
+
+    async def _with_retry(self, func, *args):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await func(*args)
+            except PocketBaseError as e:
+                if not _retryable(e) or attempt == self.max_retries:
+                    raise
+                delay = PERSIST_RETRY_BASE_DELAY * (2 ** attempt)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
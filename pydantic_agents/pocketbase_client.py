@@ -0,0 +1,221 @@
+"""
+Async PocketBase client for the server's data path.
+
+Uses one pooled httpx.AsyncClient (keep-alive) per process, caches the
+superuser auth token and refreshes it before it expires, and caps the number
+of concurrent requests so a burst of turns cannot flood PocketBase.
+"""
+import asyncio
+import base64
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+POCKETBASE_TIMEOUT = float(os.getenv("POCKETBASE_TIMEOUT", "10"))
+POCKETBASE_MAX_CONNECTIONS = int(os.getenv("POCKETBASE_MAX_CONNECTIONS", "20"))
+POCKETBASE_MAX_CONCURRENCY = int(os.getenv("POCKETBASE_MAX_CONCURRENCY", "16"))
+# Refresh the auth token when it expires within this many seconds
+POCKETBASE_TOKEN_REFRESH_MARGIN = float(os.getenv("POCKETBASE_TOKEN_REFRESH_MARGIN", "300"))
+
+
+class PocketBaseError(Exception):
+    """A failed PocketBase request (HTTP error status or transport failure)."""
+
+    def __init__(self, message: str, status: int = 0, data: Any = None):
+        super().__init__(message)
+        self.status = status
+        self.data = data
+
+
+def quote_filter_value(value: str) -> str:
+    """Quote a value for use inside a PocketBase filter expression."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _token_expiry(token: str) -> float:
+    """Read the `exp` claim from a JWT without verifying it (0 if unreadable)."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return 0.0
+
+
+class AsyncPocketBase:
+    """Minimal async PocketBase REST client with pooled connections and cached auth."""
+
+    def __init__(
+        self,
+        base_url: str,
+        email: Optional[str] = None,
+        password: Optional[str] = None,
+        auth_collection: str = "_superusers",
+        timeout: float = POCKETBASE_TIMEOUT,
+        max_connections: int = POCKETBASE_MAX_CONNECTIONS,
+        max_concurrency: int = POCKETBASE_MAX_CONCURRENCY,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.email = email
+        self.password = password
+        self.auth_collection = auth_collection
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60,
+            ),
+            transport=transport,
+        )
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._auth_lock = asyncio.Lock()
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["AsyncPocketBase"]:
+        """Build a client from POCKETBASE_* settings, or None when not configured."""
+        url = os.getenv("POCKETBASE_URL")
+        if not url:
+            return None
+        return cls(
+            url,
+            email=os.getenv("POCKETBASE_ADMIN_EMAIL"),
+            password=os.getenv("POCKETBASE_ADMIN_PASSWORD"),
+        )
+
+    # Auth
+
+    async def _auth_token(self) -> Optional[str]:
+        if not self.email or not self.password:
+            return None
+        if self._token and time.time() < self._token_expires_at - POCKETBASE_TOKEN_REFRESH_MARGIN:
+            return self._token
+        async with self._auth_lock:
+            # Another request may have refreshed the token while we waited
+            if self._token and time.time() < self._token_expires_at - POCKETBASE_TOKEN_REFRESH_MARGIN:
+                return self._token
+            if self._token and time.time() < self._token_expires_at:
+                try:
+                    await self._refresh()
+                    return self._token
+                except PocketBaseError:
+                    pass
+            await self._login()
+            return self._token
+
+    def _store_token(self, data: dict) -> None:
+        self._token = data["token"]
+        expiry = _token_expiry(self._token)
+        # Tokens without a readable expiry are re-issued after an hour
+        self._token_expires_at = expiry or time.time() + 3600
+
+    async def _login(self) -> None:
+        data = await self._send(
+            "POST",
+            f"/api/collections/{self.auth_collection}/auth-with-password",
+            json={"identity": self.email, "password": self.password},
+        )
+        self._store_token(data)
+
+    async def _refresh(self) -> None:
+        data = await self._send(
+            "POST",
+            f"/api/collections/{self.auth_collection}/auth-refresh",
+            headers={"Authorization": self._token},
+        )
+        self._store_token(data)
+
+    def invalidate_token(self) -> None:
+        self._token = None
+        self._token_expires_at = 0.0
+
+    # Requests
+
+    async def _send(self, method: str, path: str, **kwargs) -> Any:
+        async with self._slots:
+            try:
+                response = await self._http.request(method, path, **kwargs)
+            except httpx.TimeoutException as e:
+                raise PocketBaseError(f"PocketBase request timed out: {method} {path}") from e
+            except httpx.HTTPError as e:
+                raise PocketBaseError(f"PocketBase request failed: {method} {path}: {e}") from e
+
+        if response.status_code >= 400:
+            try:
+                data = response.json()
+            except ValueError:
+                data = response.text
+            message = data.get("message") if isinstance(data, dict) else data
+            raise PocketBaseError(
+                f"PocketBase {method} {path} returned {response.status_code}: {message}",
+                status=response.status_code,
+                data=data,
+            )
+        if response.status_code == 204 or not response.content:
+            return None
+        return response.json()
+
+    async def request(self, method: str, path: str, **kwargs) -> Any:
+        """Send an authenticated request; re-authenticates once on a 401."""
+        token = await self._auth_token()
+        headers = dict(kwargs.pop("headers", None) or {})
+        if token:
+            headers["Authorization"] = token
+        try:
+            return await self._send(method, path, headers=headers, **kwargs)
+        except PocketBaseError as e:
+            if e.status != 401 or not token:
+                raise
+        self.invalidate_token()
+        headers["Authorization"] = await self._auth_token()
+        return await self._send(method, path, headers=headers, **kwargs)
+
+    async def get_list(
+        self,
+        collection: str,
+        page: int = 1,
+        per_page: int = 30,
+        filter: Optional[str] = None,
+        sort: Optional[str] = None,
+        skip_total: bool = True,
+    ) -> Dict[str, Any]:
+        """List records; returns the PocketBase list response (`items`, `page`, ...)."""
+        params: Dict[str, Any] = {"page": page, "perPage": per_page}
+        if filter:
+            params["filter"] = filter
+        if sort:
+            params["sort"] = sort
+        if skip_total:
+            params["skipTotal"] = 1
+        return await self.request("GET", f"/api/collections/{collection}/records", params=params)
+
+    async def get_one(self, collection: str, record_id: str) -> Dict[str, Any]:
+        return await self.request("GET", f"/api/collections/{collection}/records/{record_id}")
+
+    async def create(self, collection: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.request("POST", f"/api/collections/{collection}/records", json=data)
+
+    async def update(self, collection: str, record_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.request("PATCH", f"/api/collections/{collection}/records/{record_id}", json=data)
+
+    async def delete(self, collection: str, record_id: str) -> None:
+        await self.request("DELETE", f"/api/collections/{collection}/records/{record_id}")
+
+    async def batch(self, requests: list) -> list:
+        """
+        Run several record operations in one transactional /api/batch call.
+
+        Each request is a dict with `method`, `url` and optional `body`.
+        Raises PocketBaseError with status 403 when batching is disabled.
+        """
+        return await self.request("POST", "/api/batch", json={"requests": requests})
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
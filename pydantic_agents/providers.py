@@ -0,0 +1,166 @@
+"""
+Shared model provider clients.
+
+One tuned keep-alive httpx client per upstream (DeepInfra for GLM, Mistral)
+is built once and injected into every agent's model, instead of each builder
+writing OPENAI_* into os.environ and letting pydantic-ai build its own. At
+startup a few connections per upstream are opened ahead of time, so the
+first request does not pay for DNS and the TLS handshake. Requests go
+through the retry budget and the upstream's circuit breaker (see
+resilience.py); the SDKs' own retries are turned off. With CASSETTE_MODE
+set, the traffic is recorded or replayed (see cassettes.py).
+"""
+import asyncio
+import os
+from typing import Dict
+
+import httpx
+
+from pydantic_agents.cassettes import cassettes
+from pydantic_agents.hedging import HEDGE_FALLBACKS, HEDGING_ENABLED, HedgedModel, hedger, parse_fallbacks
+from pydantic_agents.resilience import ResilientTransport, breakers, retry_budget
+
+DEEPINFRA_BASE_URL = os.getenv("DEEPINFRA_BASE_URL", "https://api.deepinfra.com/v1/openai")
+MISTRAL_BASE_URL = os.getenv("MISTRAL_BASE_URL", "https://api.mistral.ai")
+
+MODEL_HTTP_MAX_CONNECTIONS = int(os.getenv("MODEL_HTTP_MAX_CONNECTIONS", "100"))
+# Idle connections are kept this long (httpx closes them after 5s by default)
+MODEL_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("MODEL_HTTP_KEEPALIVE_EXPIRY", "120"))
+MODEL_HTTP_TIMEOUT = float(os.getenv("MODEL_HTTP_TIMEOUT", "600"))
+MODEL_HTTP_CONNECT_TIMEOUT = float(os.getenv("MODEL_HTTP_CONNECT_TIMEOUT", "5"))
+# HTTP/2 needs the optional `h2` package
+MODEL_HTTP2 = os.getenv("MODEL_HTTP2", "0") == "1"
+# Connections opened per upstream at startup (0 disables pre-warming)
+MODEL_PREWARM_CONNECTIONS = int(os.getenv("MODEL_PREWARM_CONNECTIONS", "2"))
+MODEL_PREWARM_TIMEOUT = float(os.getenv("MODEL_PREWARM_TIMEOUT", "5"))
+
+UPSTREAMS = {
+    "deepinfra": {"base_url": DEEPINFRA_BASE_URL, "api_key_env": "DEEPINFRA_API_KEY"},
+    "mistral": {"base_url": MISTRAL_BASE_URL, "api_key_env": "MISTRAL_API_KEY"},
+}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ProviderRegistry:
+    """Builds and shares one HTTP client and provider per upstream."""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._providers: Dict[str, object] = {}
+        self._fallbacks = parse_fallbacks(HEDGE_FALLBACKS)
+        self._http2 = MODEL_HTTP2 and _http2_available()
+        if MODEL_HTTP2 and not self._http2:
+            print("[PROVIDERS] MODEL_HTTP2=1 but h2 is not installed, using HTTP/1.1")
+
+    def http_client(self, upstream: str) -> httpx.AsyncClient:
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            transport = httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=MODEL_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=MODEL_HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=MODEL_HTTP_KEEPALIVE_EXPIRY,
+                ),
+                http2=self._http2,
+            )
+            # Recorded below the retries, so replayed 429s are retried as they were
+            transport = cassettes.wrap(transport, upstream)
+            client = httpx.AsyncClient(
+                transport=ResilientTransport(transport, breakers.get(upstream), retry_budget),
+                timeout=httpx.Timeout(MODEL_HTTP_TIMEOUT, connect=MODEL_HTTP_CONNECT_TIMEOUT),
+                headers={"User-Agent": "twofeetup-agents"},
+            )
+            self._clients[upstream] = client
+        return client
+
+    def provider(self, upstream: str):
+        """The shared pydantic-ai provider for `upstream` ("deepinfra" or "mistral")."""
+        provider = self._providers.get(upstream)
+        if provider is not None:
+            return provider
+        if upstream == "deepinfra":
+            from openai import AsyncOpenAI
+            from pydantic_ai.providers.openai import OpenAIProvider
+            provider = OpenAIProvider(openai_client=AsyncOpenAI(
+                base_url=DEEPINFRA_BASE_URL,
+                api_key=os.getenv("DEEPINFRA_API_KEY") or "api-key-not-set",
+                http_client=self.http_client(upstream),
+                max_retries=0,  # retried by ResilientTransport
+            ))
+        elif upstream == "mistral":
+            from pydantic_ai.providers.mistral import MistralProvider
+            provider = MistralProvider(
+                api_key=os.getenv("MISTRAL_API_KEY"),
+                base_url=MISTRAL_BASE_URL,
+                http_client=self.http_client(upstream),
+            )
+        else:
+            raise ValueError(f"Unknown model upstream: {upstream}")
+        self._providers[upstream] = provider
+        return provider
+
+    def model(self, name: str, hedge: bool = True):
+        """
+        Build a model on the shared clients.
+
+        `name` is "deepinfra:<model>" or "mistral:<model>"; "openai:<model>"
+        is treated as DeepInfra, whose API is OpenAI-compatible. Other names
+        are returned unchanged for pydantic-ai to resolve. With HEDGING_ENABLED=1
+        a model with a fallback in HEDGE_FALLBACKS is wrapped in a HedgedModel.
+        """
+        fallback = self._fallbacks.get(name) if hedge and HEDGING_ENABLED else None
+        if fallback:
+            return HedgedModel(self.model(name, hedge=False), self.model(fallback, hedge=False), hedger)
+        upstream, _, model_name = name.partition(":")
+        if upstream in ("deepinfra", "openai"):
+            from pydantic_ai.models.openai import OpenAIChatModel
+            return OpenAIChatModel(model_name, provider=self.provider("deepinfra"))
+        if upstream == "mistral":
+            from pydantic_ai.models.mistral import MistralModel
+            return MistralModel(model_name, provider=self.provider("mistral"))
+        return name
+
+    async def prewarm(self, connections: int = MODEL_PREWARM_CONNECTIONS,
+                      timeout: float = MODEL_PREWARM_TIMEOUT) -> None:
+        """Open `connections` keep-alive connections to every configured upstream."""
+        if connections <= 0 or cassettes.replaying:
+            return
+
+        async def touch(upstream: str, base_url: str):
+            # Any response leaves a TLS connection in the pool; the status doesn't matter
+            await self.http_client(upstream).head(base_url)
+
+        requests = [
+            touch(upstream, config["base_url"])
+            for upstream, config in UPSTREAMS.items()
+            if os.getenv(config["api_key_env"])
+            for _ in range(connections)
+        ]
+        if not requests:
+            return
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), timeout)
+        except asyncio.TimeoutError:
+            print(f"[PROVIDERS] Pre-warming model connections timed out after {timeout}s")
+            return
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures:
+            print(f"[PROVIDERS] {len(failures)} of {len(results)} pre-warm connections failed: {failures[0]}")
+        else:
+            print(f"[PROVIDERS] Pre-warmed {len(results)} model connections")
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(client.aclose() for client in self._clients.values()), return_exceptions=True)
+        self._clients.clear()
+        self._providers.clear()
+
+
+# Shared by all agents
+providers = ProviderRegistry()
@@ -0,0 +1,264 @@
+"""
+Pool of pre-generated Pulse B responses for /community/pulse-response.
+
+Responses are generated in the background per (ritual_name, ritual_question,
+member_name) and handed out from the pool, so a request only waits for the
+model when the pool for its key is empty. Only keys from the warm file and
+keys requested repeatedly are refilled, as every refill is a model call.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+from pydantic_agents.hedging import hedge_endpoint
+
+PULSE_POOL_ENABLED = os.getenv("PULSE_POOL_ENABLED", "0") == "1"
+# Refill starts when a key has fewer than LOW responses and stops at HIGH
+PULSE_POOL_LOW_WATERMARK = int(os.getenv("PULSE_POOL_LOW_WATERMARK", "3"))
+PULSE_POOL_HIGH_WATERMARK = int(os.getenv("PULSE_POOL_HIGH_WATERMARK", "8"))
+# Keys outside the warm file are refilled once they were requested this many times
+PULSE_POOL_MIN_REQUESTS = int(os.getenv("PULSE_POOL_MIN_REQUESTS", "2"))
+# Pooled responses older than this are discarded; keys unused for this long are dropped
+PULSE_POOL_TTL_SECONDS = float(os.getenv("PULSE_POOL_TTL_SECONDS", "21600"))
+PULSE_POOL_MAX_KEYS = int(os.getenv("PULSE_POOL_MAX_KEYS", "200"))
+# Background generations running at the same time, across all keys
+PULSE_POOL_REFILL_CONCURRENCY = int(os.getenv("PULSE_POOL_REFILL_CONCURRENCY", "2"))
+# A member is not given a text it was given among its last N responses
+PULSE_POOL_NO_REPEAT = int(os.getenv("PULSE_POOL_NO_REPEAT", "20"))
+# Optional JSON file with [{"ritual_name", "ritual_question", "member_name"}, ...] to fill at startup
+PULSE_POOL_WARM_FILE = os.getenv("PULSE_POOL_WARM_FILE")
+
+PULSE_MAX_CHARS = 200
+PULSE_TONES = {"warm", "vulnerable", "hopeful", "peaceful"}
+
+PoolKey = Tuple[str, str, str]
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split()).strip(" .!?\"'")
+
+
+def validate_pulse_response(response: dict) -> Optional[dict]:
+    """
+    Return a cleaned response, or None when it should not be served from the pool.
+
+    Rejects empty or overlong texts and texts that are raw JSON. Unknown tones
+    are mapped to "warm".
+    """
+    text = response.get("text") if isinstance(response, dict) else None
+    if not isinstance(text, str):
+        return None
+    text = text.strip().strip('"').strip()
+    if not text or len(text) > PULSE_MAX_CHARS or text.startswith(("{", "```", "[")):
+        return None
+    tone = str(response.get("tone") or "warm").strip().lower()
+    return {"text": text, "tone": tone if tone in PULSE_TONES else "warm"}
+
+
+class _Entry:
+    __slots__ = ("response", "created_at")
+
+    def __init__(self, response: dict):
+        self.response = response
+        self.created_at = time.monotonic()
+
+
+class _KeyPool:
+    __slots__ = ("entries", "refill_task", "last_used", "requests", "warm")
+
+    def __init__(self):
+        self.entries: Deque[_Entry] = deque()
+        self.refill_task: Optional[asyncio.Task] = None
+        self.last_used = time.monotonic()
+        self.requests = 0
+        self.warm = False
+
+
+class PulseResponsePool:
+    """
+    Background-filled pools of validated pulse responses, one per key.
+
+    `get` serves from the pool and schedules a refill once the pool drops
+    below the low watermark; it generates live only when nothing usable is
+    pooled. Keys are refilled once they are warmed or were requested
+    `min_requests` times, so one-off keys cost a single live generation.
+    Each member's recently served texts are remembered so the same member
+    never gets the same reflection twice in a row.
+
+    Refills go through `refill` (default: `generate`), limited to
+    `refill_concurrency` at a time across all keys, so they can be kept
+    out of the live requests' admission slots.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[..., Awaitable[dict]],
+        low_watermark: int = PULSE_POOL_LOW_WATERMARK,
+        high_watermark: int = PULSE_POOL_HIGH_WATERMARK,
+        ttl_seconds: float = PULSE_POOL_TTL_SECONDS,
+        max_keys: int = PULSE_POOL_MAX_KEYS,
+        refill_concurrency: int = PULSE_POOL_REFILL_CONCURRENCY,
+        no_repeat: int = PULSE_POOL_NO_REPEAT,
+        min_requests: int = PULSE_POOL_MIN_REQUESTS,
+        refill: Optional[Callable[..., Awaitable[dict]]] = None,
+    ):
+        self.generate = generate
+        self.refill = refill or generate
+        self.min_requests = min_requests
+        self.low_watermark = low_watermark
+        self.high_watermark = max(high_watermark, low_watermark)
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self.no_repeat = no_repeat
+        self._pools: "OrderedDict[PoolKey, _KeyPool]" = OrderedDict()
+        self._served: Dict[str, Deque[str]] = {}
+        self._refill_slots = asyncio.Semaphore(refill_concurrency)
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.rejected = 0
+
+    async def get(self, ritual_name: str, ritual_question: str, member_name: str) -> dict:
+        """Return a response for the key, from the pool when possible."""
+        key = (ritual_name, ritual_question, member_name)
+        self._pool(key).requests += 1
+        response = self.take(key)
+        self.schedule_refill(key)
+        if response is not None:
+            self.hits += 1
+            return response
+
+        self.misses += 1
+        response = await self.generate(
+            ritual_name=ritual_name, ritual_question=ritual_question, member_name=member_name
+        )
+        cleaned = validate_pulse_response(response)
+        self._remember(member_name, (cleaned or response).get("text", ""))
+        return cleaned or response
+
+    def take(self, key: PoolKey) -> Optional[dict]:
+        """Pop the oldest fresh response for `key` the member hasn't been given recently."""
+        pool = self._pool(key)
+        served = self._served.get(key[2], ())
+        now = time.monotonic()
+        while pool.entries:
+            entry = pool.entries.popleft()
+            if now - entry.created_at > self.ttl_seconds:
+                continue
+            if _normalize(entry.response["text"]) in served:
+                continue
+            self._remember(key[2], entry.response["text"])
+            return dict(entry.response)
+        return None
+
+    def schedule_refill(self, key: PoolKey) -> None:
+        pool = self._pool(key)
+        if len(pool.entries) >= self.low_watermark:
+            return
+        if not pool.warm and pool.requests < self.min_requests:
+            return
+        if pool.refill_task is None or pool.refill_task.done():
+            pool.refill_task = asyncio.create_task(self._refill(key, pool))
+
+    async def warm(self, keys: Iterable[PoolKey]) -> None:
+        """Fill the pools for `keys` up to the high watermark."""
+        tasks = []
+        for key in keys:
+            key = tuple(key)
+            pool = self._pool(key)
+            pool.warm = True
+            if pool.refill_task is None or pool.refill_task.done():
+                pool.refill_task = asyncio.create_task(self._refill(key, pool))
+            tasks.append(pool.refill_task)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def close(self) -> None:
+        """Cancel running refills."""
+        tasks = [pool.refill_task for pool in self._pools.values() if pool.refill_task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "keys": len(self._pools),
+            "pooled": sum(len(pool.entries) for pool in self._pools.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "rejected": self.rejected,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _pool(self, key: PoolKey) -> _KeyPool:
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = _KeyPool()
+            self._evict()
+        pool.last_used = time.monotonic()
+        self._pools.move_to_end(key)
+        return pool
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for key, pool in list(self._pools.items()):
+            if len(self._pools) <= self.max_keys and now - pool.last_used <= self.ttl_seconds:
+                break
+            if pool.refill_task and not pool.refill_task.done():
+                pool.refill_task.cancel()
+            del self._pools[key]
+
+    def _remember(self, member_name: str, text: str) -> None:
+        if self.no_repeat <= 0 or not text:
+            return
+        served = self._served.get(member_name)
+        if served is None:
+            served = self._served[member_name] = deque(maxlen=self.no_repeat)
+        served.append(_normalize(text))
+
+    async def _generate_for_pool(self, key: PoolKey) -> Optional[dict]:
+        ritual_name, ritual_question, member_name = key
+        async with self._refill_slots:
+            try:
+                response = await self.refill(
+                    ritual_name=ritual_name, ritual_question=ritual_question, member_name=member_name
+                )
+            except Exception as e:
+                print(f"[PULSE POOL] Refill failed for {member_name} / {ritual_name}: {e}")
+                return None
+        self.generated += 1
+        return response
+
+    async def _refill(self, key: PoolKey, pool: _KeyPool) -> None:
+        # Background fills aren't latency-sensitive; never hedge them
+        hedge_endpoint.set(None)
+        # Duplicates and invalid outputs are retried, within a bound
+        attempts = 2 * self.high_watermark
+        while len(pool.entries) < self.high_watermark and attempts > 0:
+            needed = min(self.high_watermark - len(pool.entries), attempts)
+            attempts -= needed
+            responses = await asyncio.gather(*(self._generate_for_pool(key) for _ in range(needed)))
+            if all(response is None for response in responses):
+                return
+            for response in responses:
+                cleaned = validate_pulse_response(response) if response is not None else None
+                text = _normalize(cleaned["text"]) if cleaned else None
+                if cleaned is None or text in self._served.get(key[2], ()) or any(
+                    _normalize(entry.response["text"]) == text for entry in pool.entries
+                ):
+                    self.rejected += response is not None
+                    continue
+                pool.entries.append(_Entry(cleaned))
+
+
+def load_warm_keys(path: Optional[str] = PULSE_POOL_WARM_FILE) -> list:
+    """Read the keys to fill at startup from PULSE_POOL_WARM_FILE (empty when unset)."""
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    return [(item["ritual_name"], item["ritual_question"], item.get("member_name", "Thomas")) for item in items]
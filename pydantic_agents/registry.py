@@ -0,0 +1,222 @@
+"""
+Agent registry with discovery and lazy loading.
+
+Agents under clients/default/agents/* are discovered by parsing their
+agent.py files, without importing them. An agent is imported and
+initialized on first use, or warmed in the background, depending on
+AGENT_LOADING.
+"""
+import ast
+import asyncio
+import importlib
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+AGENTS_DIR = Path(__file__).parent / "clients" / "default" / "agents"
+AGENTS_PACKAGE = "pydantic_agents.clients.default.agents"
+
+# eager: load every agent at startup (concurrently)
+# background: load the default agent at startup, warm the others in the background
+# lazy: load the default agent at startup, the others on first use
+AGENT_LOADING = os.getenv("AGENT_LOADING", "background").lower()
+# Comma-separated agent names this replica serves (empty: all discovered agents)
+AGENTS = [name.strip() for name in os.getenv("AGENTS", "").split(",") if name.strip()]
+# Agent directories that are never registered (templates)
+AGENT_EXCLUDE = [name.strip() for name in os.getenv("AGENT_EXCLUDE", "my_agent").split(",") if name.strip()]
+
+
+class AgentSpec:
+    """Where to find a discovered agent and how to set it up."""
+
+    def __init__(self, name: str, module: str, attribute: str, needs_init: bool, description: str):
+        self.name = name
+        self.module = module
+        self.attribute = attribute
+        self.needs_init = needs_init
+        self.description = description
+
+    def __repr__(self):
+        return f"AgentSpec({self.name!r}, {self.module}:{self.attribute})"
+
+
+def _string_value(node) -> Optional[str]:
+    return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else None
+
+
+def _class_info(node: ast.ClassDef) -> dict:
+    """Read `self.name` / `self.description` constants and whether there is an initialize()."""
+    info = {"name": None, "description": None, "initialize": False, "doc": ast.get_docstring(node) or ""}
+    for item in node.body:
+        if not isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        if item.name == "initialize":
+            info["initialize"] = True
+        if item.name != "__init__":
+            continue
+        for statement in ast.walk(item):
+            if not isinstance(statement, ast.Assign) or len(statement.targets) != 1:
+                continue
+            target = statement.targets[0]
+            if (isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name)
+                    and target.value.id == "self" and target.attr in ("name", "description")):
+                info[target.attr] = _string_value(statement.value)
+    return info
+
+
+def discover_agent(agent_dir: Path) -> Optional[AgentSpec]:
+    """
+    Describe the agent in `agent_dir` from the source of its agent.py.
+
+    Wrapper agents are a module-level instance (`x = SomeAgent()`) and are
+    registered under their `self.name`. Agents without an instance, such as
+    CommunityMemberAgent, are registered as the class named after the
+    directory, under the directory name with hyphens.
+    """
+    source_file = agent_dir / "agent.py"
+    if not source_file.exists():
+        return None
+    tree = ast.parse(source_file.read_text(encoding="utf-8"), filename=str(source_file))
+    module = f"{AGENTS_PACKAGE}.{agent_dir.name}.agent"
+    default_name = agent_dir.name.replace("_", "-")
+
+    classes = {node.name: _class_info(node) for node in tree.body if isinstance(node, ast.ClassDef)}
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+                and isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name)
+                and node.value.func.id in classes):
+            info = classes[node.value.func.id]
+            if not info["initialize"] and not info["name"]:
+                continue
+            return AgentSpec(info["name"] or default_name, module, node.targets[0].id,
+                             info["initialize"], info["description"] or info["doc"])
+
+    class_name = "".join(part.capitalize() for part in agent_dir.name.split("_")) + "Agent"
+    if class_name in classes:
+        info = classes[class_name]
+        return AgentSpec(default_name, module, class_name, False, info["description"] or info["doc"])
+    return None
+
+
+def discover_agents(agents_dir: Path = AGENTS_DIR, exclude: List[str] = AGENT_EXCLUDE) -> List[AgentSpec]:
+    specs = []
+    for agent_dir in sorted(agents_dir.iterdir()):
+        if not agent_dir.is_dir() or agent_dir.name.startswith(("_", ".")) or agent_dir.name in exclude:
+            continue
+        try:
+            spec = discover_agent(agent_dir)
+        except SyntaxError as e:
+            print(f"[REGISTRY] Skipping {agent_dir.name}: {e}")
+            continue
+        if spec:
+            specs.append(spec)
+    return specs
+
+
+class AgentRegistry:
+    """Simple agent registry for managing multiple agents."""
+    def __init__(self):
+        self._agents: Dict[str, any] = {}
+        self._specs: Dict[str, AgentSpec] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._errors: Dict[str, str] = {}
+        self._initialized = False
+        # Seconds each agent took to import and initialize
+        self.load_times: Dict[str, float] = {}
+
+    def register(self, name: str, agent_instance):
+        """Register an agent."""
+        self._agents[name] = agent_instance
+
+    def register_spec(self, spec: AgentSpec):
+        """Register a discovered agent, to be loaded on first use."""
+        self._specs[spec.name] = spec
+
+    def discover(self, agents_dir: Path = AGENTS_DIR, only: List[str] = AGENTS):
+        """Register every agent found under `agents_dir` (restricted to `only` when given)."""
+        for spec in discover_agents(agents_dir):
+            if not only or spec.name in only:
+                self.register_spec(spec)
+
+    def get(self, name: str):
+        """Get agent by name (None when it is not loaded yet)."""
+        return self._agents.get(name)
+
+    async def resolve(self, name: str):
+        """Get agent by name, importing and initializing it first if needed."""
+        agent = self._agents.get(name)
+        if agent is not None or name not in self._specs:
+            return agent
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            if name in self._agents:
+                return self._agents[name]
+            spec = self._specs[name]
+            start = time.perf_counter()
+            try:
+                # Imports are blocking; keep the event loop free for other requests
+                module = await asyncio.to_thread(importlib.import_module, spec.module)
+                agent = getattr(module, spec.attribute)
+                if spec.needs_init:
+                    await agent.initialize()
+            except Exception as e:
+                self._errors[name] = str(e)
+                raise
+            self._errors.pop(name, None)
+            self.load_times[name] = time.perf_counter() - start
+            self._agents[name] = agent
+            print(f"  Initialized: {name} ({self.load_times[name] * 1000:.0f} ms)")
+            return agent
+
+    def preload(self):
+        """
+        Discover, import and initialize every agent outside an event loop, in
+        the master process of a pre-forking server, so the workers share them.
+        Agent builders only create objects, so this opens no connections.
+        """
+        self.discover()
+        for name, spec in self._specs.items():
+            if name in self._agents:
+                continue
+            start = time.perf_counter()
+            try:
+                agent = getattr(importlib.import_module(spec.module), spec.attribute)
+                if spec.needs_init:
+                    asyncio.run(agent.initialize())
+            except Exception as e:
+                # Retried on first use in the workers
+                self._errors[name] = str(e)
+                print(f"ERROR preloading agent {name}: {e}")
+                continue
+            self.load_times[name] = time.perf_counter() - start
+            self._agents[name] = agent
+            print(f"  Preloaded: {name} ({self.load_times[name] * 1000:.0f} ms)")
+
+    async def load(self, names: List[str]):
+        """Load several agents concurrently; failures are logged, not raised."""
+        results = await asyncio.gather(*(self.resolve(name) for name in names), return_exceptions=True)
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                print(f"ERROR initializing agent {name}: {result}")
+
+    def list(self):
+        """List all registered agent names, loaded or not."""
+        return list(dict.fromkeys([*self._agents, *self._specs]))
+
+    def loaded(self):
+        return list(self._agents)
+
+    def errors(self) -> Dict[str, str]:
+        return dict(self._errors)
+
+    def description(self, name: str) -> str:
+        agent = self._agents.get(name)
+        if agent is not None and getattr(agent, "description", None):
+            return agent.description
+        spec = self._specs.get(name)
+        return spec.description if spec else ""
+
+    def items(self):
+        """Get all loaded agents."""
+        return self._agents.items()
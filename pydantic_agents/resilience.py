@@ -0,0 +1,270 @@
+"""
+Retry policy and circuit breakers for the upstreams (model APIs, MCP servers).
+
+Retries are limited by a shared retry budget (a fraction of recent traffic
+plus a small floor), so a degraded upstream sees at most a few extra calls
+instead of every request multiplying. Each upstream has a circuit breaker:
+after a run of failures it opens and calls fail fast, after a cool-down a
+few probe calls are let through (half-open), and a successful probe closes
+it again.
+
+The model clients get this through `ResilientTransport`; MCP tool calls go
+through the breaker of their server URL.
+"""
+import asyncio
+import email.utils
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+
+# Replaces the old `retries=20`: output validation / tool retries per agent run
+AGENT_RETRIES = int(os.getenv("AGENT_RETRIES", "3"))
+
+# Attempts per upstream HTTP request, including the first
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+# Retries may add at most this fraction of the requests in the window...
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+# ...plus this many per second, so retries still work at low traffic
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "1"))
+RETRY_BUDGET_WINDOW_SECONDS = float(os.getenv("RETRY_BUDGET_WINDOW_SECONDS", "10"))
+# Full-jitter exponential backoff: sleep a random time up to min(MAX, BASE * 2**attempt)
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.25"))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "8"))
+
+# Consecutive failures that open a breaker
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+# How long an open breaker fails fast before probing
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+# Calls let through at once while half-open
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+# Responses worth retrying (and counted as upstream failures)
+RETRY_STATUSES = {429, 502, 503, 504}
+# Errors where the request never reached the upstream, or the connection was stale
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(httpx.TransportError):
+    """The upstream's breaker is open; the call was not made."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"Circuit open for {upstream}, retry after {retry_after:.0f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class RetryBudget:
+    """Allows retries up to `ratio` of the requests (plus a floor) in a sliding window."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND,
+                 window: float = RETRY_BUDGET_WINDOW_SECONDS):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self.retries = 0
+        self.exhausted = 0
+
+    def _prune(self, now: float) -> None:
+        for times in (self._requests, self._retries):
+            while times and times[0] < now - self.window:
+                times.popleft()
+
+    def record_request(self) -> None:
+        self._requests.append(time.monotonic())
+
+    def try_retry(self) -> bool:
+        """Take one retry from the budget; False when it is used up."""
+        now = time.monotonic()
+        self._prune(now)
+        allowed = self.min_per_second * self.window + self.ratio * len(self._requests)
+        if len(self._retries) >= allowed:
+            self.exhausted += 1
+            return False
+        self._retries.append(now)
+        self.retries += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        self._prune(time.monotonic())
+        return {
+            "requests_in_window": len(self._requests),
+            "retries_in_window": len(self._retries),
+            "retries": self.retries,
+            "exhausted": self.exhausted,
+        }
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one upstream."""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 open_seconds: float = BREAKER_OPEN_SECONDS, half_open_probes: int = BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.failures = 0
+        self.successes = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now."""
+        if self.state == OPEN and self.retry_after() <= 0:
+            self.state = HALF_OPEN
+            self._probes = 0
+        if self.state == HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return
+        if self.state != CLOSED:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.retry_after() or self.open_seconds)
+
+    def record_success(self) -> None:
+        self.successes += 1
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            print(f"[BREAKER] {self.name} closed")
+        self.state = CLOSED
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            self.opened += 1
+            print(f"[BREAKER] {self.name} open after {self.consecutive_failures} failures, "
+                  f"failing fast for {self.open_seconds:g}s")
+
+    def release_probe(self) -> None:
+        """A half-open probe ended without a verdict (e.g. it was cancelled)."""
+        if self.state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failures": self.failures,
+            "successes": self.successes,
+            "rejected": self.rejected,
+            "opened": self.opened,
+            "retry_after": round(self.retry_after(), 1) if self.state == OPEN else 0,
+        }
+
+
+class CircuitBreakers:
+    """One breaker per upstream name, created on first use."""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        if name not in self._breakers:
+            self._breakers[name] = CircuitBreaker(name)
+        return self._breakers[name]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BACKOFF_BASE, cap: float = RETRY_BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _retry_after_header(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Malformed header: fall back to the normal backoff
+        return None
+    return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that retries failed upstream requests within the retry
+    budget, with jittered backoff, behind the upstream's circuit breaker.
+
+    Only responses with a retryable status (429, 502-504) and connection
+    errors are retried; once a response streams, it is returned as is.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, breaker: CircuitBreaker,
+                 budget: "RetryBudget", max_attempts: int = RETRY_MAX_ATTEMPTS):
+        self._transport = transport
+        self.breaker = breaker
+        self.budget = budget
+        self.max_attempts = max(1, max_attempts)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # The body is sent again on retry
+        await request.aread()
+        self.budget.record_request()
+        attempt = 0
+        while True:
+            self.breaker.check()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except RETRY_ERRORS as e:
+                self.breaker.record_failure()
+                if not self._may_retry(attempt):
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"[RETRY] {self.breaker.name}: {type(e).__name__}, retry {attempt + 1} in {delay:.2f}s")
+            except httpx.TransportError:
+                # e.g. a read timeout: the upstream may have done the work, don't repeat it
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES and response.status_code < 500:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if response.status_code not in RETRY_STATUSES or not self._may_retry(attempt):
+                    return response
+                await response.aclose()
+                delay = max(backoff_delay(attempt), min(_retry_after_header(response) or 0, RETRY_BACKOFF_MAX))
+                print(f"[RETRY] {self.breaker.name}: HTTP {response.status_code}, "
+                      f"retry {attempt + 1} in {delay:.2f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _may_retry(self, attempt: int) -> bool:
+        # No point in waiting to retry once the breaker has opened
+        return attempt + 1 < self.max_attempts and self.breaker.state == CLOSED and self.budget.try_retry()
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+# Shared by every upstream
+retry_budget = RetryBudget()
+breakers = CircuitBreakers()
@@ -1,18 +1,18 @@
 """
 FastAPI server for AI agents with multi-agent support.
 """
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import uvicorn
 import os
 import json
 import asyncio
+import io
 import sys
-from dotenv import load_dotenv
-from typing import Dict, Optional, List
-# from pocketbase import PocketBase  # Placeholder - not using PocketBase yet
-# from pocketbase.client import ClientResponseError
+import time
+import uuid
+from starlette.requests import ClientDisconnect
+from typing import Optional, List
 from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, UserPromptPart, TextPart
 from pydantic_ai.messages import (
     PartStartEvent,
@@ -23,96 +23,176 @@ from pydantic_ai.messages import (
     FunctionToolCallEvent,
     FunctionToolResultEvent
 )
-
-# Load environment variables
-load_dotenv()
+from pydantic_agents.admission import AdmissionController, Overloaded
+from pydantic_agents.batching import NUDGE_BATCH_MAX_CONCURRENCY, NUDGE_BATCH_MAX_ITEMS, map_concurrent
+from pydantic_agents.cassettes import cassettes
+from pydantic_agents.coalescing import SingleFlight, coalesce_key
+from pydantic_agents.hedging import hedge_endpoint, hedger
+from pydantic_agents.history import HISTORY_TOKEN_BUDGET, ConversationHistoryCache, HistoryCompactor
+from pydantic_agents.mcp_pool import cancel_run, mcp_pool, start_run
+from pydantic_agents.metrics import (
+    CONTENT_TYPE,
+    METRICS_ENABLED,
+    active_streams,
+    metrics,
+    record_request,
+    record_stream_rate,
+    stats_metrics,
+    stream_cancellations,
+    stream_ttft_seconds,
+    track_request,
+    tracked,
+)
+from pydantic_agents.persistence import TurnPersister
+from pydantic_agents.pocketbase_client import AsyncPocketBase, PocketBaseError, quote_filter_value
+from pydantic_agents.providers import providers
+from pydantic_agents.pulse_pool import PULSE_POOL_ENABLED, PulseResponsePool, load_warm_keys
+from pydantic_agents.registry import AGENT_LOADING, AgentRegistry
+from pydantic_agents.resilience import breakers, retry_budget
+from pydantic_agents.streaming import (
+    CleanupStreamingResponse,
+    EventChannel,
+    coalesce_deltas,
+    get_encoder,
+    wait_for_disconnect,
+)
+from pydantic_agents.tool_cache import tool_result_cache
+from pydantic_agents.tracing import NOOP_SPAN, current_span, tracer
 
 app = FastAPI(title="TwoFeetUp Agent API", version="0.2.0")
 
-# Global PocketBase client (placeholder)
-pb_client: Optional[any] = None  # Placeholder - will use PocketBase later
 
-# Agent registry
-class AgentRegistry:
-    """Simple agent registry for managing multiple agents."""
-    def __init__(self):
-        self._agents: Dict[str, any] = {}
-        self._initialized = False
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc: Overloaded):
+    """Backpressure: tell the client when to come back instead of queueing it indefinitely."""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "agent": exc.agent},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+# Global PocketBase client (None when POCKETBASE_URL is not configured)
+pb_client: Optional[AsyncPocketBase] = None
+
+# Write-behind persister for chat turns (None without PocketBase)
+persister: Optional[TurnPersister] = None
+
+# Converted conversation histories, keyed by conversation_id
+history_cache = ConversationHistoryCache()
 
-    def register(self, name: str, agent_instance):
-        """Register an agent."""
-        self._agents[name] = agent_instance
+# Rolling summaries that keep histories within each agent's token budget
+history_compactor = HistoryCompactor()
 
-    def get(self, name: str):
-        """Get agent by name."""
-        return self._agents.get(name)
+# Per-agent concurrency limits and wait queues in front of the model
+admission = AdmissionController()
 
-    def list(self):
-        """List all registered agent names."""
-        return list(self._agents.keys())
+# Identical concurrent generations share one upstream call
+generations = SingleFlight()
 
-    def items(self):
-        """Get all agents."""
-        return self._agents.items()
+# Pre-generated pulse responses (None when PULSE_POOL_ENABLED=0)
+pulse_pool: Optional[PulseResponsePool] = None
 
 # Global registry
 registry = AgentRegistry()
 
 # Default agent from environment or fallback
 DEFAULT_AGENT = os.getenv("DEFAULT_AGENT", "event-planner")
+# Ends the stored reply of a /chat/stream turn the client disconnected from
+INTERRUPTED_MARKER = os.getenv("INTERRUPTED_MARKER", "[interrupted]")
+
+# Background loading of the non-default agents (AGENT_LOADING=background)
+warmup_task: Optional[asyncio.Task] = None
+
+
+def agent_label(name: str) -> str:
+    """Metrics label for an agent; unknown names share one label."""
+    return name if name in registry.list() else "unknown"
+
+
+def collect_component_metrics():
+    """Queue depths, breakers, caches, coalescing and hedging, read on each /metrics scrape."""
+    return stats_metrics(admission, generations, pulse_pool, history_cache)
+
+
+metrics.collector(collect_component_metrics)
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize all agents on startup."""
-    global pb_client
-
-    print("Skipping PocketBase initialization (placeholder for now)...")
-    pb_client = None  # Placeholder
-
-    print("Initializing agents...")
+    global pb_client, persister, pulse_pool, warmup_task
+
+    pb_client = AsyncPocketBase.from_env()
+    if pb_client:
+        persister = TurnPersister(pb_client)
+        persister.start()
+        print(f"PocketBase client ready: {pb_client.base_url}")
+    else:
+        print("POCKETBASE_URL not set, conversation history disabled")
+
+    if cassettes.enabled:
+        print(f"[CASSETTE] {cassettes.mode.capitalize()}ing model and MCP traffic in {cassettes.directory}/")
+    print(f"Initializing agents ({AGENT_LOADING} loading)...")
+    # Open model connections (DNS + TLS) while the agents load
+    prewarm_task = asyncio.create_task(providers.prewarm())
     try:
-        # Import all agents
-        from pydantic_agents.clients.default.agents.contract_clearance.agent import contract_clearance_agent
-        from pydantic_agents.clients.default.agents.event_planner.agent import event_planner_agent
-        from pydantic_agents.clients.default.agents.event_contract_assistant.agent import event_contract_assistant_agent
-        from pydantic_agents.clients.default.agents.marketing_communicatie.agent import marketing_communicatie_agent
-        from pydantic_agents.clients.default.agents.community_member import CommunityMemberAgent
-        from pydantic_agents.clients.default.agents.reengagement import ReengagementAgent
-
-        # Register agents (using hyphenated names for frontend compatibility)
-        registry.register("contract-clearance", contract_clearance_agent)
-        registry.register("event-planner", event_planner_agent)
-        registry.register("event-contract-assistant", event_contract_assistant_agent)
-        registry.register("marketing-communicatie", marketing_communicatie_agent)
-
-        # Register community member (no wrapper, direct class)
-        registry.register("community-member", CommunityMemberAgent)
-
-        # Register re-engagement agent (no wrapper, direct class)
-        registry.register("reengagement", ReengagementAgent)
-
-        # Initialize all agents (except community-member and reengagement which don't need init)
-        for name, agent in registry.items():
-            if name not in ["community-member", "reengagement"] and hasattr(agent, 'initialize'):
-                await agent.initialize()
-                print(f"  Initialized: {name}")
-            elif name in ["community-member", "reengagement"]:
-                print(f"  Registered: {name} (no initialization needed)")
-
-        print(f"All agents initialized. Default: {DEFAULT_AGENT}")
-        print(f"Registered agents: {registry.list()}")
+        # Discover agents without importing them (using hyphenated names for frontend compatibility)
+        registry.discover()
+        names = registry.list()
+        print(f"Registered agents: {names}")
+
+        if AGENT_LOADING == "eager":
+            await registry.load(names)
+        elif DEFAULT_AGENT in names:
+            # Ready as soon as the default agent is up
+            await registry.resolve(DEFAULT_AGENT)
+        else:
+            print(f"WARNING: default agent '{DEFAULT_AGENT}' is not registered")
+
+        if AGENT_LOADING == "background":
+            warmup_task = asyncio.create_task(registry.load([n for n in names if n != DEFAULT_AGENT]))
+
+        # Open the shared MCP sessions now instead of on the first request
+        asyncio.create_task(mcp_pool.warm())
+
+        if PULSE_POOL_ENABLED and "community-member" in names:
+            pulse_pool = PulseResponsePool(generate_pulse_with_agent, refill=pregenerate_pulse_with_agent)
+            warm_keys = load_warm_keys()
+            if warm_keys:
+                # Filled in the background; requests before it finishes generate live
+                asyncio.create_task(pulse_pool.warm(warm_keys))
+            print(f"  Pulse response pool enabled ({len(warm_keys)} keys to pre-fill)")
+
+        await prewarm_task
+        print(f"Agents ready. Default: {DEFAULT_AGENT}, loaded: {registry.loaded()}")
         print("[STARTUP] Registering /community/pulse-response endpoint...")
 
     except Exception as e:
         print(f"ERROR initializing agents: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued turns, then close pooled connections."""
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    if pulse_pool:
+        await pulse_pool.close()
+    await mcp_pool.close()
+    tool_result_cache.save()
+    if persister:
+        await persister.close()
+    if pb_client:
+        await pb_client.aclose()
+    await providers.aclose()
+
 print("[MODULE] server.py loaded, defining routes...")
 
 class MessageRequest(BaseModel):
     message: str
     conversation_id: str | None = None
+    user_id: str | None = None  # Conversation owner; looked up when omitted
     agent: str | None = None  # Agent selector
+    coalesce: bool = True  # Share the run with identical requests in flight
 
 class MessageResponse(BaseModel):
     response: str
@@ -132,38 +212,96 @@ def pb_message_to_model_message(pb_msg: dict) -> Optional[ModelMessage]:
 
     return None
 
+@tracer.traced("load_conversation_history")
 async def load_conversation_history(conversation_id: str) -> List[ModelMessage]:
-    """Load conversation history from PocketBase and convert to pydantic-ai format."""
+    """
+    Load conversation history and convert it to pydantic-ai format.
+
+    Served from the in-process history cache when possible; on a miss the
+    newest messages are fetched from PocketBase and the result is cached.
+    """
     if not pb_client or not conversation_id:
         return []
 
+    cached = history_cache.get(conversation_id)
+    current_span().set(cached=cached is not None)
+    if cached is not None:
+        return cached
+
     try:
-        # Fetch messages from PocketBase, sorted by creation time
-        messages = pb_client.collection("messages").get_list(
-            1, 500,  # page, per_page
-            query_params={
-                "filter": f'conversationId = "{conversation_id}"',
-                "sort": "created"
-            }
+        # Fetch the newest messages from PocketBase, then restore chronological order
+        messages = await pb_client.get_list(
+            "messages",
+            1, history_cache.max_messages,  # page, per_page
+            filter=f"conversationId = {quote_filter_value(conversation_id)}",
+            # A turn's two messages are created in one batch and can share `created`;
+            # the rowid (insertion order) keeps the user message before the reply
+            sort="-created,-@rowid"
         )
 
         # Convert to pydantic-ai format
         history: List[ModelMessage] = []
-        for msg in messages.items:
-            converted = pb_message_to_model_message(msg.__dict__)
+        for msg in reversed(messages["items"]):
+            converted = pb_message_to_model_message(msg)
             if converted:
                 history.append(converted)
 
+        history_cache.put(conversation_id, history)
+        current_span().set(messages=len(history))
         print(f"Loaded {len(history)} messages from conversation {conversation_id}")
         return history
 
-    except ClientResponseError as e:
+    except PocketBaseError as e:
         print(f"Error loading conversation history: {e}")
         return []
     except Exception as e:
         print(f"Unexpected error loading history: {e}")
         return []
 
+@tracer.traced("prepare_history")
+async def prepare_history(agent_wrapper, conversation_id: str | None) -> List[ModelMessage]:
+    """Load the history for a turn and fit it into the agent's token budget."""
+    history = await load_conversation_history(conversation_id)
+    budget = getattr(agent_wrapper, "history_token_budget", HISTORY_TOKEN_BUDGET)
+    return await history_compactor.compact(conversation_id, history, budget)
+
+def cache_turn(request: MessageRequest, assistant_message: str):
+    history_cache.append(request.conversation_id, [
+        pb_message_to_model_message({"role": "user", "content": request.message}),
+        pb_message_to_model_message({"role": "assistant", "content": assistant_message}),
+    ])
+
+
+async def record_turn(request: MessageRequest, assistant_message: str):
+    """
+    Record a finished turn: append it to the cached history so the next turn
+    needs no refetch, and queue it for write-behind persistence.
+    """
+    conversation_id = request.conversation_id
+    if not conversation_id:
+        return
+    cache_turn(request, assistant_message)
+    if persister:
+        await persister.enqueue_turn(
+            conversation_id, request.message, assistant_message, user_id=request.user_id
+        )
+
+
+def record_interrupted_turn(request: MessageRequest, partial_message: str):
+    """
+    Record a turn the client disconnected from: what was streamed so far,
+    ended by INTERRUPTED_MARKER. Doesn't wait, as the stream is being torn down.
+    """
+    conversation_id = request.conversation_id
+    if not conversation_id:
+        return
+    assistant_message = f"{partial_message}\n\n{INTERRUPTED_MARKER}" if partial_message else INTERRUPTED_MARKER
+    cache_turn(request, assistant_message)
+    if persister:
+        persister.enqueue_turn_nowait(
+            conversation_id, request.message, assistant_message, user_id=request.user_id
+        )
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
@@ -174,15 +312,53 @@ async def root():
         "default_agent": DEFAULT_AGENT
     }
 
+@app.get("/health")
+async def health():
+    """Readiness check: healthy once the default agent is loaded."""
+    loaded = registry.loaded()
+    ready = DEFAULT_AGENT in loaded
+    body = {
+        "status": "healthy" if ready else "starting",
+        "default_agent": DEFAULT_AGENT,
+        "loaded": loaded,
+        "pending": [name for name in registry.list() if name not in loaded],
+        "errors": registry.errors(),
+        "admission": admission.stats(),
+        "upstreams": breakers.stats(),
+        "retry_budget": retry_budget.stats(),
+        "hedging": hedger.stats(),
+        "history_cache": history_cache.stats(),
+    }
+    if cassettes.enabled:
+        body["cassettes"] = cassettes.stats()
+    if not ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/traces")
+async def traces(conversation_id: str | None = None, request_id: str | None = None, limit: int = 20):
+    """Recent /chat/stream traces, newest first."""
+    if not tracer.enabled:
+        raise HTTPException(status_code=404, detail="Tracing is disabled")
+    return {"traces": tracer.recent(conversation_id, request_id, min(limit, 200))}
+
 @app.get("/agents")
 async def list_agents():
     """List all available agents."""
     agents_info = {}
-    for name, agent_wrapper in registry.items():
+    for name in registry.list():
         agents_info[name] = {
             "name": name,
-            "description": agent_wrapper.description,
-            "model": "GLM-4.5"
+            "description": registry.description(name),
+            "model": "GLM-4.5",
+            "loaded": registry.get(name) is not None
         }
 
     return {
@@ -191,40 +367,68 @@ async def list_agents():
     }
 
 @app.post("/chat", response_model=MessageResponse)
+@tracked("chat", lambda request: agent_label(request.agent or DEFAULT_AGENT))
 async def chat(request: MessageRequest):
     """
     Chat endpoint for the agent (non-streaming).
     Routes to appropriate agent based on request.agent parameter.
     """
+    hedge_endpoint.set("chat")
     try:
         # Get agent name from request or use default
         agent_name = request.agent or DEFAULT_AGENT
 
         # Get agent from registry
-        agent_wrapper = registry.get(agent_name)
+        agent_wrapper = await registry.resolve(agent_name)
         if not agent_wrapper:
             raise HTTPException(
                 status_code=404,
                 detail=f"Agent '{agent_name}' not found. Available agents: {', '.join(registry.list())}"
             )
 
-        # Run agent
-        result = await agent_wrapper.agent.run(request.message)
+        async def run() -> str:
+            # Run agent with the (compacted) conversation history
+            history = await prepare_history(agent_wrapper, request.conversation_id)
+            async with admission.slot(agent_name):
+                result = await agent_wrapper.agent.run(request.message, message_history=history)
+            # Recorded once, however many identical requests share the run
+            await record_turn(request, str(result.output))
+            return str(result.output)
+
+        key = coalesce_key(agent_name, message=request.message,
+                           conversation_id=request.conversation_id, user_id=request.user_id)
+        output = await generations.do(key, run, coalesce=request.coalesce)
 
         return MessageResponse(
-            response=str(result.output),
+            response=output,
             conversation_id=request.conversation_id or "default",
             agent=agent_name
         )
-    except HTTPException:
+    except (HTTPException, Overloaded):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def generate_pulse_with_agent(**kwargs) -> dict:
+    """Generate a pulse response with the community member agent, for a live request."""
+    community_agent = await registry.resolve("community-member")
+    async with admission.slot("community-member"):
+        return await community_agent.generate_pulse_response(**kwargs)
+
+async def pregenerate_pulse_with_agent(**kwargs) -> dict:
+    """
+    Generate a pulse response to fill the pulse pool. Limited by the pool's
+    own refill concurrency instead of admission, so refills never push live
+    requests into 429s.
+    """
+    community_agent = await registry.resolve("community-member")
+    return await community_agent.generate_pulse_response(**kwargs)
+
 class PulseResponseRequest(BaseModel):
     ritual_name: str
     ritual_question: str
     member_name: str = "Thomas"
+    coalesce: bool = True  # Share the generation with identical requests in flight
 
 class PulseResponseResponse(BaseModel):
     text: str
@@ -232,24 +436,33 @@ class PulseResponseResponse(BaseModel):
     member_name: str
 
 @app.post("/community/pulse-response", response_model=PulseResponseResponse)
+@tracked("pulse", "community-member")
 async def generate_pulse_response(request: PulseResponseRequest):
     """
     Generate an authentic Pulse B response using the Community Member Agent.
+    Served from the pre-generated pulse pool when it has a response ready.
     """
     print(f"[ENDPOINT] /community/pulse-response called with: {request.member_name}")
+    hedge_endpoint.set("pulse")
     try:
-        community_agent = registry.get("community-member")
+        community_agent = await registry.resolve("community-member")
         print(f"[AGENT] Got community agent: {community_agent}")
         if not community_agent:
             print("[ERROR] Community member agent not found in registry")
             raise HTTPException(status_code=404, detail="Community member agent not found")
 
-        # Generate response
-        response = await community_agent.generate_pulse_response(
+        # Take a pooled response, or generate one live
+        generate = pulse_pool.get if pulse_pool else generate_pulse_with_agent
+        inputs = dict(
             ritual_name=request.ritual_name,
             ritual_question=request.ritual_question,
             member_name=request.member_name
         )
+        response = await generations.do(
+            coalesce_key("community-member", **inputs),
+            lambda: generate(**inputs),
+            coalesce=request.coalesce,
+        )
 
         print(f"[RESPONSE] Generated response: {response}")
 
@@ -259,6 +472,8 @@ async def generate_pulse_response(request: PulseResponseRequest):
             member_name=request.member_name
         )
 
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         import traceback
         print(f"[ERROR] Exception generating response: {e}")
@@ -272,6 +487,18 @@ class NudgeRequest(BaseModel):
     days_inactive: int
     last_activity: str = "deelname aan pulse"
     upcoming_event: str | None = None
+    coalesce: bool = True  # Share the generation with identical requests in flight
+
+
+async def coalesced_nudge(reengagement, request: NudgeRequest) -> dict:
+    """Generate a nudge, sharing the call with identical requests in flight."""
+    inputs = request.model_dump(exclude={"coalesce"})
+
+    async def generate() -> dict:
+        async with admission.slot("reengagement"):
+            return await reengagement.generate_nudge(**inputs)
+
+    return await generations.do(coalesce_key("reengagement", **inputs), generate, coalesce=request.coalesce)
 
 
 class NudgeResponse(BaseModel):
@@ -284,29 +511,28 @@ class NudgeResponse(BaseModel):
 
 
 @app.post("/reengagement/generate-nudge", response_model=NudgeResponse)
+@tracked("nudge", "reengagement")
 async def generate_nudge(request: NudgeRequest):
     """
     Generate a warm re-engagement nudge for an inactive member.
     Tier automatically determined based on days_inactive.
     """
     print(f"[ENDPOINT] /reengagement/generate-nudge called for: {request.member_name} ({request.days_inactive} days)")
+    hedge_endpoint.set("nudge")
     try:
-        reengagement = registry.get("reengagement")
+        reengagement = await registry.resolve("reengagement")
         if not reengagement:
             raise HTTPException(status_code=404, detail="Re-engagement agent not found")
 
         # Generate nudge
-        nudge = await reengagement.generate_nudge(
-            member_name=request.member_name,
-            days_inactive=request.days_inactive,
-            last_activity=request.last_activity,
-            upcoming_event=request.upcoming_event,
-        )
+        nudge = await coalesced_nudge(reengagement, request)
 
         print(f"[NUDGE] Generated: {nudge['message']}")
 
         return NudgeResponse(**nudge)
 
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         import traceback
         print(f"[ERROR] Exception generating nudge: {e}")
@@ -314,6 +540,59 @@ async def generate_nudge(request: NudgeRequest):
         raise HTTPException(status_code=500, detail=f"Error generating nudge: {str(e)}")
 
 
+class NudgeBatchRequest(BaseModel):
+    requests: List[NudgeRequest]
+    max_concurrency: int | None = None  # Capped at NUDGE_BATCH_MAX_CONCURRENCY
+
+
+@app.post("/reengagement/generate-nudges")
+async def generate_nudges(request: NudgeBatchRequest):
+    """
+    Generate nudges for a list of members, e.g. a whole circle at once.
+
+    Nudges are generated concurrently (bounded by max_concurrency) and
+    streamed back as NDJSON in the order they finish. Each line carries the
+    item's `index` in the request and either a `nudge` or an `error`; a
+    failed item does not stop the rest. The last line is a summary.
+    """
+    print(f"[ENDPOINT] /reengagement/generate-nudges called for {len(request.requests)} members")
+    if len(request.requests) > NUDGE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(request.requests)} items (max {NUDGE_BATCH_MAX_ITEMS})"
+        )
+    reengagement = await registry.resolve("reengagement")
+    if not reengagement:
+        raise HTTPException(status_code=404, detail="Re-engagement agent not found")
+
+    concurrency = min(request.max_concurrency or NUDGE_BATCH_MAX_CONCURRENCY, NUDGE_BATCH_MAX_CONCURRENCY)
+
+    async def generate_one(item: NudgeRequest) -> dict:
+        async with track_request("reengagement", "nudges"):
+            nudge = await coalesced_nudge(reengagement, item)
+        return NudgeResponse(**nudge).model_dump()
+
+    async def generate():
+        succeeded = failed = 0
+        async for index, nudge, error in map_concurrent(generate_one, request.requests, concurrency):
+            line = {"index": index, "member_name": request.requests[index].member_name}
+            if error is None:
+                succeeded += 1
+                line["nudge"] = nudge
+            else:
+                failed += 1
+                print(f"[ERROR] Nudge {index} for {line['member_name']} failed: {error}")
+                line["error"] = str(error)
+                if isinstance(error, Overloaded):
+                    line["retry_after"] = error.retry_after
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        print(f"[NUDGE BATCH] Done: {succeeded} generated, {failed} failed")
+        yield json.dumps({"done": True, "total": len(request.requests),
+                          "succeeded": succeeded, "failed": failed}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 class BuddyNudgeRequest(BaseModel):
     member_name: str
     buddy_name: str = "Thomas"
@@ -330,28 +609,33 @@ class BuddyNudgeResponse(BaseModel):
 
 
 @app.post("/reengagement/buddy-nudge", response_model=BuddyNudgeResponse)
+@tracked("buddy-nudge", "reengagement")
 async def generate_buddy_nudge(request: BuddyNudgeRequest):
     """
     Generate a buddy invitation as a re-engagement nudge.
     """
     print(f"[ENDPOINT] /reengagement/buddy-nudge called: {request.buddy_name} → {request.member_name}")
+    hedge_endpoint.set("buddy-nudge")
     try:
-        reengagement = registry.get("reengagement")
+        reengagement = await registry.resolve("reengagement")
         if not reengagement:
             raise HTTPException(status_code=404, detail="Re-engagement agent not found")
 
         # Generate buddy nudge
-        nudge = await reengagement.generate_buddy_nudge(
-            member_name=request.member_name,
-            buddy_name=request.buddy_name,
-            day=request.day,
-            time=request.time,
-        )
+        async with admission.slot("reengagement"):
+            nudge = await reengagement.generate_buddy_nudge(
+                member_name=request.member_name,
+                buddy_name=request.buddy_name,
+                day=request.day,
+                time=request.time,
+            )
 
         print(f"[BUDDY NUDGE] Generated: {nudge['message']}")
 
         return BuddyNudgeResponse(**nudge)
 
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         import traceback
         print(f"[ERROR] Exception generating buddy nudge: {e}")
@@ -360,19 +644,47 @@ async def generate_buddy_nudge(request: BuddyNudgeRequest):
 
 
 @app.post("/chat/stream")
-async def chat_stream(request: MessageRequest):
+async def chat_stream(
+    request: MessageRequest,
+    http_request: Request,
+    x_sse_protocol: str | None = Header(default=None),
+    x_request_id: str | None = Header(default=None)
+):
     """
     Streaming chat endpoint for the agent.
     Returns Server-Sent Events (SSE) for progressive response rendering.
     Captures reasoning, tool calls, and all events from Pydantic AI.
+
+    Send `X-SSE-Protocol: 2` for compact frames: conversation and agent
+    metadata only appear in the ping frame. The turn is traced under the
+    `X-Request-ID` header (generated when absent, and returned), see /traces.
+
+    When the client disconnects mid-turn, the agent run and its MCP tool
+    calls are cancelled, and what was streamed is stored as an interrupted
+    reply.
     """
+    started = time.perf_counter()
+    request_id = x_request_id or uuid.uuid4().hex
+    # Get agent name from request or use default
+    agent_name = request.agent or DEFAULT_AGENT
+    label = agent_label(agent_name)
+    # Admitted before the stream starts, so an overloaded agent gets a real 429
+    try:
+        slot = await admission.acquire(agent_name) if agent_name in registry.list() else None
+    except Overloaded as e:
+        record_request(label, "chat-stream", time.perf_counter() - started, e)
+        raise
+
     async def generate():
+        active_streams.inc(agent=label)
+        error = None
+        agent_task = None
+        disconnect_watch = None
+        trace = tracer.start_trace("chat_stream", request_id=request_id, agent=label,
+                                   conversation_id=request.conversation_id or "default")
         try:
-            # Get agent name from request or use default
-            agent_name = request.agent or DEFAULT_AGENT
-
             # Get agent from registry
-            agent_wrapper = registry.get(agent_name)
+            agent_wrapper = await registry.resolve(agent_name)
             if not agent_wrapper:
                 error_data = {
                     "error": f"Agent '{agent_name}' not found",
@@ -381,169 +693,194 @@ async def chat_stream(request: MessageRequest):
                 yield f"data: {json.dumps(error_data)}\n\n"
                 return
 
-            # Load conversation history from PocketBase
+            # Load conversation history, compacted to the agent's token budget
             conversation_id = request.conversation_id or "default"
-            history = await load_conversation_history(conversation_id)
+            history = await prepare_history(agent_wrapper, request.conversation_id)
 
-            # Event queue for streaming
-            event_queue = []
-            full_response = ""
+            # Push channel between the event handler and this generator
+            channel = EventChannel()
+            # Text is appended to a buffer so long outputs are built in linear time
+            full_response = io.StringIO()
 
-            # Event stream handler to capture ALL Pydantic AI events
+            # Tool calls in flight, by tool_call_id, until their result arrives
+            tool_spans = {}
+
+            # Event stream handler to capture ALL Pydantic AI events.
+            # Conversation and agent metadata are added by the SSE encoder.
             async def event_stream_handler(ctx, events):
-                nonlocal full_response
                 part_index = 0
 
                 async for event in events:
                     # Reasoning/thinking (DeepSeek/GLM-4.5)
                     if isinstance(event, PartStartEvent) and isinstance(event.part, ThinkingPart):
-                        event_queue.append({
+                        await channel.put({
                             "event_kind": "part_start",
                             "part": {
                                 "part_kind": "thinking",
                                 "content": event.part.content
                             },
-                            "index": part_index,
-                            "conversation_id": conversation_id,
-                            "agent": agent_name
+                            "index": part_index
                         })
                         part_index += 1
 
                     elif isinstance(event, PartDeltaEvent) and isinstance(event.delta, ThinkingPartDelta):
-                        event_queue.append({
+                        await channel.put({
                             "event_kind": "part_delta",
                             "delta": {
                                 "part_delta_kind": "thinking",
                                 "content_delta": event.delta.content_delta
                             },
-                            "index": part_index - 1,
-                            "conversation_id": conversation_id,
-                            "agent": agent_name
+                            "index": part_index - 1
                         })
 
                     # Regular text streaming
                     elif isinstance(event, PartStartEvent) and isinstance(event.part, TextPart):
-                        event_queue.append({
+                        await channel.put({
                             "event_kind": "part_start",
                             "part": {
                                 "part_kind": "text",
                                 "content": event.part.content
                             },
-                            "index": part_index,
-                            "conversation_id": conversation_id,
-                            "agent": agent_name
+                            "index": part_index
                         })
-                        full_response += event.part.content
+                        full_response.write(event.part.content)
                         part_index += 1
 
                     elif isinstance(event, PartDeltaEvent) and isinstance(event.delta, TextPartDelta):
-                        full_response += event.delta.content_delta
-                        event_queue.append({
+                        full_response.write(event.delta.content_delta)
+                        await channel.put({
                             "event_kind": "part_delta",
                             "delta": {
                                 "part_delta_kind": "text",
                                 "content_delta": event.delta.content_delta
                             },
-                            "index": part_index - 1,
-                            "conversation_id": conversation_id,
-                            "agent": agent_name
+                            "index": part_index - 1
                         })
 
                     # Function/tool calls
                     elif isinstance(event, FunctionToolCallEvent):
-                        event_queue.append({
+                        tool_spans[event.tool_call_id] = tracer.start_span(
+                            "tool_call", parent=run_span, tool=event.part.tool_name
+                        )
+                        await channel.put({
                             "event_kind": "function_tool_call",
                             "part": {
                                 "tool_call_id": f"tool-{part_index}",
                                 "tool_name": event.part.tool_name,
                                 "args": event.part.args if hasattr(event.part, 'args') else {}
-                            },
-                            "conversation_id": conversation_id,
-                            "agent": agent_name
+                            }
                         })
                         part_index += 1
 
                     elif isinstance(event, FunctionToolResultEvent):
-                        event_queue.append({
+                        tool_spans.pop(event.tool_call_id, NOOP_SPAN).end()
+                        await channel.put({
                             "event_kind": "function_tool_result",
                             "result": {
                                 "part_kind": "tool-return",
                                 "tool_call_id": f"tool-{part_index-1}",
                                 "tool_name": event.part.tool_name if hasattr(event, 'part') and hasattr(event.part, 'tool_name') else "unknown",
                                 "content": str(event.result)
-                            },
-                            "conversation_id": conversation_id,
-                            "agent": agent_name
+                            }
                         })
 
             # Send initial ping
-            yield f"data: {json.dumps({'type': 'ping', 'conversation_id': conversation_id, 'agent': agent_name})}\n\n"
+            encoder = get_encoder(x_sse_protocol, conversation_id, agent_name)
+            yield encoder.ping()
 
             # Create agent task asynchronously
-            agent_task = asyncio.create_task(
+            run_span = tracer.start_span("agent.run")
+            agent_task = start_run(
                 agent_wrapper.agent.run(
                     request.message,
                     message_history=history,
                     event_stream_handler=event_stream_handler
                 )
             )
-
-            streamed_count = 0
-
-            # Keep streaming while agent is running OR there are unstreamed events
-            while not agent_task.done() or streamed_count < len(event_queue):
-                # Stream all events that have accumulated
-                while streamed_count < len(event_queue):
-                    event = event_queue[streamed_count]
-                    yield f"data: {json.dumps(event)}\n\n"
-                    streamed_count += 1
-
-                # If agent still running, wait briefly then check for more events
-                if not agent_task.done():
-                    await asyncio.sleep(0.1)  # Non-blocking wait
+            # Close the channel when the run ends so the loop below stops
+            agent_task.add_done_callback(lambda _: channel.close())
+            agent_task.add_done_callback(lambda _: run_span.end())
+            # Stop the run as soon as the client disconnects
+            disconnect_watch = asyncio.create_task(wait_for_disconnect(http_request.receive))
+            disconnect_watch.add_done_callback(lambda watch: watch.cancelled() or cancel_run(agent_task))
+
+            first_token_at = None
+            # Time the client connection takes to accept the frames
+            flush_span = tracer.start_span("sse_flush")
+            try:
+                # Forward events as they arrive, merging bursts of tiny deltas
+                async for event in coalesce_deltas(channel):
+                    if first_token_at is None and event["event_kind"] in ("part_start", "part_delta"):
+                        first_token_at = time.perf_counter()
+                        stream_ttft_seconds.observe(first_token_at - started, agent=label)
+                        trace.set(ttft_ms=round((first_token_at - started) * 1000, 3))
+                    frame = encoder.event(event)
+                    sent = time.perf_counter()
+                    yield frame
+                    flush_span.add("frames", 1)
+                    flush_span.add("bytes", len(frame))
+                    flush_span.add("blocked_ms", (time.perf_counter() - sent) * 1000)
+            finally:
+                flush_span.end()
+                # Release a handler blocked on a full channel if we stop early
+                channel.close(discard=True)
+
+            if agent_task.cancelled():
+                # The client disconnected; the turn is recorded below
+                error = ClientDisconnect()
+                return
 
             # Get final result
             result = await agent_task
+            if first_token_at is not None:
+                record_stream_rate(label, result.usage().output_tokens, time.perf_counter() - first_token_at)
 
             # Send final_result event to finish thinking
-            final_result_event = {
-                "event_kind": "final_result",
-                "conversation_id": conversation_id,
-                "agent": agent_name
-            }
-            yield f"data: {json.dumps(final_result_event)}\n\n"
+            yield encoder.event({"event_kind": "final_result"})
 
             # Send final done message
-            final_data = {
-                "type": "done",
-                "done": True,
-                "response": full_response or str(result.output),
-                "conversation_id": conversation_id,
-                "agent": agent_name
-            }
-            yield f"data: {json.dumps(final_data)}\n\n"
+            response_text = full_response.getvalue() or str(result.output)
+            yield encoder.done(response_text)
+            await record_turn(request, response_text)
 
         except Exception as e:
+            error = e
             error_data = {"type": "error", "error": str(e)}
             yield f"data: {json.dumps(error_data)}\n\n"
-
-    return StreamingResponse(
+        except BaseException as e:
+            # The client went away
+            error = e
+            raise
+        finally:
+            if disconnect_watch is not None:
+                disconnect_watch.cancel()
+            if agent_task is not None and (not agent_task.done() or agent_task.cancelled()):
+                # The client went away mid-turn: stop paying for the run, keep what it streamed
+                cancel_run(agent_task)
+                stream_cancellations.inc(agent=label, stage="tool" if tool_spans else "model")
+                record_interrupted_turn(request, full_response.getvalue())
+            if slot:
+                slot.release()
+            active_streams.dec(agent=label)
+            record_request(label, "chat-stream", time.perf_counter() - started, error)
+            if error is not None:
+                trace.set(error=type(error).__name__)
+            tracer.end_trace(trace)
+
+    return CleanupStreamingResponse(
         generate(),
+        # Also when the client left before generate() started (release() is idempotent)
+        on_close=slot.release if slot else lambda: None,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
+            "X-Accel-Buffering": "no",
+            "X-Request-ID": request_id
         }
     )
 
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", "8000"))
-    host = os.getenv("HOST", "0.0.0.0")
-
-    uvicorn.run(
-        "pydantic_agents.server:app",
-        host=host,
-        port=port,
-        reload=True
-    )
+    # SERVER_MODE=dev (auto-reload) or production (workers); see serving.py
+    from pydantic_agents.serving import main
+    main()
@@ -0,0 +1,141 @@
+"""
+How `python -m pydantic_agents.server` runs the server.
+
+SERVER_MODE=dev (the default) runs one uvicorn process with auto-reload.
+
+SERVER_MODE=production (or `--mode production`) runs WEB_CONCURRENCY worker
+processes (default: one per available CPU, within a container's CPU quota).
+With gunicorn installed, the app is imported and every agent built once in
+the master process, before the workers are forked, so they share that
+memory copy-on-write and serve from their first request. Without gunicorn,
+uvicorn starts the workers and each imports the app and builds its agents
+itself.
+
+A worker is replaced after SERVER_MAX_REQUESTS requests, plus a random
+number up to SERVER_MAX_REQUESTS_JITTER so they don't all restart at once
+(without gunicorn, the jitter needs a uvicorn version that supports it).
+It finishes its open requests and streams first. On shutdown, workers get
+SERVER_GRACEFUL_TIMEOUT seconds to do the same. uvicorn uses uvloop and
+httptools when they are installed.
+
+Admission limits, caches and pools (and their /metrics) are per worker.
+"""
+import argparse
+import importlib.util
+import inspect
+import math
+import os
+import sys
+
+import uvicorn
+
+SERVER_MODE = os.getenv("SERVER_MODE", "dev").lower()
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# Worker processes in production mode (0: one per available CPU)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))
+# Requests after which a worker is replaced (0: never)
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "10000"))
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", "1000"))
+# Seconds a stopping worker gets to finish its requests and streams
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+SERVER_KEEPALIVE_SECONDS = int(os.getenv("SERVER_KEEPALIVE_SECONDS", "5"))
+
+APP = "pydantic_agents.server:app"
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def available_cpus() -> int:
+    """CPUs this process may use, counting a cgroup (container) CPU quota."""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            count = min(count, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+def preload_app():
+    """Import the app and build every agent, in the master before the workers fork."""
+    from pydantic_agents.server import app, registry
+    registry.preload()
+    # Output still buffered here would be inherited, and printed again, by every worker
+    sys.stdout.flush()
+    return app
+
+
+def run_gunicorn(workers: int) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    # uvicorn.workers still works but is deprecated in favour of the uvicorn-worker package
+    worker_class = "uvicorn_worker.UvicornWorker" if _installed("uvicorn_worker") else "uvicorn.workers.UvicornWorker"
+    options = {
+        "bind": f"{HOST}:{PORT}",
+        "workers": workers,
+        "worker_class": worker_class,
+        "preload_app": True,
+        "max_requests": SERVER_MAX_REQUESTS,
+        "max_requests_jitter": SERVER_MAX_REQUESTS_JITTER if SERVER_MAX_REQUESTS else 0,
+        "graceful_timeout": SERVER_GRACEFUL_TIMEOUT,
+        "keepalive": SERVER_KEEPALIVE_SECONDS,
+    }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return preload_app()
+
+    Application().run()
+
+
+def run_uvicorn_workers(workers: int) -> None:
+    options = {}
+    # Only recent uvicorn versions can spread the worker restarts
+    if "limit_max_requests_jitter" in inspect.signature(uvicorn.run).parameters:
+        options["limit_max_requests_jitter"] = SERVER_MAX_REQUESTS_JITTER if SERVER_MAX_REQUESTS else 0
+    uvicorn.run(
+        APP,
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        limit_max_requests=SERVER_MAX_REQUESTS or None,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT,
+        timeout_keep_alive=SERVER_KEEPALIVE_SECONDS,
+        **options,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the agent server.")
+    parser.add_argument("--mode", choices=["dev", "production"], default=SERVER_MODE,
+                        help="dev: one auto-reloading process; production: pre-forked workers (default: SERVER_MODE)")
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY,
+                        help="worker processes in production mode (default: WEB_CONCURRENCY, or one per CPU)")
+    args = parser.parse_args()
+
+    if args.mode != "production":
+        uvicorn.run(APP, host=HOST, port=PORT, reload=True)
+        return
+
+    workers = args.workers or available_cpus()
+    loop = "uvloop" if _installed("uvloop") else "asyncio"
+    http = "httptools" if _installed("httptools") else "h11"
+    if _installed("gunicorn"):
+        print(f"[SERVER] Production mode: {workers} gunicorn workers (agents preloaded), {loop}, {http}", flush=True)
+        run_gunicorn(workers)
+    else:
+        print(f"[SERVER] Production mode: {workers} uvicorn workers, {loop}, {http} "
+              "(install gunicorn to build the agents once and share them between workers)")
+        run_uvicorn_workers(workers)
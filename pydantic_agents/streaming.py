@@ -0,0 +1,272 @@
+"""
+Streaming helpers for the SSE chat endpoint.
+"""
+import asyncio
+import json
+import os
+from json.encoder import encode_basestring
+from typing import Callable
+
+from starlette.responses import StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+# Maximum number of undelivered events per stream. When the SSE writer falls
+# behind, the pydantic-ai event handler waits instead of buffering without bound.
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+
+# Delta coalescing: deltas of the same part that arrive within this window of
+# the previous frame are merged into one frame. 0 disables coalescing.
+SSE_COALESCE_WINDOW_MS = float(os.getenv("SSE_COALESCE_WINDOW_MS", "20"))
+# A merged delta is flushed early once it holds this many characters.
+SSE_COALESCE_MAX_CHARS = int(os.getenv("SSE_COALESCE_MAX_CHARS", "256"))
+
+CLOSED = object()
+
+
+class CleanupStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that calls `on_close` once the response is over, however
+    it ends. A client that disconnects while the request waits (e.g. for an
+    admission slot) can get the response cancelled before its generator ever
+    runs, and a generator that never started never runs its `finally`.
+    """
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+class EventChannel:
+    """Bounded push channel between the agent event handler and the SSE generator."""
+
+    def __init__(self, maxsize: int = STREAM_QUEUE_SIZE):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._closed = False
+
+    async def put(self, event) -> None:
+        """Push an event; waits while the channel is full. Dropped once closed."""
+        if self._closed:
+            return
+        await self._queue.put(event)
+
+    def close(self, discard: bool = False) -> None:
+        """
+        Mark the channel as finished.
+
+        Pending events are still delivered unless `discard` is set, which is
+        used when the reader has gone away and blocked writers must be released.
+        """
+        self._closed = True
+        if discard:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+        try:
+            self._queue.put_nowait(CLOSED)
+        except asyncio.QueueFull:
+            # The reader drains the queue and then sees the closed flag.
+            pass
+
+    async def get(self, timeout: float | None = None):
+        """
+        Return the next event, or CLOSED once the channel is finished.
+
+        Raises asyncio.TimeoutError if nothing arrives within `timeout` seconds.
+        """
+        if not self._queue.empty():
+            return self._queue.get_nowait()
+        if self._closed:
+            return CLOSED
+        if timeout is None:
+            return await self._queue.get()
+        if timeout <= 0:
+            raise asyncio.TimeoutError
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.get()
+        if event is CLOSED:
+            raise StopAsyncIteration
+        return event
+
+
+def _merged_delta(event: dict, pieces: list) -> dict:
+    return {
+        "event_kind": "part_delta",
+        "delta": {
+            "part_delta_kind": event["delta"]["part_delta_kind"],
+            "content_delta": "".join(pieces)
+        },
+        "index": event["index"]
+    }
+
+
+async def coalesce_deltas(channel: EventChannel, window_ms: float | None = None,
+                          max_chars: int | None = None):
+    """
+    Yield events from `channel`, merging bursts of deltas of the same part.
+
+    A delta that arrives at least one window after the previous frame is sent
+    straight away, so sparse streams see no added latency. Deltas arriving
+    faster than that are held until the window since the last frame ends or
+    `max_chars` is reached. Part starts, tool events and the end of the
+    stream always flush the held delta first.
+    """
+    window = (SSE_COALESCE_WINDOW_MS if window_ms is None else window_ms) / 1000
+    max_chars = SSE_COALESCE_MAX_CHARS if max_chars is None else max_chars
+    if window <= 0:
+        async for event in channel:
+            yield event
+        return
+
+    loop = asyncio.get_running_loop()
+    last_flush = 0.0
+    pending = None  # first delta of the held burst
+    pieces: list = []
+    pending_chars = 0
+
+    while True:
+        try:
+            if pending is None:
+                event = await channel.get()
+            else:
+                event = await channel.get(last_flush + window - loop.time())
+        except asyncio.TimeoutError:
+            yield _merged_delta(pending, pieces)
+            pending, pieces, pending_chars = None, [], 0
+            last_flush = loop.time()
+            continue
+
+        if event is CLOSED:
+            if pending is not None:
+                yield _merged_delta(pending, pieces)
+            return
+
+        if event["event_kind"] == "part_delta":
+            text = event["delta"]["content_delta"]
+            if pending is not None and (
+                event["index"] == pending["index"]
+                and event["delta"]["part_delta_kind"] == pending["delta"]["part_delta_kind"]
+            ):
+                pieces.append(text)
+                pending_chars += len(text)
+                if pending_chars >= max_chars:
+                    yield _merged_delta(pending, pieces)
+                    pending, pieces, pending_chars = None, [], 0
+                    last_flush = loop.time()
+                continue
+
+            if pending is not None:
+                yield _merged_delta(pending, pieces)
+                pending, pieces, pending_chars = None, [], 0
+
+            if loop.time() - last_flush >= window:
+                yield event
+                last_flush = loop.time()
+            else:
+                pending, pieces, pending_chars = event, [text], len(text)
+            continue
+
+        # Part boundaries and tool events are never delayed
+        if pending is not None:
+            yield _merged_delta(pending, pieces)
+            pending, pieces, pending_chars = None, [], 0
+        yield event
+        last_flush = loop.time()
+
+
+async def wait_for_disconnect(receive) -> None:
+    """
+    Return once the client of a streaming response disconnects, given the
+    ASGI `receive` of its request (whose body has already been read).
+
+    Without this, a disconnect only shows when a frame fails to send, which
+    the server may not report at all.
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+def _dumps_compact(payload) -> str:
+    if orjson is not None:
+        return orjson.dumps(payload, default=str).decode()
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class SSEEncoder:
+    """Protocol v1: every frame repeats conversation_id and agent."""
+    version = 1
+
+    def __init__(self, conversation_id: str, agent: str):
+        self.conversation_id = conversation_id
+        self.agent = agent
+        self._meta = {"conversation_id": conversation_id, "agent": agent}
+
+    @staticmethod
+    def frame(payload) -> str:
+        return f"data: {json.dumps(payload)}\n\n"
+
+    def ping(self) -> str:
+        return self.frame({"type": "ping", **self._meta})
+
+    def event(self, event: dict) -> str:
+        return self.frame({**event, **self._meta})
+
+    def done(self, response: str) -> str:
+        return self.frame({"type": "done", "done": True, "response": response, **self._meta})
+
+
+class CompactSSEEncoder(SSEEncoder):
+    """
+    Protocol v2: metadata is sent once in the ping frame.
+
+    Delta frames, the bulk of every stream, are filled into precompiled
+    templates so only the delta text itself goes through the JSON encoder.
+    """
+    version = 2
+
+    _DELTA_PREFIX = {
+        kind: f'data: {{"event_kind":"part_delta","delta":{{"part_delta_kind":"{kind}","content_delta":'
+        for kind in ("text", "thinking")
+    }
+
+    @staticmethod
+    def frame(payload) -> str:
+        return f"data: {_dumps_compact(payload)}\n\n"
+
+    def ping(self) -> str:
+        return self.frame({"type": "ping", "protocol": self.version, **self._meta})
+
+    def event(self, event: dict) -> str:
+        if event["event_kind"] == "part_delta":
+            delta = event["delta"]
+            prefix = self._DELTA_PREFIX.get(delta["part_delta_kind"])
+            if prefix is not None:
+                return f'{prefix}{encode_basestring(delta["content_delta"])}}},"index":{event["index"]}}}\n\n'
+        return self.frame(event)
+
+    def done(self, response: str) -> str:
+        return self.frame({"type": "done", "done": True, "response": response})
+
+
+SSE_ENCODERS = {"1": SSEEncoder, "2": CompactSSEEncoder}
+
+
+def get_encoder(protocol: str | None, conversation_id: str, agent: str) -> SSEEncoder:
+    """Pick the encoder for the requested protocol version (default v1)."""
+    encoder_class = SSE_ENCODERS.get((protocol or "1").strip(), SSEEncoder)
+    return encoder_class(conversation_id, agent)
@@ -0,0 +1,195 @@
+"""
+Structured agent outputs, validated while they stream.
+
+`run_structured` runs an agent with a pydantic `output_type` and feeds the
+streamed output tool arguments through `PartialJSON`, an incremental parser
+that reports each top-level field as soon as its value is complete. Every
+field is validated against the output model's own constraints as it arrives
+(string length limits already while the string is streaming), so a bad
+output is abandoned at the first bad field and retried, instead of waiting
+for the whole body and then parsing it.
+"""
+import json
+import os
+from typing import Annotated, Any, Dict, List, Optional, Tuple, Type, TypeVar
+
+import annotated_types
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic_ai.exceptions import UnexpectedModelBehavior
+from pydantic_ai.messages import PartDeltaEvent, PartStartEvent, ToolCallPart, ToolCallPartDelta
+
+# Attempts per structured generation (a rejected output is retried from scratch)
+STRUCTURED_OUTPUT_ATTEMPTS = int(os.getenv("STRUCTURED_OUTPUT_ATTEMPTS", "3"))
+
+# pydantic-ai's default name for output tools
+OUTPUT_TOOL_PREFIX = "final_result"
+
+OutputT = TypeVar("OutputT", bound=BaseModel)
+
+
+class OutputRejected(ValueError):
+    """A streamed output field failed validation."""
+
+
+class PartialJSON:
+    """
+    Incremental parser for a streamed JSON object.
+
+    `feed()` takes the next chunk of text and returns the top-level fields
+    that were completed by it, as `(name, value)` pairs. While a top-level
+    string value is streaming, `partial_field` names it and `partial_chars`
+    is its length so far. Text before the opening brace is skipped.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member: List[str] = []
+        self._key: Optional[str] = None
+        self.fields: Dict[str, Any] = {}
+        self.partial_field: Optional[str] = None
+        self.partial_chars = 0
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        completed = []
+        for char in chunk:
+            if self.done:
+                break
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._in_string:
+                self._member.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                    continue
+                elif char == '"':
+                    self._in_string = False
+                    self.partial_field = None
+                    continue
+                if self.partial_field is not None:
+                    self.partial_chars += 1
+                continue
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is not None:
+                    self.partial_field = self._key
+                    self.partial_chars = 0
+            elif char == ":" and self._depth == 1 and self._key is None:
+                try:
+                    self._key = json.loads("".join(self._member))
+                except ValueError as e:
+                    raise OutputRejected(f"malformed JSON key: {e}") from None
+                self._member.append(char)
+                continue
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_member(completed)
+                    self.done = True
+                    continue
+            elif char == "," and self._depth == 1:
+                self._complete_member(completed)
+                continue
+            self._member.append(char)
+        return completed
+
+    def _complete_member(self, completed: list) -> None:
+        text = "".join(self._member).strip()
+        self._member = []
+        self._key = None
+        self.partial_field = None
+        if not text:
+            return
+        try:
+            (name, value), = json.loads("{" + text + "}").items()
+        except ValueError as e:
+            raise OutputRejected(f"malformed JSON: {e}") from None
+        self.fields[name] = value
+        completed.append((name, value))
+
+
+class FieldValidator:
+    """Validates the fields of `model` one at a time, with the model's own constraints."""
+
+    def __init__(self, model: Type[BaseModel]):
+        self._adapters: Dict[str, TypeAdapter] = {}
+        self._max_lengths: Dict[str, int] = {}
+        for name, field in model.model_fields.items():
+            annotation = Annotated[(field.annotation, *field.metadata)] if field.metadata else field.annotation
+            self._adapters[name] = TypeAdapter(annotation)
+            for constraint in field.metadata:
+                if isinstance(constraint, annotated_types.MaxLen):
+                    self._max_lengths[name] = constraint.max_length
+
+    def check_partial(self, parser: PartialJSON) -> None:
+        limit = self._max_lengths.get(parser.partial_field)
+        if limit is not None and parser.partial_chars > limit:
+            raise OutputRejected(f"{parser.partial_field}: longer than {limit} characters")
+
+    def check_field(self, name: str, value: Any) -> None:
+        adapter = self._adapters.get(name)
+        if adapter is None:
+            return
+        try:
+            adapter.validate_python(value)
+        except ValidationError as e:
+            raise OutputRejected(f"{name}: {e.errors()[0]['msg']}") from None
+
+
+_validators: Dict[type, FieldValidator] = {}
+
+
+def field_validator_for(model: Type[BaseModel]) -> FieldValidator:
+    if model not in _validators:
+        _validators[model] = FieldValidator(model)
+    return _validators[model]
+
+
+def _output_args(event, output_parts: Dict[int, PartialJSON]) -> Tuple[Optional[PartialJSON], Optional[str]]:
+    """The output tool's parser and newly streamed argument text for `event`, if any."""
+    if isinstance(event, PartStartEvent) and isinstance(event.part, ToolCallPart):
+        if not event.part.tool_name.startswith(OUTPUT_TOOL_PREFIX):
+            return None, None
+        parser = output_parts[event.index] = PartialJSON()
+        return parser, event.part.args if isinstance(event.part.args, str) else None
+    if isinstance(event, PartDeltaEvent) and isinstance(event.delta, ToolCallPartDelta):
+        parser = output_parts.get(event.index)
+        if parser is not None and isinstance(event.delta.args_delta, str):
+            return parser, event.delta.args_delta
+    return None, None
+
+
+async def run_structured(agent, prompt: str, output_type: Type[OutputT],
+                         attempts: int = STRUCTURED_OUTPUT_ATTEMPTS) -> OutputT:
+    """Run `agent` for a validated `output_type`, retrying when the output is rejected."""
+    validator = field_validator_for(output_type)
+
+    async def check_stream(ctx, events):
+        output_parts: Dict[int, PartialJSON] = {}
+        async for event in events:
+            parser, text = _output_args(event, output_parts)
+            if not text:
+                continue
+            for name, value in parser.feed(text):
+                validator.check_field(name, value)
+            validator.check_partial(parser)
+
+    error: Optional[Exception] = None
+    for attempt in range(1, attempts + 1):
+        try:
+            result = await agent.run(prompt, output_type=output_type, event_stream_handler=check_stream)
+            return result.output
+        except (OutputRejected, UnexpectedModelBehavior) as e:
+            error = e
+            print(f"[STRUCTURED] {output_type.__name__} rejected (attempt {attempt}/{attempts}): {e}")
+    raise error
@@ -0,0 +1,244 @@
+"""
+TTL cache for MCP tool results.
+
+Agents wrap their MCP toolset in a `CachingToolset`, so repeated lookups of
+the same library docs (within one multi-step run or across requests) are
+answered from memory instead of another round trip to the MCP server.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic_ai.toolsets import AbstractToolset, WrapperToolset
+
+MCP_TOOL_CACHE_ENABLED = os.getenv("MCP_TOOL_CACHE_ENABLED", "1") == "1"
+# Default TTL for tools without their own entry in MCP_TOOL_CACHE_TTLS
+MCP_TOOL_CACHE_TTL_SECONDS = float(os.getenv("MCP_TOOL_CACHE_TTL_SECONDS", "3600"))
+# Per-tool TTLs as "tool=seconds,..."; 0 disables caching for a tool
+MCP_TOOL_CACHE_TTLS = os.getenv("MCP_TOOL_CACHE_TTLS", "resolve-library-id=86400,get-library-docs=21600")
+MCP_TOOL_CACHE_MAX_ENTRIES = int(os.getenv("MCP_TOOL_CACHE_MAX_ENTRIES", "2000"))
+# Upper bound on the cached result text, in characters
+MCP_TOOL_CACHE_MAX_CHARS = int(os.getenv("MCP_TOOL_CACHE_MAX_CHARS", "50000000"))
+# JSON file the cache is loaded from at startup and saved to at shutdown (unset: memory only)
+MCP_TOOL_CACHE_PATH = os.getenv("MCP_TOOL_CACHE_PATH")
+
+CacheKey = Tuple[str, str, str]
+
+
+def parse_ttls(spec: str) -> Dict[str, float]:
+    ttls = {}
+    for item in spec.split(","):
+        if "=" in item:
+            tool, seconds = item.split("=", 1)
+            ttls[tool.strip()] = float(seconds)
+    return ttls
+
+
+def canonical_args(args: Dict[str, Any]) -> str:
+    """Argument dict as a stable string, independent of key order."""
+    return json.dumps(args, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class _Entry:
+    __slots__ = ("result", "chars", "expires_at")
+
+    def __init__(self, result: Any, chars: int, expires_at: float):
+        self.result = result
+        self.chars = chars
+        self.expires_at = expires_at  # wall clock, so entries survive a restart
+
+
+class ToolResultCache:
+    """
+    Size-bounded LRU of tool results with per-tool TTLs.
+
+    Only JSON-serializable results are cached (text, dicts, lists); binary
+    content and failed calls always go to the server. Identical calls that
+    are in flight at the same time share one request.
+    """
+
+    def __init__(
+        self,
+        default_ttl: float = MCP_TOOL_CACHE_TTL_SECONDS,
+        ttls: Optional[Dict[str, float]] = None,
+        max_entries: int = MCP_TOOL_CACHE_MAX_ENTRIES,
+        max_chars: int = MCP_TOOL_CACHE_MAX_CHARS,
+        path: Optional[str] = MCP_TOOL_CACHE_PATH,
+    ):
+        self.default_ttl = default_ttl
+        self.ttls = parse_ttls(MCP_TOOL_CACHE_TTLS) if ttls is None else ttls
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.path = path
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._chars = 0
+        self._in_flight: Dict[CacheKey, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.tool_stats: Dict[str, Dict[str, int]] = {}
+        if path:
+            self.load()
+
+    def ttl_for(self, tool_name: str) -> float:
+        return self.ttls.get(tool_name, self.default_ttl)
+
+    async def get_or_call(self, server: str, tool_name: str, args: Dict[str, Any], call):
+        """Return the cached result for the call, or run `call()` and cache what it returns."""
+        ttl = self.ttl_for(tool_name)
+        if ttl <= 0:
+            return await call()
+        key = (server, tool_name, canonical_args(args))
+        counts = self.tool_stats.setdefault(tool_name, {"hits": 0, "misses": 0})
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                counts["hits"] += 1
+                return entry.result
+            self._remove(key)
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            await asyncio.wait([in_flight])
+            if not in_flight.cancelled():
+                self.hits += 1
+                counts["hits"] += 1
+                return in_flight.result()
+            # The request we were waiting on was cancelled; make our own
+            return await self.get_or_call(server, tool_name, args, call)
+
+        self.misses += 1
+        counts["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+        future.set_result(result)
+        self._store(key, result, ttl)
+        return result
+
+    def _store(self, key: CacheKey, result: Any, ttl: float) -> None:
+        try:
+            chars = len(json.dumps(result, ensure_ascii=False))
+        except (TypeError, ValueError):
+            return  # binary or otherwise unserializable
+        if chars > self.max_chars:
+            return
+        self._remove(key)
+        self._entries[key] = _Entry(result, chars, time.time() + ttl)
+        self._chars += chars
+        while self._entries and (len(self._entries) > self.max_entries or self._chars > self.max_chars):
+            _, evicted = self._entries.popitem(last=False)
+            self._chars -= evicted.chars
+            self.evictions += 1
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._chars -= entry.chars
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._chars = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "chars": self._chars,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "tools": dict(self.tool_stats),
+        }
+
+    # Persistence
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                items = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[TOOL CACHE] Could not read {self.path}: {e}")
+            return
+        now = time.time()
+        for item in items:
+            if item["expires_at"] > now:
+                key = (item["server"], item["tool"], item["args"])
+                self._remove(key)
+                self._entries[key] = _Entry(item["result"], item["chars"], item["expires_at"])
+                self._chars += item["chars"]
+        print(f"[TOOL CACHE] Loaded {len(self._entries)} cached tool results from {self.path}")
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        now = time.time()
+        items = [
+            {"server": server, "tool": tool, "args": args, "result": entry.result,
+             "chars": entry.chars, "expires_at": entry.expires_at}
+            for (server, tool, args), entry in self._entries.items()
+            if entry.expires_at > now
+        ]
+        tmp_path = None
+        try:
+            # A temp file of its own, as several workers may save at the same time
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", delete=False,
+                                             dir=os.path.dirname(os.path.abspath(self.path)),
+                                             prefix=os.path.basename(self.path) + ".", suffix=".tmp") as f:
+                tmp_path = f.name
+                json.dump(items, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[TOOL CACHE] Could not write {self.path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+@dataclass
+class CachingToolset(WrapperToolset):
+    """Toolset wrapper that answers repeated tool calls from a ToolResultCache."""
+
+    cache: ToolResultCache = field(default=None)
+
+    @property
+    def server_key(self) -> str:
+        return getattr(self.wrapped, "url", None) or self.wrapped.label
+
+    async def call_tool(self, name, tool_args, ctx, tool):
+        return await self.cache.get_or_call(
+            self.server_key, name, tool_args,
+            lambda: self.wrapped.call_tool(name, tool_args, ctx, tool),
+        )
+
+
+# Shared by all agents
+tool_result_cache = ToolResultCache()
+
+
+def cached(toolset: AbstractToolset) -> AbstractToolset:
+    """Wrap `toolset` so its results are cached (unchanged when MCP_TOOL_CACHE_ENABLED=0)."""
+    if not MCP_TOOL_CACHE_ENABLED:
+        return toolset
+    return CachingToolset(toolset, cache=tool_result_cache)
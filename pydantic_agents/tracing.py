@@ -0,0 +1,225 @@
+"""
+Per-request latency traces for /chat/stream, kept locally.
+
+A trace is a tree of spans for one request, identified by its request id
+and tagged with the conversation. /chat/stream traces history loading, the
+agent run (with the time to its first token), each tool call from call to
+result, and the time spent flushing SSE frames to the client, so a slow
+turn can be broken down without an external tracing service.
+
+Finished traces are kept in memory (the last TRACE_BUFFER, served on
+/traces) and, when TRACE_FILE is set, appended to it as one JSON line per
+trace, from a worker thread so the event loop never waits on the disk.
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, List, Optional, Set
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+# Finished traces kept in memory for /traces
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "200"))
+# Also append finished traces to this JSONL file (off when empty)
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+
+# Span that new spans in this context are children of
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = ("name", "trace", "span_id", "parent_id", "start", "duration_ms", "attributes")
+
+    def __init__(self, name: str, trace: "Trace", parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.attributes = attributes
+        trace.spans.append(self)
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, amount: float) -> None:
+        """Add to a numeric attribute (e.g. bytes written by several writes)."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def end(self) -> None:
+        if self.duration_ms is None:
+            self.duration_ms = (time.perf_counter() - self.start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round((self.start - self.trace.start) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "attributes": {k: round(v, 3) if isinstance(v, float) else v for k, v in self.attributes.items()},
+        }
+
+
+class _NoopSpan:
+    """Stands in for a span when there is no trace; every call does nothing."""
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def add(self, key: str, amount: float) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current_span():
+    """The span of the current context (a no-op span outside traces)."""
+    return _current_span.get() or NOOP_SPAN
+
+
+class Trace:
+    """All spans of one request."""
+
+    def __init__(self, request_id: str, attributes: Dict[str, Any]):
+        self.request_id = request_id
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        spans = [span.to_dict() for span in self.spans]
+        # Time per span name, e.g. how long all tool calls took together
+        breakdown: Dict[str, float] = {}
+        for span in spans:
+            if span["parent_id"] is not None and span["duration_ms"] is not None:
+                breakdown[span["name"]] = round(breakdown.get(span["name"], 0) + span["duration_ms"], 3)
+        return {
+            "request_id": self.request_id,
+            **self.attributes,
+            # The root span's attributes, e.g. ttft_ms
+            **(self.spans[0].attributes if self.spans else {}),
+            "started_at": self.started_at,
+            "duration_ms": spans[0]["duration_ms"] if spans else None,
+            "breakdown_ms": breakdown,
+            "spans": spans,
+        }
+
+
+class Tracer:
+    """Starts traces and spans, and keeps the finished traces."""
+
+    def __init__(self, enabled: bool = TRACING_ENABLED, buffer: int = TRACE_BUFFER, path: str = TRACE_FILE):
+        self.enabled = enabled
+        self.path = path
+        self._finished: Deque[Trace] = deque(maxlen=buffer)
+        # Appends run in threads; the lock keeps their lines whole
+        self._write_lock = threading.Lock()
+        self._writes: Set[asyncio.Task] = set()
+
+    def start_trace(self, name: str, request_id: Optional[str] = None, **attributes) -> Span:
+        """Start a trace with its root span, current in this context until `end_trace`."""
+        if not self.enabled:
+            return NOOP_SPAN
+        trace = Trace(request_id or uuid.uuid4().hex, attributes)
+        root = Span(name, trace, None, {})
+        _current_span.set(root)
+        return root
+
+    def end_trace(self, root) -> None:
+        if not isinstance(root, Span):
+            return
+        root.end()
+        _current_span.set(None)
+        for span in root.trace.spans:
+            # Spans cut short (e.g. a tool call when the client went away)
+            if span.duration_ms is None:
+                span.set(unfinished=True)
+                span.end()
+        self._finished.append(root.trace)
+        if self.path:
+            self._write(root.trace)
+
+    def _write(self, trace: Trace) -> None:
+        line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str) + "\n"
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._append(line)
+            return
+        task = asyncio.create_task(asyncio.to_thread(self._append, line))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    def _append(self, line: str) -> None:
+        try:
+            with self._write_lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            print(f"[TRACE] Could not write {self.path}: {e}")
+
+    def start_span(self, name: str, parent=None, **attributes):
+        """Start a span that is ended explicitly, e.g. from a later event."""
+        parent = parent if isinstance(parent, Span) else _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(name, parent.trace, parent, attributes)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Span around the block; spans started inside it are its children."""
+        span = self.start_span(name, **attributes)
+        if span is NOOP_SPAN:
+            yield span
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.end()
+            _current_span.reset(token)
+
+    def traced(self, name: str):
+        """Decorate a coroutine function to run in a span."""
+        def decorate(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def recent(self, conversation_id: Optional[str] = None, request_id: Optional[str] = None,
+               limit: int = 20) -> List[Dict[str, Any]]:
+        """The newest finished traces, optionally of one conversation or request."""
+        traces = []
+        for trace in reversed(self._finished):
+            if conversation_id and trace.attributes.get("conversation_id") != conversation_id:
+                continue
+            if request_id and trace.request_id != request_id:
+                continue
+            traces.append(trace.to_dict())
+            if len(traces) >= limit:
+                break
+        return traces
+
+
+# Shared by the server and the modules it calls
+tracer = Tracer()